@@ -0,0 +1,184 @@
+"""Batch mode (`wtff --batch prompts.txt`).
+
+Translates many prompts in one process with one client and a bounded pool of
+concurrent requests, writing one JSON object per prompt.
+"""
+from __future__ import annotations
+
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import IO, Iterable, Iterator
+
+from .cache import open_cache
+from .config import AppConfig, resolve_profile
+from .llm import generate_ffmpeg_command, generation_params
+from .media import augment_prompt, open_probe_index
+from .metrics import open_metrics
+from .validate import open_validator
+
+DEFAULT_CONCURRENCY = 4
+
+
+def parse_prompts(text: str) -> list[str]:
+    """One prompt per line; skips blanks and #comments."""
+    return [ln.strip() for ln in text.splitlines() if ln.strip() and not ln.lstrip().startswith("#")]
+
+
+def read_prompts(source: str) -> list[str]:
+    """Read prompts from a path or '-' for stdin."""
+    if source == "-":
+        return parse_prompts(sys.stdin.read())
+    with open(source, encoding="utf-8") as f:
+        return parse_prompts(f.read())
+
+
+def translate_prompt(
+    prompt: str, *, client, cfg: AppConfig, cache=None, probe_index=None, validator=None, metrics=None,
+    index: int = 0, cwd: Path | None = None,
+) -> dict:
+    """Run one prompt through the single-shot pipeline; never raises."""
+    profile = resolve_profile(cfg)
+    messages = [
+        {"role": "system", "content": profile.text},
+        {"role": "user", "content": augment_prompt(prompt, probe_index, cwd)},
+    ]
+    rec = {"index": index, "prompt": prompt, "raw": "", "command": "", "latency": 0.0, "error": None}
+    t0 = time.perf_counter()
+    try:
+        raw, cmd = generate_ffmpeg_command(
+            messages,
+            client,
+            cfg.model,
+            cache=cache,
+            stream=cfg.stream,
+            raise_errors=True,
+            validator=validator,
+            metrics=metrics,
+            params=generation_params(cfg, profile),
+        )
+        rec["raw"], rec["command"] = raw, cmd
+        if not cmd:
+            rec["error"] = "no ffmpeg command found in reply"
+    except Exception as e:
+        rec["error"] = f"{type(e).__name__}: {e}"
+    rec["latency"] = round(time.perf_counter() - t0, 4)
+    return rec
+
+
+def run_batch(
+    prompts: Iterable[str],
+    *,
+    client,
+    cfg: AppConfig,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    ordered: bool = True,
+    cache=None,
+    probe_index=None,
+    validator=None,
+    metrics=None,
+    cwd: Path | None = None,
+) -> Iterator[dict]:
+    """
+    Yield one result record per prompt.
+
+    At most `concurrency` requests are in flight at once. With ordered=True
+    records are yielded in input order (buffering any that finish early),
+    otherwise as soon as each completes.
+    """
+    prompts = list(prompts)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="wtff-batch") as pool:
+        futures = {
+            pool.submit(
+                translate_prompt,
+                p,
+                client=client,
+                cfg=cfg,
+                cache=cache,
+                probe_index=probe_index,
+                validator=validator,
+                metrics=metrics,
+                index=i,
+                cwd=cwd,
+            ): i
+            for i, p in enumerate(prompts)
+        }
+        if not ordered:
+            for fut in as_completed(futures):
+                yield fut.result()
+            return
+
+        done: dict[int, dict] = {}
+        next_idx = 0
+        for fut in as_completed(futures):
+            done[futures[fut]] = fut.result()
+            while next_idx in done:
+                yield done.pop(next_idx)
+                next_idx += 1
+
+
+def batch_mode(
+    *,
+    client,
+    cfg: AppConfig,
+    source: str,
+    text: str | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    ordered: bool = True,
+    out: IO[str] | None = None,
+) -> int:
+    """Translate every prompt in `source` (or in `text`, if already read) and write JSONL to `out`.
+
+    Returns exit code.
+    """
+    out = out or sys.stdout
+    try:
+        prompts = parse_prompts(text) if text is not None else read_prompts(source)
+    except OSError as e:
+        print(f"Cannot read batch input: {e}", file=sys.stderr)
+        return 2
+
+    return write_batch(
+        prompts,
+        client=client,
+        cfg=cfg,
+        concurrency=concurrency,
+        ordered=ordered,
+        out=out,
+        cache=open_cache(cfg),
+        probe_index=open_probe_index(cfg),
+        validator=open_validator(cfg),
+        metrics=open_metrics(cfg),
+    )
+
+
+def write_batch(
+    prompts: list[str],
+    *,
+    client,
+    cfg: AppConfig,
+    concurrency: int,
+    ordered: bool,
+    out: IO[str],
+    err: IO[str] | None = None,
+    **stores,
+) -> int:
+    """run_batch over prompts, writing JSONL to out and a summary line to err. Returns exit code."""
+    failures = 0
+    t0 = time.perf_counter()
+    results = run_batch(prompts, client=client, cfg=cfg, concurrency=concurrency, ordered=ordered, **stores)
+    for rec in results:
+        if rec["error"]:
+            failures += 1
+        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        out.flush()
+
+    elapsed = time.perf_counter() - t0
+    rate = len(prompts) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"batch: {len(prompts)} prompts, {failures} failed, {elapsed:.1f}s ({rate:.2f}/s, concurrency {concurrency})",
+        file=err or sys.stderr,
+    )
+    return 1 if failures else 0
@@ -0,0 +1,483 @@
+"""Latency/throughput benchmarks (`wtff-bench`).
+
+Starts a stand-in OpenAI-compatible server (in a child process, so it doesn't
+share our GIL) that answers /v1/chat/completions with canned replies at a
+configurable first-token latency and token rate, then drives the real
+single-shot, batch and REPL message paths against it. Results are printed as
+JSON; with --baseline the run is compared against an earlier result and the
+exit status is 1 if anything regressed beyond --tolerance.
+
+    wtff-bench -o before.json
+    wtff-bench --baseline before.json
+
+`wtff-bench serve --port 8089` runs just the stand-in server, for pointing
+wtff itself at it.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Optional
+
+TRAILER = (
+    "\n\nHere -c:v libx264 selects the H.264 encoder and -crf controls quality (lower is better, "
+    "18-28 is typical). The audio is re-encoded to AAC so the MP4 plays everywhere. If the source "
+    "audio is already AAC you can use -c:a copy instead, which is faster and lossless. "
+)
+
+# reply styles the extraction code has to cope with
+REPLIES = {
+    "fenced": "```bash\nffmpeg -i input.mp4 -c:v libx264 -crf 23 -c:a aac output.mp4\n```" + TRAILER,
+    "chatty": "Sure! To convert the file you can use the following command:\n\n"
+              "ffmpeg -i input.mp4 -c:v libx264 -crf 23 -c:a aac output.mp4\n" + TRAILER,
+    "assistant": "assistant: ffmpeg -i input.mp4 -vf scale=1280:-2 -c:a copy output.mp4\n" + TRAILER,
+    "multiline": "```bash\nffmpeg -i input.mp4 \\\n  -vf \"scale=1280:-2,fps=30\" \\\n"
+                 "  -c:v libx264 -preset slow -crf 20 \\\n  -c:a aac -b:a 160k \\\n  output.mp4\n```" + TRAILER,
+}
+STYLES = tuple(REPLIES)
+CHARS_PER_TOKEN = 4
+
+PROMPTS = [
+    "convert input.mp4 to h264 with crf 23",
+    "scale input.mp4 to 720p and keep the audio",
+    "extract the audio from input.mkv as mp3",
+    "make a 10 second gif from input.mp4 starting at 0:30",
+    "burn subtitles.srt into input.mp4",
+    "speed up input.mp4 by 2x including audio",
+    "crop input.mp4 to a centered square",
+    "concatenate a.mp4 and b.mp4",
+]
+
+
+# --- stand-in server ---
+
+def _chunks(text: str) -> list[str]:
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, obj: dict) -> None:
+        body = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._json({"object": "list", "data": [
+            {"id": s, "object": "model", "created": 0, "owned_by": "bench"} for s in STYLES
+        ]})
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        srv = self.server
+        text = REPLIES.get(req.get("model"), REPLIES[srv.style])
+        chunks = _chunks(text)
+        per_token = 1.0 / srv.tokens_per_s if srv.tokens_per_s > 0 else 0.0
+        time.sleep(srv.latency_s)
+
+        if not req.get("stream"):
+            time.sleep(per_token * len(chunks))
+            self._json({
+                "id": "bench", "object": "chat.completion", "created": 0, "model": req.get("model", ""),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(chunks), "total_tokens": len(chunks)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for piece in chunks:
+                event = {"id": "bench", "object": "chat.completion.chunk", "created": 0,
+                         "model": req.get("model", ""),
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                self.wfile.write(b"data: " + json.dumps(event).encode() + b"\n\n")
+                self.wfile.flush()
+                if per_token:
+                    time.sleep(per_token)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client stopped reading early (command complete)
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, *, latency_s: float = 0.05, tokens_per_s: float = 200.0,
+                 style: str = "fenced"):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency_s = latency_s
+        self.tokens_per_s = tokens_per_s
+        self.style = style
+
+
+def serve(port: int, *, latency_s: float, tokens_per_s: float, style: str) -> None:
+    srv = FakeServer(port, latency_s=latency_s, tokens_per_s=tokens_per_s, style=style)
+    print(f"listening on http://127.0.0.1:{srv.server_address[1]}/v1", flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@contextlib.contextmanager
+def spawn_server(*, latency_s: float, tokens_per_s: float, style: str = "fenced"):
+    """Run the stand-in server in a child process; yields its base URL."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "wtffmpeg.bench", "serve", "--port", "0",
+         "--latency", str(latency_s), "--tokens-per-s", str(tokens_per_s), "--style", style],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert proc.stdout is not None
+        line = proc.stdout.readline()
+        if not line.startswith("listening on "):
+            raise RuntimeError(f"bench server failed to start: {line!r}")
+        yield line.split()[-1]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5)
+
+
+# --- statistics ---
+
+def percentiles(samples_s: list[float]) -> dict:
+    """p50/p95/p99/mean/min/max in milliseconds (linear interpolation)."""
+    if not samples_s:
+        return {"n": 0}
+    xs = sorted(s * 1000 for s in samples_s)
+
+    def pct(p: float) -> float:
+        k = (len(xs) - 1) * p
+        lo = int(k)
+        hi = min(lo + 1, len(xs) - 1)
+        return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+    return {
+        "n": len(xs),
+        "p50_ms": round(pct(0.50), 3),
+        "p95_ms": round(pct(0.95), 3),
+        "p99_ms": round(pct(0.99), 3),
+        "mean_ms": round(sum(xs) / len(xs), 3),
+        "min_ms": round(xs[0], 3),
+        "max_ms": round(xs[-1], 3),
+    }
+
+
+def _timed(fn: Callable[[], object], runs: int) -> list[float]:
+    out = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+# --- benchmarks ---
+
+def bench_cold_start(url: str, runs: int) -> dict:
+    """Wall time of fresh interpreters: bare import, and a full `wtff -p` round trip."""
+    env = {k: v for k, v in os.environ.items() if not k.startswith("WTFFMPEG_")}
+    cmds = {
+        "import": [sys.executable, "-c", "import wtffmpeg.cli"],
+        "single_shot": [sys.executable, "-m", "wtffmpeg.cli", "-p", PROMPTS[0], "--url", url,
+                        "--model", "fenced", "--no-cache", "--no-probe", "--no-validate"],
+    }
+    out = {}
+    with tempfile.TemporaryDirectory(prefix="wtff-bench-home-") as home:
+        env["HOME"] = home  # no user config, cache or history
+        for name, argv in cmds.items():
+            samples = []
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+                samples.append(time.perf_counter() - t0)
+            out[name] = percentiles(samples)
+    return out
+
+
+def bench_single_shot(client, cfg, runs: int) -> dict:
+    """End-to-end single_shot() per reply style, streaming and not."""
+    from .oneshot import single_shot
+
+    out = {}
+    for style in STYLES:
+        for stream in (True, False):
+            c = replace(cfg, model=style, stream=stream, prompt_once=PROMPTS[0])
+            with contextlib.redirect_stdout(io.StringIO()):
+                samples = _timed(lambda: single_shot(client=client, cfg=c), runs)
+            out[f"{style}/{'stream' if stream else 'full'}"] = percentiles(samples)
+    return out
+
+
+def bench_time_to_command(client, runs: int) -> dict:
+    """First token, command available (streaming, early stop), and full reply, per style."""
+    from .llm import generate_ffmpeg_command
+
+    messages = [{"role": "system", "content": "bench"}, {"role": "user", "content": PROMPTS[0]}]
+    out = {}
+    for style in STYLES:
+        ttft, ttc, full = [], [], []
+        for _ in range(runs):
+            first: list[float] = []
+            t0 = time.perf_counter()
+            _, cmd = generate_ffmpeg_command(
+                messages, client, style, stream=True,
+                on_token=lambda _d: first or first.append(time.perf_counter()),
+            )
+            ttc.append(time.perf_counter() - t0)
+            ttft.append((first[0] if first else time.perf_counter()) - t0)
+            if not cmd:
+                raise RuntimeError(f"no command extracted from {style!r} reply")
+        full = _timed(lambda: generate_ffmpeg_command(messages, client, style, stream=False), runs)
+        out[style] = {
+            "ttft": percentiles(ttft),
+            "time_to_command": percentiles(ttc),
+            "full_reply": percentiles(full),
+        }
+    return out
+
+
+def bench_extraction(client, runs: int) -> dict:
+    """Cost of pulling the command out of a reply: pure CPU, and inside generate_ffmpeg_command."""
+    from .llm import CommandExtractor, extract_ffmpeg_command, generate_ffmpeg_command
+
+    out: dict = {}
+    for style, text in REPLIES.items():
+        chunks = _chunks(text)
+        n = 2000
+
+        def feed_all():
+            ex = CommandExtractor()
+            for piece in chunks:
+                if ex.feed(piece):
+                    break
+
+        t0 = time.perf_counter()
+        for _ in range(n):
+            extract_ffmpeg_command(text)
+        t1 = time.perf_counter()
+        for _ in range(n):
+            feed_all()
+        t2 = time.perf_counter()
+        out[style] = {
+            "extract_us": round((t1 - t0) / n * 1e6, 3),
+            "incremental_us": round((t2 - t1) / n * 1e6, 3),
+        }
+
+    # overhead of the generate wrapper over the bare client call, same requests
+    messages = [{"role": "system", "content": "bench"}, {"role": "user", "content": PROMPTS[0]}]
+    raw = _timed(lambda: client.chat.completions.create(model="fenced", messages=messages, temperature=0.0), runs)
+    wrapped = _timed(lambda: generate_ffmpeg_command(messages, client, "fenced"), runs)
+    out["generate_overhead"] = {
+        "client": percentiles(raw),
+        "generate": percentiles(wrapped),
+        "delta_p50_ms": round(percentiles(wrapped)["p50_ms"] - percentiles(raw)["p50_ms"], 3),
+    }
+    return out
+
+
+def bench_repl(client, cfg, turns: int) -> dict:
+    """The REPL's per-turn message path: Conversation bookkeeping plus generation."""
+    from .config import resolve_profile
+    from .conversation import Conversation, get_token_counter
+    from .llm import generate_ffmpeg_command
+    from .media import augment_prompt
+
+    conv = Conversation(
+        resolve_profile(cfg).text,
+        context_turns=cfg.context_turns,
+        context_tokens=cfg.context_tokens,
+        count_tokens=get_token_counter(cfg.tokenizer),
+    )
+    build, total = [], []
+    for i in range(turns):
+        t0 = time.perf_counter()
+        conv.append("user", augment_prompt(PROMPTS[i % len(PROMPTS)], None))
+        messages = conv.messages()
+        build.append(time.perf_counter() - t0)
+        raw, cmd = generate_ffmpeg_command(messages, client, STYLES[i % len(STYLES)], stream=cfg.stream)
+        conv.append("assistant", raw)
+        total.append(time.perf_counter() - t0)
+    return {"turns": turns, "context_tokens": conv.tokens, "message_build": percentiles(build),
+            "turn": percentiles(total)}
+
+
+def bench_batch(client, cfg, requests: int, levels: list[int]) -> dict:
+    """Batch throughput (requests/sec) and per-request latency at each concurrency level."""
+    from .batch import run_batch
+
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(requests)]
+    out = {}
+    for level in levels:
+        t0 = time.perf_counter()
+        recs = list(run_batch(prompts, client=client, cfg=cfg, concurrency=level))
+        elapsed = time.perf_counter() - t0
+        out[str(level)] = {
+            "rps": round(len(recs) / elapsed, 3),
+            "errors": sum(1 for r in recs if r["error"]),
+            "latency": percentiles([r["latency"] for r in recs]),
+        }
+    return out
+
+
+# --- baseline comparison ---
+
+def _flatten(obj, prefix: str = "") -> dict[str, float]:
+    out: dict[str, float] = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix] = float(obj)
+    return out
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Metrics that got worse than baseline by more than tolerance (a fraction)."""
+    cur = _flatten(result.get("results", {}))
+    old = _flatten(baseline.get("results", {}))
+    problems = []
+    for key, before in old.items():
+        after = cur.get(key)
+        if after is None or before <= 0:
+            continue
+        leaf = key.rsplit(".", 1)[-1]
+        if leaf in ("p50_ms", "p95_ms", "mean_ms", "extract_us", "incremental_us"):
+            if after > before * (1 + tolerance):
+                problems.append(f"{key}: {before:g} -> {after:g} (+{100 * (after / before - 1):.0f}%)")
+        elif leaf == "rps":
+            if after < before * (1 - tolerance):
+                problems.append(f"{key}: {before:g} -> {after:g} ({100 * (after / before - 1):.0f}%)")
+    return problems
+
+
+# --- entry point ---
+
+SUITES = ("cold", "single_shot", "ttc", "extraction", "repl", "batch")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="wtff-bench", description="Benchmark wtffmpeg against a local stand-in server.")
+    p.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token (default 0.05).")
+    p.add_argument("--tokens-per-s", type=float, default=200.0, help="Reply token rate (default 200, 0 = instant).")
+    p.add_argument("--style", choices=STYLES, default="fenced", help="Default reply style of the server.")
+    p.add_argument("--runs", type=int, default=20, help="Samples per latency measurement (default 20).")
+    p.add_argument("--cold-runs", type=int, default=5, help="Fresh interpreters per cold-start measurement.")
+    p.add_argument("--requests", type=int, default=64, help="Prompts per batch throughput level (default 64).")
+    p.add_argument("--concurrency", default="1,4,16", help="Comma-separated batch concurrency levels.")
+    p.add_argument("--only", default=",".join(SUITES), help=f"Suites to run (default all: {','.join(SUITES)}).")
+    p.add_argument("-o", "--output", default=None, help="Write JSON here instead of stdout.")
+    p.add_argument("--baseline", default=None, help="Earlier JSON result to compare against.")
+    p.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (default 0.25).")
+    return p
+
+
+def run(args) -> dict:
+    from importlib.metadata import PackageNotFoundError, version
+    from .config import AppConfig, DEFAULT_PROFILE_NAME
+    from .llm import build_client
+    from .profiles import DEFAULT_PROFILE_DIR
+
+    suites = {s.strip() for s in args.only.split(",") if s.strip()}
+    unknown = suites - set(SUITES)
+    if unknown:
+        raise SystemExit(f"Unknown suite(s): {', '.join(sorted(unknown))}")
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+
+    results: dict = {}
+    with spawn_server(latency_s=args.latency, tokens_per_s=args.tokens_per_s, style=args.style) as url:
+        cfg = AppConfig(
+            model=args.style, provider="compat", base_url=url, openai_api_key=None, bearer_token=None,
+            profile_name=DEFAULT_PROFILE_NAME, profile_dir=DEFAULT_PROFILE_DIR, context_turns=12,
+            preload_prompt=None, prompt_once=None, no_nag=True, copy=False, endpoints=(url,),
+            cache=False, warmup=False, probe=False, validate=False, metrics=False, recall=False,
+        )
+        client = build_client(cfg)
+        client.models.list()  # connect once so the first sample isn't an outlier
+
+        steps: list[tuple[str, Callable[[], dict]]] = [
+            ("cold", lambda: bench_cold_start(url, args.cold_runs)),
+            ("single_shot", lambda: bench_single_shot(client, cfg, args.runs)),
+            ("ttc", lambda: bench_time_to_command(client, args.runs)),
+            ("extraction", lambda: bench_extraction(client, args.runs)),
+            ("repl", lambda: bench_repl(client, cfg, args.runs)),
+            ("batch", lambda: bench_batch(client, cfg, args.requests, levels)),
+        ]
+        for name, fn in steps:
+            if name in suites:
+                print(f"bench: {name} ...", file=sys.stderr)
+                results[name] = fn()
+
+    try:
+        wtff_version = version("wtffmpeg")
+    except PackageNotFoundError:
+        wtff_version = None
+    return {
+        "version": wtff_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "params": {
+            "latency_s": args.latency, "tokens_per_s": args.tokens_per_s, "style": args.style,
+            "runs": args.runs, "cold_runs": args.cold_runs, "requests": args.requests, "concurrency": levels,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        sp = argparse.ArgumentParser(prog="wtff-bench serve", description="Run only the stand-in server.")
+        sp.add_argument("--port", type=int, default=8089)
+        sp.add_argument("--latency", type=float, default=0.05)
+        sp.add_argument("--tokens-per-s", type=float, default=200.0)
+        sp.add_argument("--style", choices=STYLES, default="fenced")
+        a = sp.parse_args(argv[1:])
+        serve(a.port, latency_s=a.latency, tokens_per_s=a.tokens_per_s, style=a.style)
+        return 0
+
+    args = build_parser().parse_args(argv)
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        problems = compare(result, baseline, args.tolerance)
+        for line in problems:
+            print(f"regression: {line}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
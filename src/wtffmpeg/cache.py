@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .defaults import DEFAULT_CACHE_MAX_AGE_DAYS, DEFAULT_CACHE_MAX_MB
+
+DEFAULT_CACHE_PATH = Path.home() / ".wtffmpeg" / "cache.sqlite3"
+
+
+def cache_key(model: str, base_url: str | None, messages: list[dict], **extra) -> str:
+    """Content address for a request: same model, endpoint and messages -> same key."""
+    payload = {
+        "model": model,
+        "base_url": base_url or "",
+        "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages],
+    }
+    if extra:
+        payload["extra"] = extra
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    path: Path
+    entries: int
+    bytes: int
+    hits: int
+    misses: int
+
+
+class ResponseCache:
+    """
+    On-disk LRU cache of raw model replies, keyed by cache_key().
+
+    Backed by SQLite in WAL mode so several wtff processes can share it safely.
+    Entries are evicted oldest-access-first once the store grows past max_bytes,
+    and dropped on read once they are older than max_age_s.
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        *,
+        max_bytes: int = DEFAULT_CACHE_MAX_MB * 1024 * 1024,
+        max_age_s: float = DEFAULT_CACHE_MAX_AGE_DAYS * 86400,
+    ):
+        self.path = Path(path or DEFAULT_CACHE_PATH).expanduser()
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " raw TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            try:
+                db = self._db()
+                row = db.execute("SELECT raw, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                raw, created = row
+                if self.max_age_s and now - created > self.max_age_s:
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    db.commit()
+                    self.misses += 1
+                    return None
+                db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                db.commit()
+            except sqlite3.Error:
+                # A broken or locked cache must never break generation.
+                self.misses += 1
+                return None
+            self.hits += 1
+        return raw
+
+    def put(self, key: str, raw: str) -> None:
+        now = time.time()
+        size = len(raw.encode("utf-8"))
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO responses (key, raw, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, raw, size, now, now),
+                )
+                self._evict(db, now)
+                db.commit()
+            except sqlite3.Error:
+                pass
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        if self.max_age_s:
+            db.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age_s,))
+        if not self.max_bytes:
+            return
+        (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims: list[str] = []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+            victims.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in victims])
+
+    def clear(self) -> Optional[int]:
+        """Drop every entry; the number removed, or None if the cache couldn't be written."""
+        with self._lock:
+            try:
+                db = self._db()
+                n = db.execute("DELETE FROM responses").rowcount
+                db.commit()
+            except sqlite3.Error:
+                return None
+            try:
+                db.execute("VACUUM")
+            except sqlite3.Error:
+                pass  # cleared all the same; the file shrinks at the next successful VACUUM
+        return n
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            try:
+                entries, size = self._db().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+            except sqlite3.Error:
+                entries, size = 0, 0
+        return CacheStats(path=self.path, entries=entries, bytes=size, hits=self.hits, misses=self.misses)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def open_cache(cfg) -> Optional[ResponseCache]:
+    """Return a ResponseCache for cfg, or None when caching is disabled."""
+    if not getattr(cfg, "cache", True):
+        return None
+    return ResponseCache(
+        max_bytes=int(cfg.cache_max_mb) * 1024 * 1024,
+        max_age_s=float(cfg.cache_max_age_days) * 86400,
+    )
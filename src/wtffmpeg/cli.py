@@ -1,10 +1,13 @@
+from .startup import TRACE
+
 import argparse
+import sys
+import time
 from pathlib import Path
 
-from .llm import build_client
-from .repl import repl, single_shot
-from .config import resolve_config, DEFAULT_CONFIG_PATH
-from .profiles import list_profiles
+# same as config.DEFAULT_CONFIG_PATH; config.py (and everything it pulls in) is
+# imported only once a daemon forward has missed
+DEFAULT_CONFIG_PATH = Path.home() / ".wtffmpeg" / "config.env"
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -30,6 +33,44 @@ def build_parser() -> argparse.ArgumentParser:
         help="Single-shot mode: generate for PROMPT once, then exit (use -c to copy).",
     )
 
+    p.add_argument(
+        "--batch",
+        metavar="FILE",
+        default=None,
+        help="Batch mode: translate one prompt per line of FILE ('-' for stdin), write JSONL, then exit.",
+    )
+    p.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Batch mode: number of requests in flight at once (default 4).",
+    )
+    p.add_argument(
+        "--batch-order",
+        choices=("input", "completion"),
+        default="input",
+        help="Batch mode: emit results in input order (default) or as they complete.",
+    )
+    p.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=None,
+        help="Batch mode: write JSONL here instead of stdout.",
+    )
+
+    p.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run a resident daemon that answers -p/--batch calls from other wtff processes\n"
+        "over a Unix socket (~/.wtffmpeg/daemon.sock), keeping clients and caches warm.",
+    )
+    p.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Run -p/--batch in this process even if a daemon is listening.",
+    )
+
     p.add_argument(
         "--model",
         type=str,
@@ -52,7 +93,8 @@ def build_parser() -> argparse.ArgumentParser:
         "--url",
         type=str,
         default=None,
-        help="Base URL for OpenAI-compatible API. Defaults WTFFMPEG_LLM_API_URL then http://localhost:11434",
+        help="Base URL for OpenAI-compatible API. Defaults WTFFMPEG_LLM_API_URL then http://localhost:11434\n"
+        "A comma-separated list routes each request to the fastest healthy endpoint.",
     )
 
     p.add_argument(
@@ -76,11 +118,51 @@ def build_parser() -> argparse.ArgumentParser:
         default=None,
         help="How many prior user/assistant turns to include in REPL requests (0 = stateless).",
     )
+    p.add_argument(
+        "--context-tokens",
+        type=int,
+        default=None,
+        help="Token budget for REPL requests incl. the profile; oldest turns are evicted to fit (0 = no limit).",
+    )
+
+    p.add_argument(
+        "--resume",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="SESSION",
+        help="Continue a saved REPL session (default: the most recent one). See /session list.",
+    )
 
     p.add_argument("--profile", type=str, default=None, help="Profile name or path")
     p.add_argument("--list-profiles", action="store_true", help="List available profiles and exit")
     p.add_argument("--profile-dir", type=Path, default=None, help="Override ~/.wtffmpeg/profiles")
     p.add_argument("--no-nag", action="store_true", help="Disable nag reminder above every prompt")
+    p.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk response cache (~/.wtffmpeg/cache.sqlite3).",
+    )
+    p.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="Wait for the whole reply instead of streaming and stopping at the first complete command.",
+    )
+    p.add_argument(
+        "--no-probe",
+        action="store_true",
+        help="Don't add ffprobe metadata of local files mentioned in the prompt.",
+    )
+    p.add_argument(
+        "--no-validate",
+        action="store_true",
+        help="Don't check generated commands against the local ffmpeg's options/encoders/filters.",
+    )
+    p.add_argument(
+        "--startup-trace",
+        action="store_true",
+        help="Print per-phase import/init timings to stderr on exit.",
+    )
     p.add_argument(
         "--config",
         type=Path,
@@ -91,28 +173,88 @@ def build_parser() -> argparse.ArgumentParser:
 
 
 def main() -> None:
-    parser = build_parser()
-    args = parser.parse_args()
+    # Heavy modules (openai, prompt_toolkit, pygments, pypager) are imported
+    # only on the path that needs them; see --startup-trace.
+    TRACE.record("import cli", time.perf_counter() - TRACE.t0)
+    if sys.argv[1:2] == ["serve"]:
+        from .server import serve_main
+
+        raise SystemExit(serve_main(sys.argv[2:]))
+    with TRACE.phase("parse args"):
+        parser = build_parser()
+        args = parser.parse_args()
+    TRACE.enabled = args.startup_trace
+
+    try:
+        if args.daemon:
+            from .daemon import serve
+
+            raise SystemExit(serve())
+
+        # stdin can only be read once: if the daemon doesn't answer, the local run needs the same text
+        batch_text = sys.stdin.read() if args.batch == "-" else None
+
+        if (args.prompt_once is not None or args.batch is not None) and not args.no_daemon:
+            from .daemon import forward
+
+            with TRACE.phase("forward to daemon"):
+                rc = forward(sys.argv[1:], batch=args.batch, text=batch_text, output=args.output)
+            if rc is not None:
+                raise SystemExit(rc)
+
+        with TRACE.phase("resolve config"):
+            from .config import resolve_config
+
+            cfg = resolve_config(args, config_path=args.config)
+
+        if args.list_profiles:
+            from .profiles import list_profiles
+
+            avail = list_profiles(cfg.profile_dir)
+            print("User profiles:")
+            for n in avail["user"]:
+                print(f"  {n}")
+            print("Built-in profiles:")
+            for n in avail["builtin"]:
+                print(f"  {n}")
+            raise SystemExit(0)
+
+        if args.batch is not None:
+            from .llm import LazyClient
+            from .batch import batch_mode
 
-    cfg = resolve_config(args, config_path=args.config)
+            out = open(args.output, "w", encoding="utf-8") if args.output else None
+            try:
+                rc = batch_mode(
+                    client=LazyClient(cfg),
+                    cfg=cfg,
+                    source=args.batch,
+                    text=batch_text,
+                    concurrency=args.concurrency,
+                    ordered=args.batch_order == "input",
+                    out=out,
+                )
+            finally:
+                if out is not None:
+                    out.close()
+            raise SystemExit(rc)
 
-    if args.list_profiles:
-        avail = list_profiles(cfg.profile_dir)
-        print("User profiles:")
-        for n in avail["user"]:
-            print(f"  {n}")
-        print("Built-in profiles:")
-        for n in avail["builtin"]:
-            print(f"  {n}")
-        raise SystemExit(0)
+        if cfg.prompt_once is not None:
+            from .llm import LazyClient
+            from .oneshot import single_shot
 
-    client = build_client(cfg)
+            rc = single_shot(client=LazyClient(cfg), cfg=cfg)
+            raise SystemExit(rc)
 
-    if cfg.prompt_once is not None:
-        rc = single_shot(client=client, cfg=cfg)
-        raise SystemExit(rc)
+        with TRACE.phase("import repl"):
+            from .repl import repl
+        from .llm import build_client
 
-    repl(client=client, cfg=cfg)
+        with TRACE.phase("build client (import openai)"):
+            client = build_client(cfg)
+        repl(client=client, cfg=cfg)
+    finally:
+        TRACE.report()
 
 
 if __name__ == "__main__":
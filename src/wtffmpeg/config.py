@@ -3,12 +3,28 @@ from __future__ import annotations
 from dataclasses import dataclass, replace
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Literal, Any
+from typing import Optional, Literal, Any, Mapping
+import json
 import os
 
 from .profiles import load_profile, Profile, DEFAULT_PROFILE_DIR
-
-Provider = Literal["openai", "compat"]
+from .defaults import (
+    DEFAULT_CACHE_MAX_AGE_DAYS,
+    DEFAULT_CACHE_MAX_MB,
+    DEFAULT_CONTEXT_TOKENS,
+    DEFAULT_HISTORY_MAX,
+    DEFAULT_JOB_THREADS,
+    DEFAULT_METRICS_MAX_MB,
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_KEEPALIVE,
+    DEFAULT_RECALL_EXAMPLES,
+    DEFAULT_RECALL_THRESHOLD,
+    DEFAULT_SAMPLE_S,
+    DEFAULT_SAMPLES,
+    default_model_name,
+)
+
+Provider = Literal["openai", "compat", "local"]
 
 # Defaults / keys
 DEFAULT_MODEL_COMPAT = "gpt-oss:20b"
@@ -17,17 +33,59 @@ DEFAULT_PROFILE_NAME = "minimal"
 
 DEFAULT_CONFIG_PATH = Path.home() / ".wtffmpeg" / "config.env"
 
+DEFAULT_TIMEOUT_S = 120
+DEFAULT_CONNECT_TIMEOUT_S = 10
+DEFAULT_MAX_RETRIES = 2
+
 # Keys that are safe to accept from a config file / REPL.
 CONFIG_KEYS: set[str] = {
     "model",
     "provider",
     "base_url",
+    "endpoints",
     "openai_api_key",
     "bearer_token",
     "context_turns",
+    "context_tokens",
+    "tokenizer",
     "profile",
     "no_nag",
     "copy",
+    "cache",
+    "cache_max_mb",
+    "cache_max_age_days",
+    "stream",
+    "warmup",
+    "probe",
+    "validate",
+    "job_slots",
+    "job_threads",
+    "metrics",
+    "metrics_toolbar",
+    "metrics_max_mb",
+    "max_tokens",
+    "num_predict",
+    "num_ctx",
+    "stop",
+    "reasoning_effort",
+    "recall",
+    "recall_threshold",
+    "recall_examples",
+    "sessions",
+    "timeout_s",
+    "connect_timeout_s",
+    "max_retries",
+    "hedge_after_ms",
+    "hedge",
+    "http2",
+    "pool_connections",
+    "pool_keepalive",
+    "auto_estimate",
+    "estimate_samples",
+    "estimate_seconds",
+    "history_max",
+    "model_path",
+    "local_threads",
 }
 
 # Keys we persist by default (avoid secrets).
@@ -35,10 +93,90 @@ PERSIST_KEYS: set[str] = {
     "model",
     "provider",
     "base_url",
+    "endpoints",
     "context_turns",
+    "context_tokens",
+    "tokenizer",
     "profile",
     "no_nag",
     "copy",
+    "cache",
+    "cache_max_mb",
+    "cache_max_age_days",
+    "stream",
+    "warmup",
+    "probe",
+    "validate",
+    "job_slots",
+    "job_threads",
+    "metrics",
+    "metrics_toolbar",
+    "metrics_max_mb",
+    "max_tokens",
+    "num_predict",
+    "num_ctx",
+    "stop",
+    "reasoning_effort",
+    "recall",
+    "recall_threshold",
+    "recall_examples",
+    "sessions",
+    "timeout_s",
+    "connect_timeout_s",
+    "max_retries",
+    "hedge_after_ms",
+    "hedge",
+    "http2",
+    "pool_connections",
+    "pool_keepalive",
+    "auto_estimate",
+    "estimate_samples",
+    "estimate_seconds",
+    "history_max",
+    "model_path",
+    "local_threads",
+}
+
+# Value types for coercion of file/REPL strings.
+INT_KEYS: set[str] = {
+    "context_turns",
+    "context_tokens",
+    "cache_max_mb",
+    "cache_max_age_days",
+    "job_slots",
+    "job_threads",
+    "metrics_max_mb",
+    "max_tokens",
+    "num_predict",
+    "num_ctx",
+    "recall_threshold",
+    "recall_examples",
+    "timeout_s",
+    "connect_timeout_s",
+    "max_retries",
+    "hedge_after_ms",
+    "pool_connections",
+    "pool_keepalive",
+    "estimate_samples",
+    "estimate_seconds",
+    "history_max",
+    "local_threads",
+}
+BOOL_KEYS: set[str] = {
+    "copy",
+    "no_nag",
+    "cache",
+    "stream",
+    "warmup",
+    "probe",
+    "validate",
+    "metrics",
+    "metrics_toolbar",
+    "recall",
+    "sessions",
+    "hedge",
+    "http2",
+    "auto_estimate",
 }
 
 @dataclass(frozen=True)
@@ -48,7 +186,7 @@ class AppConfig:
     provider: Provider
 
     # endpoint/auth (resolved)
-    base_url: Optional[str]          # normalized, includes /v1 for compat
+    base_url: Optional[str]          # normalized, includes /v1 for compat; primary endpoint
     openai_api_key: Optional[str]
     bearer_token: Optional[str]
 
@@ -66,9 +204,84 @@ class AppConfig:
     copy: bool
     # exec_: bool
 
+    # all compat endpoints (normalized, base_url first); >1 enables routing/failover
+    endpoints: tuple[str, ...] = ()
+
+    # conversation token budget (0 = turns only) and how tokens are counted
+    context_tokens: int = DEFAULT_CONTEXT_TOKENS
+    tokenizer: str = "heuristic"
+
+    # response cache
+    cache: bool = True
+    cache_max_mb: int = DEFAULT_CACHE_MAX_MB
+    cache_max_age_days: int = DEFAULT_CACHE_MAX_AGE_DAYS
+
+    # stream replies and stop reading once a full command has arrived
+    stream: bool = True
+
+    # REPL: load the model in the background while the user types
+    warmup: bool = True
+
+    # add ffprobe summaries of local files named in the prompt
+    probe: bool = True
+
+    # check generated commands against the local ffmpeg and re-prompt on errors
+    validate: bool = True
+
+    # background jobs (!&cmd): concurrent slots (0 = cpu_count // job_threads)
+    job_slots: int = 0
+    job_threads: int = DEFAULT_JOB_THREADS
+
+    # per-request telemetry (~/.wtffmpeg/metrics.jsonl) and its toolbar readout
+    metrics: bool = True
+    metrics_max_mb: int = DEFAULT_METRICS_MAX_MB
+    metrics_toolbar: bool = False
+
+    # generation limits; unset (0/None/()) falls back to the profile's front matter
+    max_tokens: int = 0
+    stop: tuple[str, ...] = ()
+    reasoning_effort: Optional[str] = None
+    num_predict: int = 0  # Ollama options passthrough
+    num_ctx: int = 0  # also the context size of a provider=local model
 
-def _env_nonempty(name: str) -> Optional[str]:
-    v = os.environ.get(name)
+    # answer from past successful (prompt, command) pairs: instant at >= threshold %,
+    # otherwise up to recall_examples close matches are sent as few-shot examples
+    recall: bool = True
+    recall_threshold: int = DEFAULT_RECALL_THRESHOLD
+    recall_examples: int = DEFAULT_RECALL_EXAMPLES
+
+    # journal REPL conversations to ~/.wtffmpeg/sessions/; resume: session name ("" = latest)
+    sessions: bool = True
+    resume: Optional[str] = None
+
+    # LLM client: read/connect timeouts (0 = none), retries (failovers with several endpoints)
+    timeout_s: int = DEFAULT_TIMEOUT_S
+    connect_timeout_s: int = DEFAULT_CONNECT_TIMEOUT_S
+    max_retries: int = DEFAULT_MAX_RETRIES
+    # duplicate requests slower than the observed p95 to first token (or hedge_after_ms)
+    hedge: bool = False
+    hedge_after_ms: int = 0
+
+    # shared HTTP connection pool (one per origin, reused across client rebuilds)
+    http2: bool = False
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS
+    pool_keepalive: int = DEFAULT_POOL_KEEPALIVE
+
+    # /estimate: sample windows and their length; auto_estimate runs it on long inputs
+    estimate_samples: int = DEFAULT_SAMPLES
+    estimate_seconds: int = DEFAULT_SAMPLE_S
+    auto_estimate: bool = False
+
+    # REPL history (~/.wtffmpeg/history.sqlite3): newest entries kept (0 = no limit)
+    history_max: int = DEFAULT_HISTORY_MAX
+
+    # provider=local: GGUF model run in-process by llama-cpp-python (0 threads = its default)
+    model_path: Optional[str] = None
+    local_threads: int = 0
+
+
+def _env_nonempty(name: str, env: Mapping[str, str] | None = None) -> Optional[str]:
+    v = (os.environ if env is None else env).get(name)
     if v is None:
         return None
     v = v.strip()
@@ -85,13 +298,38 @@ def normalize_base_url(url: str) -> str:
     return url
 
 
+def parse_endpoints(raw: str | tuple | list) -> tuple[str, ...]:
+    """Split a comma-separated URL list (or sequence) into normalized base URLs."""
+    items = raw.split(",") if isinstance(raw, str) else list(raw)
+    out: list[str] = []
+    for item in items:
+        item = str(item).strip()
+        if item:
+            url = normalize_base_url(item)
+            if url not in out:
+                out.append(url)
+    return tuple(out)
+
+
+def parse_stop(raw: str | tuple | list | None) -> tuple[str, ...]:
+    """Stop sequences from a JSON list (["\\n```", "\\n\\n"]) or a single string; escapes like \\n decoded."""
+    if not raw:
+        return ()
+    if isinstance(raw, (tuple, list)):
+        return tuple(str(s) for s in raw if s)
+    v = str(raw)
+    if v.lstrip().startswith("["):
+        return tuple(str(s) for s in json.loads(v) if s)
+    return (v.encode("utf-8").decode("unicode_escape"),)
+
+
 def _coerce_value(key: str, raw: str) -> Any:
     v = raw.strip()
     if v.lower() in ("none", "null"):
         return None
-    if key in ("context_turns",):
+    if key in INT_KEYS:
         return int(v)
-    if key in ("copy", "no_nag"):
+    if key in BOOL_KEYS:
         if v.lower() in ("1", "true", "yes", "on"):
             return True
         if v.lower() in ("0", "false", "no", "off"):
@@ -141,6 +379,14 @@ def save_config(cfg: AppConfig, path: Path | None = None, keys: set[str] | None
             v = getattr(cfg, k)
         if v is None:
             continue
+        if k == "stop":
+            if not v:
+                continue
+            v = json.dumps(list(v))
+        elif isinstance(v, tuple):
+            if len(v) < 2:
+                continue  # a single endpoint is already saved as base_url
+            v = ",".join(v)
         lines.append(f"{k}={v}")
     path.write_text("\n".join(lines) + ("\n" if lines else ""), encoding="utf-8")
     return path
@@ -159,9 +405,26 @@ def apply_overrides(cfg: AppConfig, overrides: dict[str, Any]) -> AppConfig:
             updates["profile_name"] = str(raw_profile)
 
     # profile is stored as a name (string)
-    # normalize base_url if present and non-empty
-    if "base_url" in updates and updates["base_url"]:
-        updates["base_url"] = normalize_base_url(str(updates["base_url"]))
+    # base_url and endpoints move together: base_url is always the first endpoint.
+    # A comma-separated base_url is accepted as an endpoint list.
+    if "base_url" in updates and updates["base_url"] and "," in str(updates["base_url"]):
+        updates["endpoints"] = updates.pop("base_url")
+    if "endpoints" in updates:
+        eps = parse_endpoints(updates["endpoints"] or ())
+        if eps:
+            updates["base_url"] = eps[0]
+        elif cfg.base_url:
+            eps = (cfg.base_url,)
+        updates["endpoints"] = eps
+    elif "base_url" in updates:
+        if updates["base_url"]:
+            updates["base_url"] = normalize_base_url(str(updates["base_url"]))
+            updates["endpoints"] = (updates["base_url"],)
+        else:
+            updates["endpoints"] = ()
+
+    if "stop" in updates:
+        updates["stop"] = parse_stop(updates["stop"])
 
     # provider should be a valid Literal
     if "provider" in updates and updates["provider"] is not None:
@@ -171,28 +434,36 @@ def apply_overrides(cfg: AppConfig, overrides: dict[str, Any]) -> AppConfig:
 
 
 # args/env/file/defaults
-def resolve_config(args, *, config_path: Path | None = None) -> AppConfig:
+def resolve_config(args, *, config_path: Path | None = None, env: Mapping[str, str] | None = None) -> AppConfig:
     """Resolve config using the precedence:
         CLI args > env vars > config file > defaults
+
+    env replaces os.environ (the daemon resolves with its caller's environment).
     """
     file_cfg = load_config(config_path)
 
     profile_dir = args.profile_dir or DEFAULT_PROFILE_DIR
     profile_spec = (
         getattr(args, "profile", None)
-        or _env_nonempty("WTFFMPEG_PROFILE")
+        or _env_nonempty("WTFFMPEG_PROFILE", env)
         or file_cfg.get("profile")
         or DEFAULT_PROFILE_NAME
     )
     profile_name = str(profile_spec)
 
-    openai_api_key = getattr(args, "api_key", None) or _env_nonempty("WTFFMPEG_OPENAI_API_KEY") or file_cfg.get("openai_api_key")
-    bearer_token = getattr(args, "bearer_token", None) or _env_nonempty("WTFFMPEG_BEARER_TOKEN") or file_cfg.get("bearer_token")
-    url_raw = getattr(args, "url", None) or _env_nonempty("WTFFMPEG_LLM_API_URL") or file_cfg.get("base_url") or "http://localhost:11434"
+    openai_api_key = getattr(args, "api_key", None) or _env_nonempty("WTFFMPEG_OPENAI_API_KEY", env) or file_cfg.get("openai_api_key")
+    bearer_token = getattr(args, "bearer_token", None) or _env_nonempty("WTFFMPEG_BEARER_TOKEN", env) or file_cfg.get("bearer_token")
+    url_raw = (
+        getattr(args, "url", None)
+        or _env_nonempty("WTFFMPEG_LLM_API_URL", env)
+        or file_cfg.get("endpoints")
+        or file_cfg.get("base_url")
+        or "http://localhost:11434"
+    )
 
     # provider can be forced by args/provider, otherwise inferred
     provider_arg = getattr(args, "provider", None) if hasattr(args, "provider") else None
-    provider_env = _env_nonempty("WTFFMPEG_PROVIDER")
+    provider_env = _env_nonempty("WTFFMPEG_PROVIDER", env)
     provider_file = file_cfg.get("provider")
     provider: Provider
 
@@ -210,17 +481,23 @@ def resolve_config(args, *, config_path: Path | None = None) -> AppConfig:
             provider = "compat"
 
     base_url: Optional[str]
-    if provider == "openai":
+    endpoints: tuple[str, ...]
+    model_path = _env_nonempty("WTFFMPEG_MODEL_PATH", env) or file_cfg.get("model_path") or None
+    if provider in ("openai", "local"):
         base_url = None
+        endpoints = ()
     else:
-        base_url = normalize_base_url(str(url_raw))
+        # --url / WTFFMPEG_LLM_API_URL / endpoints= may list several, comma-separated
+        endpoints = parse_endpoints(str(url_raw))
+        base_url = endpoints[0]
 
     # args > env > file > provider-default
+    default_model = {"openai": DEFAULT_MODEL_OPENAI, "local": default_model_name(model_path)}
     model = (
         getattr(args, "model", None)
-        or _env_nonempty("WTFFMPEG_MODEL")
+        or _env_nonempty("WTFFMPEG_MODEL", env)
         or file_cfg.get("model")
-        or (DEFAULT_MODEL_OPENAI if provider == "openai" else DEFAULT_MODEL_COMPAT)
+        or default_model.get(provider, DEFAULT_MODEL_COMPAT)
     )
 
     context_turns = (
@@ -228,22 +505,68 @@ def resolve_config(args, *, config_path: Path | None = None) -> AppConfig:
         if getattr(args, "context_turns", None) is not None
         else file_cfg.get("context_turns", 12)
     )
+    context_tokens = (
+        getattr(args, "context_tokens", None)
+        if getattr(args, "context_tokens", None) is not None
+        else file_cfg.get("context_tokens", DEFAULT_CONTEXT_TOKENS)
+    )
     no_nag = bool(getattr(args, "no_nag", False) or file_cfg.get("no_nag", False))
     copy = bool(getattr(args, "copy", False) or file_cfg.get("copy", False))
+    cache = False if getattr(args, "no_cache", False) else bool(file_cfg.get("cache", True))
+    stream = False if getattr(args, "no_stream", False) else bool(file_cfg.get("stream", True))
 
     return AppConfig(
         model=str(model),
         provider=provider,
         base_url=base_url,
+        endpoints=endpoints,
         openai_api_key=openai_api_key,
         bearer_token=bearer_token,
         context_turns=int(context_turns),
+        context_tokens=int(context_tokens),
+        tokenizer=str(file_cfg.get("tokenizer") or "heuristic"),
         preload_prompt=getattr(args, "prompt", None),
         prompt_once=getattr(args, "prompt_once", None),
         no_nag=no_nag,
         copy=copy,
         profile_name=profile_name,
         profile_dir=profile_dir,
+        cache=cache,
+        stream=stream,
+        warmup=bool(file_cfg.get("warmup", True)),
+        probe=False if getattr(args, "no_probe", False) else bool(file_cfg.get("probe", True)),
+        validate=False if getattr(args, "no_validate", False) else bool(file_cfg.get("validate", True)),
+        cache_max_mb=int(file_cfg.get("cache_max_mb", DEFAULT_CACHE_MAX_MB)),
+        cache_max_age_days=int(file_cfg.get("cache_max_age_days", DEFAULT_CACHE_MAX_AGE_DAYS)),
+        job_slots=int(file_cfg.get("job_slots", 0)),
+        job_threads=int(file_cfg.get("job_threads", DEFAULT_JOB_THREADS)),
+        metrics=bool(file_cfg.get("metrics", True)),
+        metrics_max_mb=int(file_cfg.get("metrics_max_mb", DEFAULT_METRICS_MAX_MB)),
+        metrics_toolbar=bool(file_cfg.get("metrics_toolbar", False)),
+        max_tokens=int(file_cfg.get("max_tokens") or 0),
+        stop=parse_stop(file_cfg.get("stop")),
+        reasoning_effort=file_cfg.get("reasoning_effort") or None,
+        num_predict=int(file_cfg.get("num_predict") or 0),
+        num_ctx=int(file_cfg.get("num_ctx") or 0),
+        recall=bool(file_cfg.get("recall", True)),
+        recall_threshold=int(file_cfg.get("recall_threshold", DEFAULT_RECALL_THRESHOLD)),
+        recall_examples=int(file_cfg.get("recall_examples", DEFAULT_RECALL_EXAMPLES)),
+        sessions=bool(file_cfg.get("sessions", True)),
+        resume=getattr(args, "resume", None),
+        timeout_s=int(file_cfg.get("timeout_s", DEFAULT_TIMEOUT_S)),
+        connect_timeout_s=int(file_cfg.get("connect_timeout_s", DEFAULT_CONNECT_TIMEOUT_S)),
+        max_retries=int(file_cfg.get("max_retries", DEFAULT_MAX_RETRIES)),
+        hedge=bool(file_cfg.get("hedge", False)),
+        hedge_after_ms=int(file_cfg.get("hedge_after_ms", 0)),
+        http2=bool(file_cfg.get("http2", False)),
+        pool_connections=int(file_cfg.get("pool_connections", DEFAULT_POOL_CONNECTIONS)),
+        pool_keepalive=int(file_cfg.get("pool_keepalive", DEFAULT_POOL_KEEPALIVE)),
+        estimate_samples=int(file_cfg.get("estimate_samples", DEFAULT_SAMPLES)),
+        estimate_seconds=int(file_cfg.get("estimate_seconds", DEFAULT_SAMPLE_S)),
+        auto_estimate=bool(file_cfg.get("auto_estimate", False)),
+        history_max=int(file_cfg.get("history_max", DEFAULT_HISTORY_MAX)),
+        model_path=model_path,
+        local_threads=int(file_cfg.get("local_threads") or 0),
     )
 
 def resolve_profile(cfg: AppConfig) -> Profile:
@@ -0,0 +1,119 @@
+"""Token-budgeted conversation buffer for the REPL.
+
+Keeps the system prompt plus a deque of user/assistant messages, each with a
+token estimate computed once on append. The running total is maintained
+incrementally, so appends and evictions are O(1); the oldest turns are evicted
+whenever the buffer exceeds its turn or token budget.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Callable, Optional
+
+from .defaults import DEFAULT_CONTEXT_TOKENS
+
+TokenCounter = Callable[[str], int]
+
+
+# Rough per-message framing cost of chat templates (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast heuristic: ~4 characters per token for English text and shell commands."""
+    return (len(text) + 3) // 4
+
+
+def get_token_counter(name: str | None = None) -> TokenCounter:
+    """
+    Return a token counting function.
+
+    name: "heuristic" (default), or "tiktoken" / "tiktoken:<encoding>" which uses
+    tiktoken if it is installed and falls back to the heuristic otherwise.
+    """
+    if not name or name == "heuristic":
+        return estimate_tokens
+    if name.startswith("tiktoken"):
+        encoding = name.split(":", 1)[1] if ":" in name else "o200k_base"
+        try:
+            import tiktoken  # optional
+
+            enc = tiktoken.get_encoding(encoding)
+        except Exception:
+            return estimate_tokens
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    raise ValueError(f"Unknown tokenizer: {name} (expected heuristic or tiktoken[:encoding])")
+
+
+class Conversation:
+    """System prompt + rolling user/assistant history within a turn and token budget."""
+
+    def __init__(
+        self,
+        system: str,
+        *,
+        context_turns: int = 12,
+        context_tokens: Optional[int] = DEFAULT_CONTEXT_TOKENS,
+        count_tokens: TokenCounter = estimate_tokens,
+    ):
+        self.context_turns = context_turns
+        self.context_tokens = context_tokens
+        self.count_tokens = count_tokens
+        self._msgs: deque[tuple[dict, int]] = deque()
+        self._history_tokens = 0
+        self.set_system(system)
+
+    def _cost(self, content: str) -> int:
+        return self.count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+    @property
+    def tokens(self) -> int:
+        """Estimated prompt size of messages(), system prompt included."""
+        return self._system_tokens + self._history_tokens
+
+    def __len__(self) -> int:
+        return len(self._msgs)
+
+    def set_system(self, system: str) -> None:
+        self._system = {"role": "system", "content": system}
+        self._system_tokens = self._cost(system)
+        self._evict()
+
+    def reset(self, system: str | None = None) -> None:
+        """Drop all history; optionally replace the system prompt."""
+        self._msgs.clear()
+        self._history_tokens = 0
+        if system is not None:
+            self.set_system(system)
+
+    def append(self, role: str, content: str) -> None:
+        cost = self._cost(content)
+        self._msgs.append(({"role": role, "content": content}, cost))
+        self._history_tokens += cost
+        self._evict()
+
+    def pop(self) -> dict:
+        """Remove and return the newest message (e.g. a prompt that failed)."""
+        msg, cost = self._msgs.pop()
+        self._history_tokens -= cost
+        return msg
+
+    def messages(self) -> list[dict]:
+        return [self._system] + [m for m, _ in self._msgs]
+
+    def _over_budget(self) -> bool:
+        # A pending user prompt doesn't count against context_turns.
+        pending = 1 if self._msgs and self._msgs[-1][0]["role"] == "user" else 0
+        if len(self._msgs) - pending > max(self.context_turns, 0) * 2:
+            return True
+        return bool(self.context_tokens) and self.tokens > self.context_tokens
+
+    def _evict(self) -> None:
+        # Never evict the newest message: an oversized prompt is still sent.
+        while len(self._msgs) > 1 and self._over_budget():
+            _, cost = self._msgs.popleft()
+            self._history_tokens -= cost
+            # don't leave an assistant reply without the prompt it answered
+            if len(self._msgs) > 1 and self._msgs[0][0]["role"] == "assistant":
+                _, cost = self._msgs.popleft()
+                self._history_tokens -= cost
@@ -0,0 +1,273 @@
+"""Resident daemon for scripted single-shot and batch calls (`wtff --daemon`).
+
+`wtff -p` and `wtff --batch` normally pay for interpreter startup, importing
+openai/httpx, opening the caches and a fresh connection on every call. With a
+daemon running, the cli parses its arguments and forwards them over a Unix
+socket (~/.wtffmpeg/daemon.sock, or $WTFFMPEG_DAEMON_SOCKET) instead; the
+daemon keeps clients, connection pools, profiles and caches warm between calls.
+If no daemon answers, the cli quietly runs the request in-process as before.
+
+Protocol: the client sends one JSON line {"argv", "cwd", "env", "input"} and
+reads JSON lines back: {"out": text}, {"err": text}, {"copy": cmd}, and a final
+{"rc": n}. The client half below imports only the standard library.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import IO, Optional
+
+DEFAULT_SOCKET_PATH = Path.home() / ".wtffmpeg" / "daemon.sock"
+CONNECT_TIMEOUT_S = 0.25
+MAX_RUNTIMES = 8  # distinct endpoint/credential sets kept warm
+
+
+def socket_path() -> Path:
+    override = os.environ.get("WTFFMPEG_DAEMON_SOCKET", "").strip()
+    return Path(override).expanduser() if override else DEFAULT_SOCKET_PATH
+
+
+# --- client ---
+
+
+def forward(argv: list[str], *, batch: Optional[str] = None, text: Optional[str] = None,
+            output: Optional[Path] = None) -> Optional[int]:
+    """Run a request in the daemon. Returns its exit code, or None if no daemon answered.
+
+    text is the batch input when the caller has already read it (stdin, which
+    can't be read a second time for a local fallback).
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT_S)
+    try:
+        sock.connect(str(socket_path()))
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(None)
+
+    if batch is not None and text is None:
+        # the daemon can't see our stdin, and relative paths are ours
+        try:
+            text = sys.stdin.read() if batch == "-" else Path(batch).read_text(encoding="utf-8")
+        except OSError as e:
+            sock.close()
+            print(f"Cannot read batch input: {e}", file=sys.stderr)
+            return 2
+    request = {
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": {k: v for k, v in os.environ.items() if k.startswith("WTFFMPEG_")},
+        "input": text,
+    }
+    out: IO[str] = open(output, "w", encoding="utf-8") if output else sys.stdout
+    got_reply = False
+    try:
+        with sock, sock.makefile("rw", encoding="utf-8") as f:
+            f.write(json.dumps(request) + "\n")
+            f.flush()
+            for line in f:
+                msg = json.loads(line)
+                got_reply = True
+                if "out" in msg:
+                    out.write(msg["out"])
+                    out.flush()
+                elif "err" in msg:
+                    sys.stderr.write(msg["err"])
+                elif "copy" in msg:
+                    import pyperclip
+
+                    pyperclip.copy(msg["copy"])
+                    print("Command copied to clipboard.")
+                elif "rc" in msg:
+                    return int(msg["rc"])
+    except (OSError, ValueError):
+        pass
+    finally:
+        if output:
+            out.close()
+    if not got_reply:
+        return None  # daemon went away before answering; nothing was printed, safe to redo locally
+    print("wtff daemon closed the connection mid-reply", file=sys.stderr)
+    return 1
+
+
+# --- server ---
+
+
+class _Channel:
+    """File-like writer that frames everything written as one kind of message."""
+
+    def __init__(self, wfile, kind: str):
+        self.wfile = wfile
+        self.kind = kind
+
+    def write(self, s: str) -> int:
+        if s:
+            self.wfile.write((json.dumps({self.kind: s}) + "\n").encode("utf-8"))
+        return len(s)
+
+    def flush(self) -> None:
+        self.wfile.flush()
+
+
+def serve(path: Path | None = None) -> int:
+    """Run the daemon in the foreground until interrupted."""
+    import signal
+    import socketserver
+    import threading
+    from collections import OrderedDict
+
+    from .batch import parse_prompts, write_batch
+    from .cli import build_parser
+    from .config import resolve_config
+    from .oneshot import translate_once
+    from .runtime import RuntimeState, client_fingerprint, close_runtime, reconcile_runtime
+
+    path = Path(path or socket_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+        print(f"A wtff daemon is already listening on {path}", file=sys.stderr)
+        return 1
+    except OSError:
+        pass  # nothing there, or a stale socket from a daemon that died
+    finally:
+        probe.close()
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+    class Slot:
+        """A kept-warm runtime and the requests using it (an evicted one is closed by its last user)."""
+
+        def __init__(self) -> None:
+            self.lock = threading.Lock()
+            self.rt = RuntimeState()
+            self.users = 0
+            self.evicted = False
+
+    runtimes: OrderedDict[tuple, Slot] = OrderedDict()
+    runtimes_lock = threading.Lock()
+
+    def acquire(cfg) -> tuple[Slot, RuntimeState]:
+        """Warm runtime for cfg's endpoints/credentials; reconciled, then snapshotted for this request."""
+        fp = client_fingerprint(cfg)
+        idle: list[Slot] = []
+        with runtimes_lock:
+            slot = runtimes.get(fp)
+            if slot is None:
+                slot = runtimes[fp] = Slot()
+                while len(runtimes) > MAX_RUNTIMES:
+                    _, old = runtimes.popitem(last=False)
+                    old.evicted = True
+                    if old.users == 0:
+                        idle.append(old)
+            runtimes.move_to_end(fp)
+            slot.users += 1
+        for old in idle:
+            with old.lock:
+                close_runtime(old.rt)
+        try:
+            with slot.lock:
+                reconcile_runtime(cfg, slot.rt)
+                return slot, RuntimeState(**{k: getattr(slot.rt, k) for k in slot.rt.__dataclass_fields__})
+        except BaseException:
+            release(slot)
+            raise
+
+    def release(slot: Slot) -> None:
+        with runtimes_lock:
+            slot.users -= 1
+            if not (slot.evicted and slot.users == 0):
+                return
+        with slot.lock:
+            close_runtime(slot.rt)
+
+    def handle(req: dict, out: _Channel, err: _Channel) -> int:
+        args = build_parser().parse_args(req["argv"])
+        cwd = Path(req.get("cwd") or ".")
+        # paths on the command line are relative to the caller, not to us
+        if args.config is not None:
+            args.config = cwd / args.config
+        if args.profile_dir is not None:
+            args.profile_dir = cwd / args.profile_dir
+        if args.profile and (cwd / args.profile).is_file():
+            args.profile = str(cwd / args.profile)
+        cfg = resolve_config(args, config_path=args.config, env=req.get("env") or {})
+        slot, rt = acquire(cfg)
+        try:
+            return respond(req, args, cfg, rt, cwd, out, err)
+        finally:
+            release(slot)
+
+    def respond(req: dict, args, cfg, rt: RuntimeState, cwd: Path, out: _Channel, err: _Channel) -> int:
+        stores = dict(probe_index=rt.probe_index, cache=rt.cache, validator=rt.validator, metrics=rt.metrics)
+
+        if args.batch is not None:
+            prompts = parse_prompts(req.get("input") or "")
+            return write_batch(
+                prompts, client=rt.client, cfg=cfg, concurrency=args.concurrency,
+                ordered=args.batch_order == "input", out=out, err=err, cwd=cwd, **stores,
+            )
+
+        raw, cmd, note = translate_once(cfg, client=rt.client, profile=rt.profile, recall=rt.recall, cwd=cwd, **stores)
+        if note:
+            err.write(note + "\n")
+        if not cmd:
+            err.write("Failed to generate a command.\n")
+            out.write(raw + "\n")
+            return 1
+        out.write(cmd + "\n")
+        if cfg.copy:
+            out.wfile.write((json.dumps({"copy": cmd}) + "\n").encode("utf-8"))
+        return 0
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            out, err = _Channel(self.wfile, "out"), _Channel(self.wfile, "err")
+            try:
+                req = json.loads(self.rfile.readline())
+                rc = handle(req, out, err)
+            except SystemExit as e:  # argparse; the client validated argv already, so rare
+                rc = e.code if isinstance(e.code, int) else 2
+            except Exception as e:
+                err.write(f"wtff daemon: {type(e).__name__}: {e}\n")
+                rc = 1
+            try:
+                self.wfile.write((json.dumps({"rc": rc}) + "\n").encode("utf-8"))
+            except OSError:
+                pass  # client went away
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    old_umask = os.umask(0o077)  # the socket carries API keys from the caller's environment
+    try:
+        server = Server(str(path), Handler)
+    finally:
+        os.umask(old_umask)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"wtff daemon listening on {path} (pid {os.getpid()}); Ctrl-C to stop.", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with runtimes_lock:
+            slots = list(runtimes.values())
+            runtimes.clear()
+        for slot in slots:
+            with slot.lock:
+                close_runtime(slot.rt)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    return 0
@@ -0,0 +1,29 @@
+"""Default values of config keys that belong to other modules.
+
+config.py needs them for AppConfig and resolve_config, but importing the modules
+that own them would pull sqlite3, subprocess, prompt_toolkit and friends into
+every `wtff -p` start. This module imports nothing heavier than pathlib, and the
+owners re-export their values from here.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_MAX_MB = 64
+DEFAULT_CACHE_MAX_AGE_DAYS = 30
+DEFAULT_CONTEXT_TOKENS = 8192
+DEFAULT_HISTORY_MAX = 10000
+DEFAULT_JOB_THREADS = 4
+DEFAULT_METRICS_MAX_MB = 8
+DEFAULT_POOL_CONNECTIONS = 20
+DEFAULT_POOL_KEEPALIVE = 10
+DEFAULT_RECALL_THRESHOLD = 90  # percent trigram similarity for an instant answer
+DEFAULT_RECALL_EXAMPLES = 3
+DEFAULT_SAMPLES = 3  # /estimate windows
+DEFAULT_SAMPLE_S = 10  # seconds per /estimate and /tune window
+
+
+def default_model_name(model_path: Optional[str]) -> str:
+    """provider=local: the model is named after its GGUF file."""
+    return Path(model_path).stem if model_path else "local"
@@ -0,0 +1,268 @@
+"""Runtime and size estimates for generated ffmpeg commands (`/estimate`).
+
+The command runs unchanged on a few short windows spread through the input
+(input-side `-ss`/`-t`, output written to a temp dir). The encode speed and
+output bytes per second of media measured there are scaled to the full ffprobe
+duration. CPU time comes from the rusage of each sample process, so the
+estimate also shows how many cores the command keeps busy.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .defaults import DEFAULT_SAMPLE_S, DEFAULT_SAMPLES
+from .ffcmd import ffmpeg_argv
+from .progress import STDERR_SHOWN_ON_ERROR, ProgressState, _fmt_hms, expected_duration, input_paths
+
+AUTO_MIN_DURATION_S = 300.0  # below this, sampling costs about as much as just running it
+
+# options that move or cut the timeline and would fight the injected -ss/-t
+_REFUSED = {"-ss", "-sseof", "-to", "-stream_loop", "-frames", "-vframes", "-aframes", "-fs"}
+_STDOUT_TARGETS = {"-", "pipe:", "pipe:1", "/dev/stdout"}
+# options that write files of their own, next to (or instead of) the output
+_SIDE_FILES = {"-pass", "-passlogfile", "-hls_segment_filename", "-hls_fmp4_init_filename", "-segment_list",
+               "-vstats", "-vstats_file", "-report", "-dump_attachment", "-master_pl_name"}
+# options that take no value, so the next token may be an output
+_FLAGS = {"-y", "-n", "-an", "-vn", "-sn", "-dn", "-shortest", "-nostdin", "-stdin", "-hide_banner", "-stats",
+          "-nostats", "-copyts", "-start_at_zero", "-re", "-accurate_seek", "-noaccurate_seek", "-bitexact",
+          "-benchmark", "-benchmark_all", "-xerror", "-ignore_unknown", "-copy_unknown", "-autorotate",
+          "-noautorotate", "-autoscale", "-noautoscale", "-debug_ts"}
+
+
+@dataclass
+class Sample:
+    start: float
+    media_s: float  # seconds of output actually produced
+    wall_s: float
+    cpu_s: Optional[float]
+    bytes: int
+
+
+@dataclass
+class Estimate:
+    duration: Optional[float]
+    samples: list[Sample]
+
+    @property
+    def speed(self) -> Optional[float]:
+        """Media seconds encoded per wall second, over all samples."""
+        wall = sum(s.wall_s for s in self.samples)
+        media = sum(s.media_s for s in self.samples)
+        return media / wall if wall > 0 and media > 0 else None
+
+    @property
+    def cores(self) -> Optional[float]:
+        if any(s.cpu_s is None for s in self.samples):
+            return None
+        wall = sum(s.wall_s for s in self.samples)
+        return sum(s.cpu_s or 0.0 for s in self.samples) / wall if wall > 0 else None
+
+    @property
+    def wall_s(self) -> Optional[float]:
+        speed = self.speed
+        return self.duration / speed if self.duration and speed else None
+
+    @property
+    def size_bytes(self) -> Optional[float]:
+        media = sum(s.media_s for s in self.samples)
+        if not self.duration or media <= 0:
+            return None
+        return sum(s.bytes for s in self.samples) / media * self.duration
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+def output_positions(argv: list[str]) -> list[int]:
+    """Indexes of the output files in argv (tokens that are neither options nor option values)."""
+    out = []
+    i = 1
+    while i < len(argv):
+        tok = argv[i]
+        if tok.startswith("-") and len(tok) > 1:
+            i += 1 if tok.split(":", 1)[0] in _FLAGS else 2
+        else:
+            out.append(i)
+            i += 1
+    return out
+
+
+def check_command(command: str) -> list[str]:
+    """argv of a command /estimate can sample; ValueError explaining why not.
+
+    Samples are written into a temp dir, so the command must have exactly one
+    output (the last argument) and no options that write files elsewhere.
+    """
+    argv = ffmpeg_argv(command)
+    if argv is None:
+        raise ValueError("not a plain ffmpeg command (pipes/redirections aren't supported)")
+    if not input_paths(argv):
+        raise ValueError("no -i input")
+    refused = sorted({tok for tok in argv if tok.split(":", 1)[0] in _REFUSED})
+    if refused:
+        raise ValueError(f"cannot sample commands using {', '.join(refused)}")
+    side = sorted({tok for tok in argv if tok.split(":", 1)[0] in _SIDE_FILES})
+    if side:
+        raise ValueError(f"cannot sample commands that write extra files ({', '.join(side)})")
+    if argv[-1].startswith("-") or argv[-1] in _STDOUT_TARGETS or argv[-2:-1] == ["-i"]:
+        raise ValueError("could not find the output file (it must be the last argument)")
+    outputs = output_positions(argv)
+    if outputs != [len(argv) - 1]:
+        raise ValueError("cannot sample commands with more than one output")
+    if "tee" in (argv[i + 1] for i, tok in enumerate(argv[:-1]) if tok == "-f"):
+        raise ValueError("cannot sample the tee muxer (it writes several outputs)")
+    return argv
+
+
+def sample_starts(duration: Optional[float], n: int, length: float) -> list[float]:
+    """Start times of n non-overlapping windows spread evenly through the input."""
+    if not duration:
+        return [0.0]
+    n = max(1, min(n, int(duration // length) or 1))
+    starts = []
+    for k in range(n):
+        start = max(0.0, min(duration * (k + 0.5) / n - length / 2, duration - length))
+        if not starts or start >= starts[-1] + length:
+            starts.append(start)
+    return starts
+
+
+def sample_argv(argv: list[str], start: float, length: float, outdir: Path) -> list[str]:
+    """argv with every input limited to [start, start+length] and the output moved into outdir.
+
+    argv must have passed check_command: -y then only ever applies inside outdir.
+    """
+    out = [argv[0], "-nostdin", "-hide_banner", "-y", "-progress", "pipe:1", "-nostats"]
+    for tok in argv[1:-1]:
+        if tok == "-i":
+            out += ["-ss", f"{start:.3f}", "-t", f"{length:.3f}"]
+        if tok not in ("-y", "-n"):
+            out.append(tok)
+    out.append(str(outdir / Path(argv[-1]).name))
+    return out
+
+
+def _input_duration(argv: list[str], probe_index=None) -> Optional[float]:
+    if probe_index is not None:
+        return expected_duration(argv, probe_index)
+    # probing is off for prompts, but the length is needed here
+    from .media import ProbeIndex
+
+    index = ProbeIndex()
+    try:
+        return expected_duration(argv, index)
+    finally:
+        index.close()
+
+
+def _reap(proc: subprocess.Popen) -> Optional[float]:
+    """Wait for proc; its CPU seconds (user + system) where the platform reports them."""
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_sample(argv: list[str]) -> tuple[int, float, Optional[float], ProgressState, list[str]]:
+    """(rc, wall_s, cpu_s, progress, stderr lines) for one sample run."""
+    state = ProgressState()
+    ring: deque[str] = deque(maxlen=STDERR_SHOWN_ON_ERROR)
+    t0 = time.monotonic()
+    proc = subprocess.Popen(
+        argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace"
+    )
+    assert proc.stdout is not None and proc.stderr is not None
+    t = threading.Thread(target=ring.extend, args=(proc.stderr,), name="wtff-estimate-stderr", daemon=True)
+    t.start()
+    try:
+        for line in proc.stdout:
+            state.feed_line(line)
+        cpu_s = _reap(proc)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    t.join(timeout=2)
+    return proc.returncode, time.monotonic() - t0, cpu_s, state, [line.rstrip() for line in ring]
+
+
+def estimate(command: str, *, samples: int = DEFAULT_SAMPLES, length: float = DEFAULT_SAMPLE_S,
+             probe_index=None, min_duration: float = 0.0) -> Optional[Estimate]:
+    """Sample-encode command and print the extrapolated wall time, size and CPU use.
+
+    Returns None (after saying why) when the command can't be sampled or a sample
+    fails. With min_duration (the automatic mode), commands that can't be sampled
+    and inputs shorter than that are skipped silently.
+    """
+    try:
+        argv = check_command(command)
+    except ValueError as e:
+        if not min_duration:
+            print(f"Cannot estimate: {e}", file=sys.stderr)
+        return None
+    duration = _input_duration(argv, probe_index)
+    if min_duration and (duration or 0.0) < min_duration:
+        return None
+    length = float(max(1, length))
+    starts = sample_starts(duration, samples, length)
+    total = f" of {_fmt_hms(duration)}" if duration else ""
+    print(f"Estimating: {len(starts)} x {length:.0f}s samples{total} (Ctrl-C to skip)...")
+
+    result = Estimate(duration, [])
+    tmp = Path(tempfile.mkdtemp(prefix="wtff-estimate-"))
+    try:
+        for k, start in enumerate(starts):
+            outdir = tmp / f"sample{k}"
+            outdir.mkdir()
+            rc, wall, cpu_s, state, stderr = run_sample(sample_argv(argv, start, length, outdir))
+            if rc != 0:
+                tail = "\n".join(stderr)
+                print(f"Sample at {_fmt_hms(start)} failed (rc {rc}):\n{tail}", file=sys.stderr)
+                return None
+            size = sum(p.stat().st_size for p in outdir.rglob("*") if p.is_file())
+            media_s = state.out_time or min(length, (duration or length) - start)
+            result.samples.append(Sample(start, media_s, wall, cpu_s, size))
+    except KeyboardInterrupt:
+        print("Estimate cancelled.", file=sys.stderr)
+        return None
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Cannot estimate: {e}", file=sys.stderr)
+        return None
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(describe(result))
+    return result
+
+
+def describe(est: Estimate) -> str:
+    speed = est.speed
+    parts = [f"speed {speed:.2f}x" if speed else "speed unknown"]
+    if est.wall_s is not None:
+        parts.insert(0, f"~{_fmt_hms(est.wall_s)} wall")
+    if est.size_bytes is not None:
+        parts.append(f"output ~{_fmt_bytes(est.size_bytes)}")
+    cores = est.cores
+    if cores is not None:
+        ncpu = os.cpu_count() or 1
+        parts.append(f"CPU {cores:.1f} cores ({100 * cores / ncpu:.0f}% of {ncpu})")
+    if not est.duration:
+        parts.append("input duration unknown, so no total")
+    return "Estimate: " + ", ".join(parts)
@@ -0,0 +1,52 @@
+"""Small helpers for taking generated ffmpeg command lines apart."""
+from __future__ import annotations
+
+import os
+import shlex
+from typing import Optional
+
+# Tokens that end the ffmpeg invocation proper (pipes, redirections, lists).
+SHELL_OPERATORS = {"|", "||", "&", "&&", ";", ";;", "<", ">", ">>", ">&", "<&", "|&", "(", ")"}
+
+
+def join_continuations(command: str) -> str:
+    """command with backslash-newline continuations joined into one line."""
+    return command.replace("\\\r\n", " ").replace("\\\n", " ")
+
+
+def one_line(command: str) -> str:
+    """command flattened onto one line (for the REPL prompt), continuations joined first."""
+    return " ".join(join_continuations(command).splitlines()).strip()
+
+
+def shell_split(command: str) -> tuple[list[str], bool]:
+    """
+    Split a shell command line into argv.
+
+    Returns (argv, plain): argv stops at the first shell operator, and plain
+    is False if there was anything after it (pipes, redirections, && ...).
+    Backslash-newline continuations are joined first.
+    """
+    command = join_continuations(command)
+    lex = shlex.shlex(command, posix=True, punctuation_chars=True)
+    lex.whitespace_split = True
+    argv: list[str] = []
+    try:
+        for tok in lex:
+            if tok in SHELL_OPERATORS or (tok and set(tok) <= set("|&;<>()")):
+                if tok[0] in "<>" and argv and argv[-1].isdigit():
+                    argv.pop()  # fd number of a redirection like 2>&1
+                return argv, False
+            argv.append(tok)
+    except ValueError:
+        # unbalanced quotes; fall back to whitespace
+        return command.split(), False
+    return argv, True
+
+
+def ffmpeg_argv(command: str) -> Optional[list[str]]:
+    """argv of a plain `ffmpeg ...` command, or None if it isn't one."""
+    argv, plain = shell_split(command)
+    if not plain or not argv or os.path.basename(argv[0]) != "ffmpeg":
+        return None
+    return argv
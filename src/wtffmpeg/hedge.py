@@ -0,0 +1,218 @@
+"""Hedged requests (`hedge=true`).
+
+HedgedClient wraps the client from build_client. When a request has not
+produced its first streamed chunk (or, unstreamed, its reply) within the p95
+of recently observed times, a duplicate is sent -- to the next-best endpoint
+when several are configured -- and whichever answers first is used. The other
+one is closed as soon as it yields anything, which stops the server decoding.
+
+Until enough requests have been seen to estimate the p95 (or with a fixed
+hedge_after_ms) nothing is duplicated; at most one extra request is ever sent.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Optional
+
+from .metrics import percentile
+
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+HEDGE_MIN_DELAY_S = 0.05
+
+_END = object()
+
+
+class _Attempt:
+    """One request running in its own thread; stream chunks are handed over through a queue."""
+
+    def __init__(self, race: "_Race", create, kwargs: dict, index: int):
+        self.race = race
+        self.index = index
+        self.stream = bool(kwargs.get("stream"))
+        self.chunks: queue.Queue = queue.Queue()
+        self.cancelled = threading.Event()
+        self.t0 = time.perf_counter()
+        self.first_s: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.url: Optional[str] = None
+        threading.Thread(target=self._run, args=(create, kwargs), name=f"wtff-hedge-{index}", daemon=True).start()
+
+    @property
+    def ready(self) -> bool:
+        """Has something to hand to the caller (a first chunk, a reply, or a clean empty stream)."""
+        return self.error is None and (self.first_s is not None or self.result is not None or self.done)
+
+    def _run(self, create, kwargs: dict) -> None:
+        resp = None
+        try:
+            resp = create(**kwargs)
+            self.url = getattr(self.race.inner, "last_url", None)  # per-thread in the router
+            if not self.stream:
+                self.result = resp
+                self.first_s = time.perf_counter() - self.t0
+                return
+            for chunk in resp:
+                if self.cancelled.is_set():
+                    break
+                if self.first_s is None:
+                    self.first_s = time.perf_counter() - self.t0
+                    self.race.notify()
+                self.chunks.put(chunk)
+        except Exception as e:
+            self.error = e
+        finally:
+            if self.stream and resp is not None:
+                close = getattr(resp, "close", None)
+                if close is not None:
+                    try:
+                        close()
+                    except Exception:
+                        pass
+            self.done = True
+            self.chunks.put(_END)
+            self.race.notify()
+
+
+class _Race:
+    def __init__(self, inner):
+        self.inner = inner
+        self.attempts: list[_Attempt] = []
+        self._cond = threading.Condition()
+
+    def start(self, create, kwargs: dict) -> _Attempt:
+        a = _Attempt(self, create, kwargs, len(self.attempts))
+        self.attempts.append(a)
+        return a
+
+    def notify(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+
+    def first(self, timeout: Optional[float] = None) -> Optional[_Attempt]:
+        """The first attempt with something to show; None on timeout; raises if all of them failed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for a in self.attempts:
+                    if a.ready:
+                        return a
+                if all(a.done for a in self.attempts):
+                    raise self.attempts[0].error  # type: ignore[misc]
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                # short waits keep Ctrl-C responsive in the caller's thread
+                self._cond.wait(0.25 if remaining is None else min(0.25, remaining))
+
+    def cancel(self, keep: Optional[_Attempt] = None) -> None:
+        for a in self.attempts:
+            if a is not keep:
+                a.cancelled.set()
+
+
+class _HedgedStream:
+    """The winning attempt's chunks; close() stops every attempt."""
+
+    def __init__(self, race: _Race, winner: _Attempt):
+        self._race = race
+        self._winner = winner
+
+    def __iter__(self):
+        while True:
+            chunk = self._winner.chunks.get()
+            if chunk is _END:
+                if self._winner.error is not None:
+                    raise self._winner.error
+                return
+            yield chunk
+
+    def close(self) -> None:
+        self._race.cancel()
+
+
+class HedgedClient:
+    """Drop-in wrapper: same `chat.completions.create`, everything else passed through."""
+
+    def __init__(self, inner, *, after_s: float = 0.0, quantile: float = HEDGE_QUANTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, window: int = HEDGE_WINDOW):
+        self.inner = inner
+        self.after_s = after_s
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.hedged = 0  # requests that got a duplicate
+        self.hedge_wins = 0  # ... where the duplicate answered first
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def __getattr__(self, name: str) -> Any:
+        # models, base_url, ping, endpoints, close, ...
+        return getattr(self.inner, name)
+
+    @property
+    def last_url(self) -> Optional[str]:
+        return getattr(self._local, "url", None) or getattr(self.inner, "last_url", None)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait for a first chunk before hedging; None while there's too little data."""
+        if self.after_s > 0:
+            return self.after_s
+        with self._lock:
+            xs = list(self._samples)
+        if len(xs) < self.min_samples:
+            return None
+        return max(HEDGE_MIN_DELAY_S, percentile(xs, self.quantile) or 0.0)
+
+    def _observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def _create(self, **kwargs) -> Any:
+        race = _Race(self.inner)
+        race.start(self.inner.chat.completions.create, kwargs)
+        try:
+            winner = race.first(timeout=self.delay())
+            if winner is None:
+                # too slow: one duplicate, preferably elsewhere
+                with self._lock:
+                    self.hedged += 1
+                create = getattr(self.inner, "create_hedge", None) or self.inner.chat.completions.create
+                race.start(create, kwargs)
+                winner = race.first()
+                if winner.index > 0:
+                    with self._lock:
+                        self.hedge_wins += 1
+        except BaseException:
+            race.cancel()
+            raise
+        race.cancel(keep=winner)
+        if winner.first_s is not None:
+            self._observe(winner.first_s)
+        self._local.url = winner.url
+        if not winner.stream:
+            return winner.result
+        return _HedgedStream(race, winner)
+
+
+def unhedged(client):
+    """The client under HedgedClient (through a LazyClient too), for requests that mustn't be timed."""
+    resolve = getattr(client, "resolve", None)
+    if resolve is not None:
+        client = resolve()
+    return client.inner if isinstance(client, HedgedClient) else client
+
+
+def hedge_client(client, cfg):
+    """Wrap client for hedging when cfg.hedge is on."""
+    if not getattr(cfg, "hedge", False):
+        return client
+    return HedgedClient(client, after_s=getattr(cfg, "hedge_after_ms", 0) / 1000)
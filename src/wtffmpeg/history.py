@@ -0,0 +1,209 @@
+"""Indexed REPL history in ~/.wtffmpeg/history.sqlite3.
+
+prompt_toolkit's FileHistory parses the whole ~/.wtff_history at every start,
+and AutoSuggestFromHistory scans all of it on every keystroke. Here each
+distinct line is one row (re-entering a line moves it to the front). Up/Down
+load only the most recent NAVIGATION_LIMIT entries, in a background thread.
+Suggestions are a prefix range query on the UNIQUE(text) index, and /history
+search goes through an FTS5 trigram index (LIKE where SQLite lacks it). Only
+the newest history_max entries are kept. An existing ~/.wtff_history is
+imported once and left in place.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
+from prompt_toolkit.history import FileHistory, History
+
+from .defaults import DEFAULT_HISTORY_MAX
+
+DEFAULT_HISTORY_PATH = Path.home() / ".wtffmpeg" / "history.sqlite3"
+LEGACY_HISTORY_PATH = Path.home() / ".wtff_history"
+NAVIGATION_LIMIT = 1000  # entries Up/Down walk through; older ones are reached by search
+PRUNE_EVERY = 100  # stores between retention passes
+
+
+class SQLiteHistory(History):
+    """prompt_toolkit History backed by SQLite; safe to share between concurrent REPLs."""
+
+    def __init__(self, path: Path | None = None, *, max_entries: int = DEFAULT_HISTORY_MAX,
+                 legacy: Path | None = LEGACY_HISTORY_PATH):
+        super().__init__()
+        self.path = Path(path or DEFAULT_HISTORY_PATH).expanduser()
+        self.max_entries = max_entries
+        self.legacy = legacy
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._fts = False
+        self._stores = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # caller holds _lock
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " id INTEGER PRIMARY KEY,"
+                " text TEXT NOT NULL UNIQUE,"
+                " ts REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            had_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'entries_fts'").fetchone()
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts"
+                    " USING fts5(text, content='entries', content_rowid='id', tokenize='trigram')"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN"
+                    " INSERT INTO entries_fts(rowid, text) VALUES (new.id, new.text); END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN"
+                    " INSERT INTO entries_fts(entries_fts, rowid, text) VALUES ('delete', old.id, old.text); END"
+                )
+                if not had_fts:
+                    # rows written by a SQLite without trigram support aren't indexed yet
+                    conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+                self._fts = True
+            except sqlite3.OperationalError:
+                pass  # no FTS5 or no trigram tokenizer (SQLite < 3.34); search falls back to LIKE
+            conn.commit()
+            self._conn = conn
+            self._import_legacy(conn)
+        return self._conn
+
+    def _import_legacy(self, conn: sqlite3.Connection) -> None:
+        if self.legacy is None or not Path(self.legacy).is_file():
+            return
+        key = f"imported:{Path(self.legacy).resolve()}"
+        if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+            return
+        lines = list(FileHistory(str(self.legacy)).load_history_strings())  # newest first
+        now = time.time()
+        with conn:
+            for text in reversed(lines[: self.max_entries or None]):
+                self._put(conn, text, now)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(len(lines))))
+        self._prune(conn)
+
+    @staticmethod
+    def _put(conn: sqlite3.Connection, text: str, ts: float) -> None:
+        # delete + insert rather than INSERT OR REPLACE, which wouldn't fire the FTS delete trigger
+        conn.execute("DELETE FROM entries WHERE text = ?", (text,))
+        conn.execute("INSERT INTO entries (text, ts) VALUES (?, ?)", (text, ts))
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        if self.max_entries <= 0:
+            return
+        with conn:
+            conn.execute(
+                "DELETE FROM entries WHERE id <= (SELECT id FROM entries ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    # --- prompt_toolkit History ---
+
+    def load_history_strings(self) -> Iterable[str]:
+        with self._lock:
+            try:
+                rows = self._db().execute(
+                    "SELECT text FROM entries ORDER BY id DESC LIMIT ?", (NAVIGATION_LIMIT,)
+                ).fetchall()
+            except sqlite3.Error:
+                return []
+        return [text for (text,) in rows]
+
+    def store_string(self, string: str) -> None:
+        with self._lock:
+            try:
+                conn = self._db()
+                with conn:
+                    self._put(conn, string, time.time())
+                self._stores += 1
+                if self._stores % PRUNE_EVERY == 0:
+                    self._prune(conn)
+            except sqlite3.Error:
+                pass
+
+    # --- lookups ---
+
+    def suggest(self, prefix: str) -> Optional[str]:
+        """Most recent entry starting with prefix (and longer than it)."""
+        if not prefix:
+            return None
+        with self._lock:
+            try:
+                row = self._db().execute(
+                    "SELECT text FROM entries WHERE text > ? AND text < ? ORDER BY id DESC LIMIT 1",
+                    (prefix, prefix + "\U0010ffff"),
+                ).fetchone()
+            except sqlite3.Error:
+                return None
+        return row[0] if row else None
+
+    def search(self, query: str, limit: int = 20) -> list[str]:
+        """Most recent entries containing query (case-insensitive), newest first."""
+        with self._lock:
+            try:
+                db = self._db()
+                if self._fts and len(query) >= 3:
+                    rows = db.execute(
+                        "SELECT e.text FROM entries_fts f JOIN entries e ON e.id = f.rowid"
+                        " WHERE entries_fts MATCH ? ORDER BY e.id DESC LIMIT ?",
+                        ('"' + query.replace('"', '""') + '"', limit),
+                    ).fetchall()
+                else:
+                    pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                    rows = db.execute(
+                        "SELECT text FROM entries WHERE text LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?",
+                        (pattern, limit),
+                    ).fetchall()
+            except sqlite3.Error:
+                return []
+        return [text for (text,) in rows]
+
+    def prune(self) -> None:
+        """Apply max_entries now instead of at the next retention pass."""
+        with self._lock:
+            try:
+                self._prune(self._db())
+            except sqlite3.Error:
+                pass
+
+    def count(self) -> int:
+        with self._lock:
+            try:
+                return self._db().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            except sqlite3.Error:
+                return 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class IndexedAutoSuggest(AutoSuggest):
+    """AutoSuggestFromHistory, answered by an index lookup instead of a scan."""
+
+    def __init__(self, history: SQLiteHistory):
+        self.history = history
+
+    def get_suggestion(self, buffer, document) -> Optional[Suggestion]:
+        text = document.text.rsplit("\n", 1)[-1]
+        if not text.strip():
+            return None
+        match = self.history.suggest(text)
+        if match is None:
+            return None
+        return Suggestion(match[len(text):].split("\n", 1)[0])
@@ -0,0 +1,228 @@
+"""Background job queue for shell/ffmpeg commands started from the REPL (`!&cmd`).
+
+At most `slots` jobs run at once; the rest wait in FIFO order. Each job gets a
+log file under ~/.wtffmpeg/jobs/ and its own process group, so Ctrl-C at the
+prompt doesn't reach it and /kill can stop the whole pipeline. Plain ffmpeg
+commands also report structured progress (see progress.py) for /jobs.
+"""
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .defaults import DEFAULT_JOB_THREADS
+from .ffcmd import ffmpeg_argv
+from .progress import ProgressState, expected_duration, inject_progress, wants_progress
+
+DEFAULT_JOB_DIR = Path.home() / ".wtffmpeg" / "jobs"
+
+
+def auto_slots(job_threads: int = DEFAULT_JOB_THREADS) -> int:
+    """Concurrent jobs that fit the machine: cores / threads per job, at least 1."""
+    return max(1, (os.cpu_count() or 1) // max(1, job_threads))
+
+
+def resolve_slots(cfg) -> int:
+    slots = getattr(cfg, "job_slots", 0)
+    return slots if slots > 0 else auto_slots(getattr(cfg, "job_threads", DEFAULT_JOB_THREADS))
+
+
+@dataclass
+class Job:
+    id: int
+    command: str
+    log_path: Path
+    state: str = "queued"  # queued | running | done | failed | killed
+    rc: Optional[int] = None
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    proc: Optional[subprocess.Popen] = None
+    progress: Optional[ProgressState] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("queued", "running")
+
+    def describe(self) -> str:
+        if self.state == "running":
+            elapsed = time.time() - (self.started or time.time())
+            extra = f"{elapsed:.0f}s"
+            p = self.progress
+            if p is not None and p.out_time is not None and p.duration:
+                pct = min(100.0, 100.0 * p.out_time / p.duration)
+                extra += f", {pct:.0f}%"
+                if p.speed:
+                    extra += f", ETA {(p.duration - p.out_time) / p.speed:.0f}s"
+            return f"running ({extra})"
+        if self.state == "queued":
+            return "queued"
+        took = (self.finished or 0) - (self.started or self.finished or 0)
+        return f"{self.state} (rc {self.rc}, {took:.0f}s)" if self.rc is not None else self.state
+
+
+class JobQueue:
+    def __init__(self, slots: int, log_dir: Path | None = None, probe_index=None):
+        self.slots = max(1, slots)
+        self.log_dir = Path(log_dir or DEFAULT_JOB_DIR).expanduser()
+        self.probe_index = probe_index
+        self.jobs: dict[int, Job] = {}
+        self._pending: deque[Job] = deque()
+        self._running = 0
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self._finished: deque[Job] = deque()
+
+    # --- submission / scheduling ---
+
+    def submit(self, command: str) -> Job:
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        with self._cond:
+            job_id = self._next_id
+            self._next_id += 1
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            job = Job(id=job_id, command=command, log_path=self.log_dir / f"{stamp}-{os.getpid()}-{job_id}.log")
+            self.jobs[job_id] = job
+            self._pending.append(job)
+            self._start_ready()
+        return job
+
+    def resize(self, slots: int) -> None:
+        with self._cond:
+            self.slots = max(1, slots)
+            self._start_ready()
+
+    def _start_ready(self) -> None:
+        # caller holds _cond
+        while self._pending and self._running < self.slots:
+            job = self._pending.popleft()
+            if job.state != "queued":
+                continue
+            job.state = "running"
+            job.started = time.time()
+            self._running += 1
+            threading.Thread(target=self._run, args=(job,), name=f"wtff-job-{job.id}", daemon=True).start()
+
+    def _run(self, job: Job) -> None:
+        rc = None
+        try:
+            rc = self._execute(job)
+        except Exception as e:
+            with open(job.log_path, "a", encoding="utf-8") as log:
+                log.write(f"\n[wtff] failed to run: {e}\n")
+            rc = -1
+        finally:
+            with self._cond:
+                job.rc = rc
+                job.finished = time.time()
+                if job.state == "running":
+                    job.state = "done" if rc == 0 else "failed"
+                job.proc = None
+                self._running -= 1
+                self._finished.append(job)
+                self._start_ready()
+                self._cond.notify_all()
+
+    def _execute(self, job: Job) -> int:
+        argv = ffmpeg_argv(job.command)
+        track = argv is not None and wants_progress(argv)
+        with open(job.log_path, "w", encoding="utf-8") as log:
+            log.write(f"$ {job.command}\n")
+            log.flush()
+            popen_kw = dict(shell=True, stdin=subprocess.DEVNULL, start_new_session=True)
+            if not track:
+                proc = subprocess.Popen(job.command, stdout=log, stderr=subprocess.STDOUT, **popen_kw)
+                with self._cond:
+                    job.proc = proc
+                    if job.state == "killed":
+                        self._signal(proc)
+                return proc.wait()
+
+            job.progress = ProgressState(expected_duration(argv, self.probe_index))
+            proc = subprocess.Popen(
+                inject_progress(job.command),
+                stdout=subprocess.PIPE,
+                stderr=log,
+                text=True,
+                errors="replace",
+                **popen_kw,
+            )
+            with self._cond:
+                job.proc = proc
+                if job.state == "killed":
+                    self._signal(proc)
+            assert proc.stdout is not None
+            for line in proc.stdout:
+                job.progress.feed_line(line)
+            return proc.wait()
+
+    # --- control ---
+
+    @staticmethod
+    def _signal(proc: subprocess.Popen, sig: int = signal.SIGTERM) -> None:
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def kill(self, job_id: int) -> bool:
+        """Cancel a queued job or terminate a running one. False if it isn't active."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or not job.active:
+                return False
+            was_queued = job.state == "queued"
+            job.state = "killed"
+            if was_queued:
+                job.finished = time.time()
+                self._finished.append(job)
+                self._cond.notify_all()
+            elif job.proc is not None:
+                self._signal(job.proc)
+        return True
+
+    def kill_all(self) -> int:
+        return sum(self.kill(j.id) for j in list(self.jobs.values()) if j.active)
+
+    def wait(self, job_id: int | None = None, timeout: float | None = None) -> bool:
+        """Block until one job (or all) finishes. True if nothing is left to wait for."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if job_id is None:
+                    pending = any(j.active or (j.state == "killed" and j.proc) for j in self.jobs.values())
+                else:
+                    job = self.jobs.get(job_id)
+                    pending = job is not None and (job.active or (job.state == "killed" and job.proc is not None))
+                if not pending:
+                    return True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # short waits keep Ctrl-C responsive in the main thread
+                self._cond.wait(0.25 if remaining is None else min(0.25, remaining))
+
+    # --- reporting ---
+
+    def counts(self) -> tuple[int, int]:
+        """(running, queued)."""
+        with self._cond:
+            return self._running, sum(1 for j in self._pending if j.state == "queued")
+
+    def drain_finished(self) -> list[Job]:
+        """Jobs that finished since the last call (for notifications)."""
+        with self._cond:
+            out = list(self._finished)
+            self._finished.clear()
+        return out
+
+    def snapshot(self) -> list[Job]:
+        with self._cond:
+            return sorted(self.jobs.values(), key=lambda j: j.id)
@@ -1,10 +1,28 @@
 from __future__ import annotations
-from openai import OpenAI
-from typing import Tuple
+from typing import TYPE_CHECKING, Any, Callable, Optional, Tuple
 from pathlib import Path
+import re
 import sys
+import threading
+import time
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 from .config import AppConfig, resolve_config
+from .cache import ResponseCache, cache_key
+from .conversation import estimate_tokens
+from .metrics import MetricsLog, RequestStats
+from .startup import TRACE
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+# "ffmpeg -i ...", "ffmpeg -y ...", "ffmpeg \" -- but not prose like "ffmpeg can do this:"
+_COMMAND_LINE_RE = re.compile(r"ffmpeg(?:\.exe)?(?:\s+[-\\]|\s*\\$)")
+
+
+def _is_command_line(line: str) -> bool:
+    line = line.strip()
+    return bool(_COMMAND_LINE_RE.match(line)) and not line.endswith(":")
 
 def verify_connection(client: OpenAI, base_url: str | None) -> None:
     """
@@ -14,7 +32,7 @@ def verify_connection(client: OpenAI, base_url: str | None) -> None:
         # Cheap request; no tokens.
         client.models.list()
     except Exception as e:
-        target = base_url or "https://api.openai.com/v1"
+        target = base_url or OPENAI_BASE_URL
         parts = [f"Unable to reach LLM endpoint: {target}",
                  f"Underlying error: {type(e).__name__}: {e!r}"]
 
@@ -28,51 +46,340 @@ def verify_connection(client: OpenAI, base_url: str | None) -> None:
 
         raise RuntimeError("\n".join(parts)) from e
 
-def generate_ffmpeg_command(messages: list[dict], client: OpenAI, model: str) -> Tuple[str, str]:
-    """Generate a single ffmpeg command from the LLM, and try to strip markdown/commentary."""
+def extract_ffmpeg_command(raw: str) -> str:
+    """Strip markdown/commentary from a model reply; return the ffmpeg command or ''."""
+    text = raw.strip()
+
+    # strip fenced blocks if present
+    if "```" in text:
+        parts = text.split("```")
+        if len(parts) >= 2:
+            text = parts[1].strip()
+            if text.lower().startswith(("bash", "sh")):
+                text = text.split("\n", 1)[1].strip() if "\n" in text else ""
+
+    if text.lower().startswith("assistant:"):
+        text = text[len("assistant:"):].strip()
+
+    if text.startswith("`") and text.endswith("`"):
+        text = text.strip("`")
+    if not _is_command_line(text.split("\n", 1)[0]):
+        # maybe it's a comment + command; try to extract the command
+        lines = text.splitlines()
+        for i, line in enumerate(lines):
+            line = line.strip()
+            if _is_command_line(line):
+                # keep backslash-continued lines with the command
+                j = i
+                while lines[j].rstrip().endswith("\\") and j + 1 < len(lines):
+                    j += 1
+                text = "\n".join([line] + [l.rstrip() for l in lines[i + 1:j + 1]])
+                break
+    if _is_command_line(text.split("\n", 1)[0]):
+        return text
+    return ""
+
+
+class CommandExtractor:
+    """
+    Incremental companion to extract_ffmpeg_command for streamed replies.
+
+    Feed it text deltas as they arrive; `complete` flips to True as soon as the
+    buffer holds a whole command (a closed ``` fence, or a finished `ffmpeg -...`
+    line with no trailing backslash continuation), so the caller can stop
+    reading the stream. Prose that merely starts with "ffmpeg" doesn't count.
+    """
+
+    def __init__(self):
+        self._parts: list[str] = []
+        self._scanned = 0  # offset of the first line not yet inspected
+        self._in_cmd = False  # inside a backslash-continued ffmpeg line
+        self.complete = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed(self, delta: str) -> bool:
+        if self.complete or not delta:
+            return self.complete
+        self._parts.append(delta)
+        buf = self.text
+
+        fence = buf.find("```")
+        if fence != -1:
+            # a fenced reply is complete once the fence closes
+            self.complete = buf.find("```", fence + 3) != -1
+            return self.complete
+
+        while True:
+            nl = buf.find("\n", self._scanned)
+            if nl == -1:
+                break
+            line = buf[self._scanned:nl].strip()
+            self._scanned = nl + 1
+            if line.lower().startswith("assistant:"):
+                line = line[len("assistant:"):].strip()
+            line = line.strip("`")
+            if self._in_cmd or _is_command_line(line):
+                self._in_cmd = line.endswith("\\")
+                if not self._in_cmd:
+                    self.complete = True
+                    break
+        return self.complete
+
+
+def client_base_url(client) -> str | None:
+    for attr in ("base_url", "_base_url"):
+        v = getattr(client, attr, None)
+        if v:
+            return str(v).rstrip("/")
+    return None
+
+
+def generate_ffmpeg_command(
+    messages: list[dict],
+    client: OpenAI,
+    model: str,
+    *,
+    cache: Optional[ResponseCache] = None,
+    stream: bool = False,
+    on_token: Optional[Callable[[str], None]] = None,
+    raise_errors: bool = False,
+    validator: Optional[Callable[[str], list[str]]] = None,
+    max_repairs: int = 1,
+    metrics: Optional[MetricsLog] = None,
+    params: Optional[dict] = None,
+) -> Tuple[str, str]:
+    """Generate a single ffmpeg command from the LLM, and try to strip markdown/commentary.
+
+    With a cache, identical (model, endpoint, messages) requests are answered from disk.
+    With stream=True the reply is read incrementally (each delta is passed to on_token)
+    and the stream is closed as soon as a complete command has arrived. A
+    KeyboardInterrupt during generation closes the request and propagates.
+    With a validator, a command it rejects is sent back to the model with the
+    specific problems, up to max_repairs times.
+    With metrics, each model call (repairs included) is recorded as a RequestStats.
+    params are extra create() arguments from generation_params() (max_tokens, stop, ...).
+    Other errors are reported on stderr and yield ("", "") unless raise_errors is set.
+    """
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.0,
-        )
-        raw = (resp.choices[0].message.content or "").strip()
-        text = raw
-
-
-        # strip fenced blocks if present
-        if "```" in text:
-            parts = text.split("```")
-            if len(parts) >= 2:
-                text = parts[1].strip()
-                if text.lower().startswith(("bash", "sh")):
-                    text = text.split("\n", 1)[1].strip()
-
-        if text.lower().startswith("assistant:"):
-            text = text[len("assistant:"):].strip()
-
-        if text.startswith("`") and text.endswith("`"):
-            text = text.strip("`")
-        if not text.lower().startswith("ffmpeg"):
-            # maybe it's a comment + command; try to extract the command
-            lines = text.splitlines()
-            for line in lines:
-                line = line.strip()
-                if line.startswith("ffmpeg"):
-                    text = line
-                    break   
-        if text.lower().startswith("ffmpeg"):
-            return raw, text
-        else:
-            return raw, ""
+        raw = _complete(messages, client, model, cache=cache, stream=stream, on_token=on_token, metrics=metrics,
+                        params=params)
+        text = extract_ffmpeg_command(raw)
+
+        repairs = max_repairs
+        while validator is not None and text:
+            problems = validator(text)
+            if not problems:
+                break
+            if repairs <= 0:
+                print("Warning: command may be invalid: " + " ".join(problems), file=sys.stderr)
+                break
+            repairs -= 1
+            print("Generated command failed validation; asking the model to fix it.", file=sys.stderr)
+            messages = messages + [
+                {"role": "assistant", "content": raw},
+                {"role": "user", "content": repair_prompt(text, problems)},
+            ]
+            raw = _complete(messages, client, model, cache=cache, stream=stream, on_token=on_token, metrics=metrics,
+                        params=params)
+            text = extract_ffmpeg_command(raw)
+        return raw, text
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error during model inference: {e}", file=sys.stderr)
         return "", ""
 
 
+def repair_prompt(command: str, problems: list[str]) -> str:
+    return (
+        "That command is not valid for the installed ffmpeg:\n"
+        + "\n".join(f"- {p}" for p in problems)
+        + "\nReply with a corrected single ffmpeg command only."
+    )
+
+
+def _complete(messages, client, model, *, cache, stream, on_token, metrics=None, params=None) -> str:
+    """Raw reply text for messages, from the cache when possible."""
+    t0 = time.perf_counter()
+    key = None
+    if cache is not None:
+        key = cache_key(model, client_base_url(client), messages, **({"params": params} if params else {}))
+        raw = cache.get(key)
+        if raw is not None:
+            if metrics is not None:
+                metrics.record(RequestStats(model=model, endpoint="cache", wall_s=time.perf_counter() - t0,
+                                            stream=stream, cached=True))
+            return raw
+
+    stats = RequestStats(model=model, endpoint="", wall_s=0.0, stream=stream)
+    try:
+        if stream:
+            raw, ttft, chunks = _stream_completion(messages, client, model, on_token, params)
+            # deltas are roughly one token each; a reply cut short has no usage block
+            stats.ttft_s, stats.completion_tokens, stats.estimated = ttft, chunks, True
+        else:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.0,
+                **(params or {}),
+            )
+            raw = (resp.choices[0].message.content or "").strip()
+            usage = getattr(resp, "usage", None)
+            if usage is not None:
+                stats.prompt_tokens = usage.prompt_tokens
+                stats.completion_tokens = usage.completion_tokens
+    except BaseException as e:
+        stats.error = "cancelled" if isinstance(e, KeyboardInterrupt) else f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if metrics is not None:
+            stats.wall_s = time.perf_counter() - t0
+            stats.endpoint = getattr(client, "last_url", None) or client_base_url(client) or ""
+            if stats.prompt_tokens is None:
+                stats.prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+                stats.estimated = True
+            metrics.record(stats)
+
+    if key is not None and extract_ffmpeg_command(raw):
+        cache.put(key, raw)
+    return raw
+
+
+def _stream_completion(messages, client, model, on_token, params=None) -> tuple[str, Optional[float], int]:
+    """Stream a reply until a command is complete; returns (text, time to first token, deltas)."""
+    t0 = time.perf_counter()
+    ttft: Optional[float] = None
+    chunks = 0
+    extractor = CommandExtractor()
+    resp = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.0,
+        stream=True,
+        **(params or {}),
+    )
+    try:
+        for chunk in resp:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if not delta:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - t0
+            chunks += 1
+            if on_token is not None:
+                on_token(delta)
+            if extractor.feed(delta):
+                break
+    finally:
+        # Closing early tells the server to stop decoding the rest of the reply.
+        close = getattr(resp, "close", None)
+        if close is not None:
+            close()
+    return extractor.text.strip(), ttft, chunks
+
+
+GENERATION_KEYS = ("max_tokens", "stop", "reasoning_effort", "num_predict", "num_ctx")
+MAX_STOP_SEQUENCES = 4  # OpenAI's limit; most compatible servers accept at least this many
+
+
+def generation_params(cfg: AppConfig, profile=None) -> dict:
+    """
+    Extra chat.completions.create() arguments bounding how much the model generates.
+
+    Values set in cfg win; unset ones fall back to the profile's front matter.
+    num_predict/num_ctx are Ollama model options and are only sent to compat servers.
+    """
+    merged = {k: v for k, v in (getattr(profile, "params", None) or {}).items() if k in GENERATION_KEYS}
+    for k in GENERATION_KEYS:
+        v = getattr(cfg, k, None)
+        if v:
+            merged[k] = v
+
+    out: dict[str, Any] = {}
+    if merged.get("max_tokens"):
+        # OpenAI's reasoning models only accept the newer name
+        name = "max_completion_tokens" if cfg.provider == "openai" else "max_tokens"
+        out[name] = int(merged["max_tokens"])
+    stop = merged.get("stop")
+    if stop:
+        stop = [stop] if isinstance(stop, str) else [str(s) for s in stop if s]
+        out["stop"] = stop[:MAX_STOP_SEQUENCES]
+    if merged.get("reasoning_effort"):
+        out["reasoning_effort"] = str(merged["reasoning_effort"])
+    options = {k: int(merged[k]) for k in ("num_predict", "num_ctx") if merged.get(k)}
+    if options and cfg.provider != "openai":
+        out["extra_body"] = {"options": options}
+    return out
+
+
 def build_client(cfg: AppConfig) -> OpenAI:
+    # openai (and httpx under it) is the single most expensive import in wtff;
+    # keep it out of module scope so cached/listing paths never pay for it.
+    from openai import Timeout
+
+    from .hedge import hedge_client
+    from .transport import pooled_openai
+
+    if cfg.provider == "local":
+        from .local import LocalClient
+
+        return LocalClient(cfg)
+
+    # read/write/pool share timeout_s; a dead host fails after connect_timeout_s
+    timeout = Timeout(cfg.timeout_s or None, connect=cfg.connect_timeout_s or None)
     if cfg.provider == "openai":
-        return OpenAI(api_key=cfg.openai_api_key)
-    
+        return hedge_client(
+            pooled_openai(cfg, api_key=cfg.openai_api_key, timeout=timeout, max_retries=cfg.max_retries), cfg
+        )
+
     api_key = cfg.bearer_token or "ollama"
-    return OpenAI(base_url=cfg.base_url, api_key=api_key)
\ No newline at end of file
+    if len(cfg.endpoints) > 1:
+        from .router import Endpoint, EndpointRouter
+
+        # the router does the retrying, on the next endpoint rather than the same one
+        return hedge_client(EndpointRouter([
+            Endpoint(url=url, client=pooled_openai(cfg, base_url=url, api_key=api_key, timeout=timeout, max_retries=0))
+            for url in cfg.endpoints
+        ], max_retries=cfg.max_retries), cfg)
+    return hedge_client(pooled_openai(cfg, base_url=cfg.base_url, api_key=api_key, timeout=timeout,
+                                      max_retries=cfg.max_retries), cfg)
+
+
+class LazyClient:
+    """
+    Stand-in for build_client(cfg) that defers construction (and the openai
+    import) until the client is first used. Cache hits never touch it.
+    """
+
+    def __init__(self, cfg: AppConfig):
+        self._cfg = cfg
+        self._client: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str | None:
+        # answer without building: cache keys only need the endpoint
+        if self._client is not None:
+            return client_base_url(self._client)
+        if self._cfg.provider == "local":
+            from .local import local_base_url
+
+            return local_base_url(self._cfg)
+        return self._cfg.base_url or OPENAI_BASE_URL
+
+    def resolve(self) -> OpenAI:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    with TRACE.phase("build client (import openai)"):
+                        self._client = build_client(self._cfg)
+        return self._client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.resolve(), name)
@@ -0,0 +1,164 @@
+"""In-process inference with llama-cpp-python (`provider=local`).
+
+For single-box setups without a GPU server: the GGUF model at model_path is
+loaded once, on first use, and stays resident for the life of the process (the
+REPL or the daemon) across client rebuilds. A RAM prompt cache keeps the KV
+state of recent prompts, so the profile's system prompt is evaluated once and
+its prefix reused by later requests, including other conversations. Requests are
+serialized on the model.
+
+LocalClient answers the small part of the OpenAI client surface wtff uses
+(chat.completions.create, models.list, base_url, close) with OpenAI-shaped
+objects. llama-cpp-python is optional (`pip install wtffmpeg[local]`) and only
+imported when the model is loaded.
+"""
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Iterator, Optional
+
+from .defaults import default_model_name
+
+DEFAULT_LOCAL_CTX = 4096
+PROMPT_CACHE_BYTES = 1 << 30
+
+_resident_lock = threading.Lock()
+_resident: dict[tuple, "_Model"] = {}  # at most one model; a different one replaces it
+
+
+class _Model:
+    def __init__(self, llama: Any):
+        self.llama = llama
+        self.lock = threading.Lock()  # a Llama isn't safe to use from two threads
+
+
+def local_base_url(cfg) -> str:
+    """Stands in for the endpoint URL in cache keys and metrics."""
+    return "local:" + str(Path(cfg.model_path).expanduser()) if cfg.model_path else "local:"
+
+
+def _load(model_path: str, n_ctx: int, n_threads: int) -> _Model:
+    key = (model_path, n_ctx, n_threads)
+    with _resident_lock:
+        model = _resident.get(key)
+        if model is not None:
+            return model
+        try:
+            from llama_cpp import Llama, LlamaRAMCache
+        except ImportError:
+            raise RuntimeError("provider=local needs llama-cpp-python (pip install wtffmpeg[local])") from None
+        _resident.clear()  # drop the previous model before loading the next one
+        llama = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads or None,
+            n_threads_batch=n_threads or None,
+            n_gpu_layers=0,
+            verbose=False,
+        )
+        llama.set_cache(LlamaRAMCache(capacity_bytes=PROMPT_CACHE_BYTES))
+        model = _resident[key] = _Model(llama)
+        return model
+
+
+def _completion(d: dict) -> SimpleNamespace:
+    choice = d["choices"][0]
+    usage = d.get("usage") or {}
+    return SimpleNamespace(
+        id=d.get("id"),
+        model=d.get("model"),
+        choices=[SimpleNamespace(
+            index=0,
+            message=SimpleNamespace(role="assistant", content=(choice.get("message") or {}).get("content")),
+            finish_reason=choice.get("finish_reason"),
+        )],
+        usage=SimpleNamespace(
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            total_tokens=usage.get("total_tokens"),
+        ) if usage else None,
+    )
+
+
+def _chunk(d: dict) -> SimpleNamespace:
+    choices = [
+        SimpleNamespace(index=c.get("index", 0), delta=SimpleNamespace(content=(c.get("delta") or {}).get("content")),
+                        finish_reason=c.get("finish_reason"))
+        for c in d.get("choices") or []
+    ]
+    return SimpleNamespace(id=d.get("id"), model=d.get("model"), choices=choices)
+
+
+class _LocalStream:
+    """Chunks of one streamed reply; holds the model until exhausted or closed."""
+
+    def __init__(self, model: _Model, chunks: Iterator[dict]):
+        self._model = model
+        self._chunks = chunks
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            for d in self._chunks:
+                yield _chunk(d)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        close = getattr(self._chunks, "close", None)
+        try:
+            if close is not None:
+                close()  # stops decoding
+        finally:
+            self._model.lock.release()
+
+
+class LocalClient:
+    """OpenAI-client stand-in over a resident llama.cpp model."""
+
+    def __init__(self, cfg):
+        self.model_path = str(Path(cfg.model_path).expanduser()) if cfg.model_path else ""
+        self.n_ctx = cfg.num_ctx or DEFAULT_LOCAL_CTX
+        self.n_threads = cfg.local_threads
+        self.base_url = local_base_url(cfg)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.models = SimpleNamespace(list=self._list)
+
+    def _model(self) -> _Model:
+        if not self.model_path:
+            raise RuntimeError("provider=local needs model_path=/path/to/model.gguf")
+        if not Path(self.model_path).is_file():
+            raise RuntimeError(f"model_path not found: {self.model_path}")
+        return _load(self.model_path, self.n_ctx, self.n_threads)
+
+    def _list(self) -> SimpleNamespace:
+        # loading the model is this backend's connection check
+        self._model()
+        return SimpleNamespace(data=[SimpleNamespace(id=default_model_name(self.model_path), object="model")])
+
+    def _create(self, *, model: str = "", messages: list[dict], temperature: float = 0.0, stream: bool = False,
+                max_tokens: Optional[int] = None, max_completion_tokens: Optional[int] = None,
+                stop: Optional[list[str]] = None, extra_body: Optional[dict] = None, **_ignored) -> Any:
+        options = (extra_body or {}).get("options") or {}
+        limit = max_tokens or max_completion_tokens or options.get("num_predict") or None
+        m = self._model()
+        m.lock.acquire()
+        try:
+            result = m.llama.create_chat_completion(
+                messages=messages, temperature=temperature, max_tokens=limit, stop=stop or None, stream=stream
+            )
+        except BaseException:
+            m.lock.release()
+            raise
+        if stream:
+            return _LocalStream(m, result)
+        m.lock.release()
+        return _completion(result)
+
+    def close(self) -> None:
+        pass  # the model stays resident for the next client
@@ -0,0 +1,261 @@
+"""ffprobe metadata for local files mentioned in a prompt.
+
+Paths found in the prompt are probed in parallel and summarized compactly, so
+the model can pick the right streams and codecs instead of guessing. Probe
+results are kept in a persistent index keyed by (path, size, mtime), so files
+that have not changed are never probed twice.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shlex
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_PROBE_INDEX_PATH = Path.home() / ".wtffmpeg" / "probe.sqlite3"
+PROBE_TIMEOUT_S = 15.0
+MAX_PROBED_FILES = 8
+
+MEDIA_EXTENSIONS = {
+    ".3gp", ".aac", ".ac3", ".aif", ".aiff", ".ape", ".ass", ".avi", ".bmp", ".caf", ".dts",
+    ".flac", ".flv", ".gif", ".h264", ".h265", ".hevc", ".jpeg", ".jpg", ".m2ts", ".m4a",
+    ".m4v", ".mka", ".mkv", ".mov", ".mp2", ".mp3", ".mp4", ".mpeg", ".mpg", ".mts", ".mxf",
+    ".oga", ".ogg", ".ogv", ".opus", ".png", ".srt", ".ts", ".vob", ".vtt", ".wav", ".webm",
+    ".webp", ".wma", ".wmv", ".y4m",
+}
+
+_STRIP_CHARS = "\"'`,;:!?()[]{}<>"
+
+
+def find_media_paths(prompt: str, cwd: Path | None = None) -> list[Path]:
+    """Return existing files mentioned in the prompt (media extensions, or any existing path)."""
+    base = Path(cwd) if cwd else Path.cwd()
+    try:
+        words = shlex.split(prompt, posix=True)
+    except ValueError:
+        words = prompt.split()
+
+    found: list[Path] = []
+    for w in words:
+        w = w.strip(_STRIP_CHARS).rstrip(".")
+        if not w or w.startswith("-"):
+            continue
+        if Path(w).suffix.lower() not in MEDIA_EXTENSIONS and "/" not in w:
+            continue
+        p = Path(w).expanduser()
+        p = p if p.is_absolute() else base / p
+        try:
+            if not p.is_file():
+                continue
+        except OSError:
+            continue
+        if p not in found:
+            found.append(p)
+        if len(found) >= MAX_PROBED_FILES:
+            break
+    return found
+
+
+def run_ffprobe(path: Path, ffprobe: str = "ffprobe") -> Optional[dict]:
+    try:
+        proc = subprocess.run(
+            [ffprobe, "-v", "error", "-show_streams", "-show_format", "-of", "json", str(path)],
+            capture_output=True,
+            text=True,
+            timeout=PROBE_TIMEOUT_S,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if proc.returncode != 0:
+        return None
+    try:
+        return json.loads(proc.stdout)
+    except json.JSONDecodeError:
+        return None
+
+
+class ProbeIndex:
+    """Persistent ffprobe results keyed by (absolute path, size, mtime_ns)."""
+
+    def __init__(self, path: Path | None = None, *, ffprobe: str | None = None):
+        self.path = Path(path or DEFAULT_PROBE_INDEX_PATH).expanduser()
+        self.ffprobe = ffprobe or shutil.which("ffprobe")
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def available(self) -> bool:
+        return self.ffprobe is not None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS probes ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " info TEXT NOT NULL,"
+                " probed_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _lookup(self, key: str, size: int, mtime_ns: int) -> Optional[dict]:
+        with self._lock:
+            try:
+                row = self._db().execute(
+                    "SELECT info FROM probes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    (key, size, mtime_ns),
+                ).fetchone()
+            except sqlite3.Error:
+                return None
+        return json.loads(row[0]) if row else None
+
+    def _store(self, key: str, size: int, mtime_ns: int, info: dict) -> None:
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO probes (path, size, mtime_ns, info, probed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, size, mtime_ns, json.dumps(info, separators=(",", ":")), time.time()),
+                )
+                db.commit()
+            except sqlite3.Error:
+                pass
+
+    def probe(self, path: Path) -> Optional[dict]:
+        """ffprobe JSON for path, from the index when the file is unchanged."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = str(Path(path).resolve())
+        info = self._lookup(key, st.st_size, st.st_mtime_ns)
+        if info is not None:
+            return info
+        if not self.available:
+            return None
+        info = run_ffprobe(Path(path), self.ffprobe)
+        if info is not None:
+            self._store(key, st.st_size, st.st_mtime_ns, info)
+        return info
+
+    def probe_many(self, paths: list[Path], *, max_workers: int = 4) -> dict[Path, Optional[dict]]:
+        if len(paths) <= 1:
+            return {p: self.probe(p) for p in paths}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+            return dict(zip(paths, pool.map(self.probe, paths)))
+
+    def duration(self, path: Path) -> Optional[float]:
+        info = self.probe(path)
+        try:
+            return float(info["format"]["duration"]) if info else None
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _fmt_duration(seconds: float) -> str:
+    m, s = divmod(seconds, 60)
+    h, m = divmod(int(m), 60)
+    return f"{h}:{m:02d}:{s:05.2f}" if h else f"{m}:{s:05.2f}"
+
+
+def _fmt_rate(rate: str | None) -> str:
+    if not rate or rate in ("0/0", "0"):
+        return ""
+    try:
+        num, den = (rate.split("/") + ["1"])[:2]
+        fps = float(num) / float(den)
+    except (ValueError, ZeroDivisionError):
+        return ""
+    return f" {fps:.3f}".rstrip("0").rstrip(".") + "fps"
+
+
+def summarize(name: str, info: dict) -> str:
+    """One line per file: container, duration, size, bitrate, then each stream."""
+    fmt = info.get("format", {})
+    head = [fmt.get("format_name", "?")]
+    try:
+        head.append(_fmt_duration(float(fmt["duration"])))
+    except (KeyError, ValueError):
+        pass
+    try:
+        head.append(f"{int(fmt['size']) / 1e6:.1f} MB")
+    except (KeyError, ValueError):
+        pass
+    try:
+        head.append(f"{int(fmt['bit_rate']) // 1000} kb/s")
+    except (KeyError, ValueError):
+        pass
+
+    streams = []
+    for st in info.get("streams", []):
+        kind = st.get("codec_type", "?")
+        desc = f"#{st.get('index', '?')} {kind} {st.get('codec_name', '?')}"
+        if kind == "video":
+            if st.get("width"):
+                desc += f" {st['width']}x{st.get('height', '?')}"
+            desc += _fmt_rate(st.get("avg_frame_rate") or st.get("r_frame_rate"))
+            if st.get("pix_fmt"):
+                desc += f" {st['pix_fmt']}"
+        elif kind == "audio":
+            if st.get("sample_rate"):
+                desc += f" {st['sample_rate']}Hz"
+            if st.get("channel_layout") or st.get("channels"):
+                desc += f" {st.get('channel_layout') or str(st['channels']) + 'ch'}"
+        lang = (st.get("tags") or {}).get("language")
+        if lang and lang != "und":
+            desc += f" [{lang}]"
+        if (st.get("disposition") or {}).get("default"):
+            desc += " (default)"
+        streams.append(desc)
+
+    return f"{name} ({', '.join(head)}): " + "; ".join(streams)
+
+
+def augment_prompt(prompt: str, index: Optional[ProbeIndex], cwd: Path | None = None) -> str:
+    """Append ffprobe summaries of any local media files the prompt mentions."""
+    if index is None:
+        return prompt
+    paths = find_media_paths(prompt, cwd)
+    if not paths:
+        return prompt
+    infos = index.probe_many(paths)
+    base = Path(cwd) if cwd else Path.cwd()
+    lines = []
+    for p in paths:
+        info = infos.get(p)
+        if not info:
+            continue
+        try:
+            name = str(p.relative_to(base))
+        except ValueError:
+            name = str(p)
+        lines.append("- " + summarize(name, info))
+    if not lines:
+        return prompt
+    return prompt + "\n\n[media info from ffprobe]\n" + "\n".join(lines)
+
+
+def open_probe_index(cfg) -> Optional[ProbeIndex]:
+    """Return a ProbeIndex for cfg, or None when probing is disabled."""
+    if not getattr(cfg, "probe", True):
+        return None
+    return ProbeIndex()
@@ -0,0 +1,138 @@
+"""Per-request performance telemetry.
+
+Every model call made by generate_ffmpeg_command can be recorded as a
+RequestStats: wall time, time to first token, prompt/completion tokens,
+tokens/sec, endpoint and model. Records go to a small in-memory window for
+`/stats` and the toolbar, and are appended to a size-rotated JSONL file
+(~/.wtffmpeg/metrics.jsonl, .1, .2, ...) so they can be aggregated elsewhere.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .defaults import DEFAULT_METRICS_MAX_MB
+
+DEFAULT_METRICS_PATH = Path.home() / ".wtffmpeg" / "metrics.jsonl"
+METRICS_BACKUPS = 3
+WINDOW = 500
+
+
+@dataclass
+class RequestStats:
+    model: str
+    endpoint: str
+    wall_s: float
+    ttft_s: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # True when token counts are estimates (streamed reply cut short, no usage block)
+    estimated: bool = False
+    stream: bool = False
+    cached: bool = False
+    error: Optional[str] = None
+    ts: float = field(default_factory=time.time)
+
+    @property
+    def tokens_per_s(self) -> Optional[float]:
+        if not self.completion_tokens:
+            return None
+        gen_s = self.wall_s - (self.ttft_s or 0.0)
+        return self.completion_tokens / gen_s if gen_s > 0 else None
+
+    def to_json(self) -> dict:
+        d = asdict(self)
+        d["wall_s"] = round(self.wall_s, 4)
+        d["ttft_s"] = round(self.ttft_s, 4) if self.ttft_s is not None else None
+        d["tokens_per_s"] = round(self.tokens_per_s, 2) if self.tokens_per_s else None
+        return d
+
+
+def percentile(xs: list[float], p: float) -> Optional[float]:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    k = (len(xs) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+class MetricsLog:
+    """Thread-safe recorder: rolling window in memory, rotating JSONL on disk."""
+
+    def __init__(self, path: Path | None = None, *, max_bytes: int = DEFAULT_METRICS_MAX_MB * 1024 * 1024,
+                 backups: int = METRICS_BACKUPS, window: int = WINDOW):
+        self.path = Path(path or DEFAULT_METRICS_PATH).expanduser()
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.recent: deque[RequestStats] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._host = socket.gethostname()
+
+    def record(self, stats: RequestStats) -> None:
+        with self._lock:
+            self.recent.append(stats)
+            line = json.dumps({**stats.to_json(), "host": self._host, "pid": os.getpid()}, separators=(",", ":"))
+            try:
+                self._rotate_if_needed()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError:
+                pass  # telemetry must never break a request
+
+    def _rotate_if_needed(self) -> None:
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            return
+        if size < self.max_bytes:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+
+    @property
+    def last(self) -> Optional[RequestStats]:
+        with self._lock:
+            return self.recent[-1] if self.recent else None
+
+    def summary(self) -> dict:
+        """Rolling percentiles over the in-memory window (cache hits and errors counted apart)."""
+        with self._lock:
+            rows = list(self.recent)
+        live = [r for r in rows if not r.cached and r.error is None]
+        wall = [r.wall_s for r in live]
+        ttft = [r.ttft_s for r in live if r.ttft_s is not None]
+        tps = [r.tokens_per_s for r in live if r.tokens_per_s]
+        prompt = [r.prompt_tokens for r in live if r.prompt_tokens is not None]
+        endpoints: dict[str, int] = {}
+        for r in live:
+            endpoints[r.endpoint] = endpoints.get(r.endpoint, 0) + 1
+        return {
+            "requests": len(rows),
+            "cached": sum(1 for r in rows if r.cached),
+            "errors": sum(1 for r in rows if r.error is not None),
+            "wall_s": {p: percentile(wall, q) for p, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+            "ttft_s": {p: percentile(ttft, q) for p, q in (("p50", 0.5), ("p95", 0.95))},
+            "tokens_per_s": {"p50": percentile(tps, 0.5)},
+            "prompt_tokens": {"p50": percentile(prompt, 0.5), "max": max(prompt) if prompt else None},
+            "endpoints": endpoints,
+        }
+
+
+def open_metrics(cfg) -> Optional[MetricsLog]:
+    """Return a MetricsLog, or None when metrics are disabled."""
+    if not getattr(cfg, "metrics", True):
+        return None
+    return MetricsLog(max_bytes=getattr(cfg, "metrics_max_mb", DEFAULT_METRICS_MAX_MB) * 1024 * 1024)
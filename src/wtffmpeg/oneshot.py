@@ -0,0 +1,84 @@
+"""Single-shot mode (`wtff -p ...`).
+
+Kept apart from repl.py so one-off invocations never import prompt_toolkit,
+pygments or pypager.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Optional
+
+from .cache import open_cache
+from .config import AppConfig, resolve_profile
+from .llm import generate_ffmpeg_command, generation_params
+from .media import augment_prompt, open_probe_index
+from .metrics import open_metrics
+from .recall import consult, open_recall, with_examples
+from .startup import TRACE
+from .validate import open_validator
+
+
+def translate_once(
+    cfg: AppConfig,
+    *,
+    client,
+    profile,
+    probe_index=None,
+    cache=None,
+    validator=None,
+    metrics=None,
+    recall=None,
+    cwd: Path | None = None,
+) -> tuple[str, str, Optional[str]]:
+    """(raw reply, command, note) for cfg.prompt_once; note is set when answered from history.
+
+    Shared by single_shot and the daemon, which passes its long-lived stores and
+    the caller's working directory.
+    """
+    hit, shots = consult(recall, cfg.prompt_once, threshold=cfg.recall_threshold, examples=cfg.recall_examples)
+    if hit is not None:
+        return hit.command, hit.command, f"(from history, {hit.similarity:.0%} match)"
+
+    messages = [
+        {"role": "system", "content": profile.text},
+        {"role": "user", "content": augment_prompt(cfg.prompt_once, probe_index, cwd)},
+    ]
+    raw, cmd = generate_ffmpeg_command(
+        with_examples(messages, shots), client, cfg.model, cache=cache, stream=cfg.stream, validator=validator,
+        metrics=metrics, params=generation_params(cfg, profile),
+    )
+    return raw, cmd, None
+
+
+def single_shot(*, client, cfg: AppConfig) -> int:
+    """Run exactly one prompt (cfg.prompt_once) and exit."""
+    if not cfg.prompt_once:
+        print("single_shot called without cfg.prompt_once", file=sys.stderr)
+        return 2
+
+    with TRACE.phase("load profile"):
+        profile = resolve_profile(cfg)
+    with TRACE.phase("open stores"):
+        stores = dict(
+            probe_index=open_probe_index(cfg), cache=open_cache(cfg), validator=open_validator(cfg),
+            metrics=open_metrics(cfg), recall=open_recall(cfg),
+        )
+    with TRACE.phase("generate"):
+        raw, cmd, note = translate_once(cfg, client=client, profile=profile, **stores)
+    if note:
+        print(note, file=sys.stderr)
+    if not cmd:
+        print("Failed to generate a command.", file=sys.stderr)
+        print(raw)
+        return 1
+
+    print(cmd)
+
+    if cfg.copy:
+        import pyperclip
+
+        pyperclip.copy(cmd)
+        print("Command copied to clipboard.")
+
+    return 0
@@ -1,6 +1,7 @@
 from pathlib import Path
-from dataclasses import dataclass
-from typing import Optional, Literal
+from dataclasses import dataclass, field
+from typing import Any, Optional, Literal
+import json
 import os
 
 import importlib.resources  # type: ignore
@@ -12,6 +13,45 @@ class Profile():
     source: Literal["user", "builtin", "path"]
     path: Optional[Path]
     text: str
+    # generation defaults from the profile's front matter (max_tokens, stop, ...)
+    params: dict[str, Any] = field(default_factory=dict)
+
+
+def parse_front_matter(text: str) -> tuple[dict[str, Any], str]:
+    """
+    Split an optional leading front-matter block off a profile:
+
+        ---
+        max_tokens: 256
+        stop: ["\\n```"]
+        ---
+        You are an expert at ...
+
+    Values are JSON when they parse as JSON, plain strings otherwise.
+    Returns (params, prompt_text); text without a closed block is returned unchanged.
+    """
+    lines = text.splitlines(keepends=True)
+    if not lines or lines[0].strip() != "---":
+        return {}, text
+    params: dict[str, Any] = {}
+    for i, line in enumerate(lines[1:], 1):
+        if line.strip() == "---":
+            return params, "".join(lines[i + 1:]).lstrip("\n")
+        key, sep, value = line.partition(":")
+        key = key.strip()
+        if not sep or not key or key.startswith("#"):
+            continue
+        value = value.strip()
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return {}, text
+
+
+def _make_profile(name: str, source: str, path: Optional[Path], text: str) -> Profile:
+    params, text = parse_front_matter(text)
+    return Profile(name=name, source=source, path=path, text=text, params=params)
 
 def _looks_like_path(spec: str) -> bool:
     if spec.startswith(("~", ".", os.sep)):
@@ -91,12 +131,12 @@ def load_profile(profile_spec: str, profile_dir: Path | None = None) -> Profile:
         # Don't resolve() aggressively (can fail on non-existent segments), but normalize.
         p = p if p.is_absolute() else (Path.cwd() / p)
         text = _read_text_file(p)
-        return Profile(name=p.name, source="path", path=p, text=text)
+        return _make_profile(p.name, "path", p, text)
 
     for cand in _candidate_paths_in_dir(pd, spec):
         if cand.exists():
             text = _read_text_file(cand)
-            return Profile(name=spec, source="user", path=cand, text=text)
+            return _make_profile(spec, "user", cand, text)
 
     builtin_candidates = [spec, f"{spec}.txt"]
     try:
@@ -109,7 +149,7 @@ def load_profile(profile_spec: str, profile_dir: Path | None = None) -> Profile:
                 if len(data) > 256 * 1024:
                     raise ValueError(f"Built-in profile too large: {fname}")
                 text = data.decode("utf-8", errors="replace")
-                return Profile(name=spec, source="builtin", path=None, text=text)
+                return _make_profile(spec, "builtin", None, text)
     except ModuleNotFoundError:
         pass
     except FileNotFoundError:
@@ -0,0 +1,210 @@
+"""Structured progress for ffmpeg runs started from the REPL.
+
+Instead of echoing ffmpeg's carriage-return status line and log output, the
+command is run with `-progress pipe:1 -nostats`. The key=value blocks on stdout
+are parsed into one throttled status line, and stderr goes into a bounded ring
+buffer that is shown only when the run fails.
+"""
+from __future__ import annotations
+
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+STDERR_RING_LINES = 200
+STDERR_SHOWN_ON_ERROR = 20
+RENDER_INTERVAL_S = 0.5
+
+# argv tokens meaning "write to stdout", which -progress pipe:1 would corrupt
+_STDOUT_TARGETS = {"-", "pipe:", "pipe:1", "/dev/stdout"}
+
+
+def parse_time(value: str) -> Optional[float]:
+    """Seconds from an ffmpeg duration: 90, 90.5, 1:30, 00:01:30.5, 1500ms."""
+    v = value.strip()
+    try:
+        if v.endswith("ms"):
+            return float(v[:-2]) / 1000
+        if v.endswith("us"):
+            return float(v[:-2]) / 1e6
+        if v.endswith("s"):
+            v = v[:-1]
+        secs = 0.0
+        for part in v.split(":"):
+            secs = secs * 60 + float(part)
+        return secs
+    except ValueError:
+        return None
+
+
+def _fmt_hms(seconds: float) -> str:
+    seconds = max(0, int(seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}"
+
+
+def wants_progress(argv: list[str]) -> bool:
+    """True if argv is safe to run with -progress pipe:1 (not already set, not writing to stdout)."""
+    return "-progress" not in argv and not any(tok in _STDOUT_TARGETS for tok in argv[1:])
+
+
+def inject_progress(command: str) -> str:
+    """Insert `-progress pipe:1 -nostats -nostdin` right after the ffmpeg executable."""
+    return re.sub(r"^(\s*\S*ffmpeg)(?=\s|$)", r"\1 -progress pipe:1 -nostats -nostdin", command, count=1)
+
+
+def input_paths(argv: list[str]) -> list[str]:
+    return [argv[i + 1] for i, tok in enumerate(argv[:-1]) if tok == "-i"]
+
+
+def expected_duration(argv: list[str], probe_index=None) -> Optional[float]:
+    """Output duration: an explicit output -t, else the first input's ffprobe duration."""
+    duration = None
+    if probe_index is not None:
+        for p in input_paths(argv):
+            if Path(p).is_file():
+                duration = probe_index.duration(Path(p))
+                if duration:
+                    break
+    # -t after the last -i limits the output
+    last_input = max((i for i, tok in enumerate(argv) if tok == "-i"), default=0)
+    for i in range(last_input + 2, len(argv) - 1):
+        if argv[i] == "-t":
+            t = parse_time(argv[i + 1])
+            if t is not None:
+                duration = min(duration, t) if duration else t
+    return duration
+
+
+class ProgressState:
+    """Accumulates one `-progress` block at a time."""
+
+    def __init__(self, duration: Optional[float] = None):
+        self.duration = duration
+        self.fields: dict[str, str] = {}
+        self.current: dict[str, str] = {}
+        self.done = False
+
+    def feed_line(self, line: str) -> bool:
+        """Feed one key=value line; True when a block completed."""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return False
+        self.current[key] = value.strip()
+        if key == "progress":
+            self.fields = {**self.fields, **self.current}
+            self.current = {}
+            self.done = value.strip() == "end"
+            return True
+        return False
+
+    @property
+    def out_time(self) -> Optional[float]:
+        # out_time_us and (misnamed) out_time_ms are both microseconds
+        for key in ("out_time_us", "out_time_ms"):
+            v = self.fields.get(key)
+            if v and v != "N/A":
+                try:
+                    return int(v) / 1e6
+                except ValueError:
+                    pass
+        v = self.fields.get("out_time")
+        return parse_time(v) if v and v != "N/A" else None
+
+    @property
+    def speed(self) -> Optional[float]:
+        v = self.fields.get("speed", "").rstrip("x").strip()
+        try:
+            return float(v) if v and v != "N/A" else None
+        except ValueError:
+            return None
+
+    def render(self) -> str:
+        f = self.fields
+        parts = []
+        if f.get("frame"):
+            parts.append(f"frame {f['frame']}")
+        if f.get("fps") and f["fps"] not in ("0.00", "0"):
+            parts.append(f"fps {f['fps']}")
+        speed = self.speed
+        if speed is not None:
+            parts.append(f"speed {speed:.2f}x")
+        if f.get("bitrate") and f["bitrate"] != "N/A":
+            parts.append(f"bitrate {f['bitrate'].strip()}")
+        t = self.out_time
+        if t is not None:
+            if self.duration:
+                pct = min(100.0, 100.0 * t / self.duration)
+                parts.append(f"time {_fmt_hms(t)} / {_fmt_hms(self.duration)} ({pct:.1f}%)")
+                if speed:
+                    parts.append(f"ETA {_fmt_hms((self.duration - t) / speed)}")
+            else:
+                parts.append(f"time {_fmt_hms(t)}")
+        return "  ".join(parts)
+
+
+def run_with_progress(command: str, argv: list[str], *, probe_index=None) -> int:
+    """Run an ffmpeg command line with a throttled progress line. Returns exit code."""
+    state = ProgressState(expected_duration(argv, probe_index))
+    ring: deque[str] = deque(maxlen=STDERR_RING_LINES)
+    tty = sys.stdout.isatty()
+    started = time.monotonic()
+
+    proc = subprocess.Popen(
+        inject_progress(command),
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.DEVNULL,
+        text=True,
+        errors="replace",
+        bufsize=1,
+    )
+
+    def drain_stderr():
+        assert proc.stderr is not None
+        for chunk in proc.stderr:
+            for line in re.split(r"[\r\n]", chunk):
+                if line.strip():
+                    ring.append(line.rstrip())
+
+    t = threading.Thread(target=drain_stderr, name="wtff-ffmpeg-stderr", daemon=True)
+    t.start()
+
+    last_render = 0.0
+    try:
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            if not state.feed_line(line) or not tty:
+                continue
+            now = time.monotonic()
+            if now - last_render >= RENDER_INTERVAL_S or state.done:
+                last_render = now
+                sys.stdout.write("\r\x1b[2K" + state.render())
+                sys.stdout.flush()
+        rc = proc.wait()
+    except KeyboardInterrupt:
+        # ffmpeg got the same SIGINT and finalizes the output; wait for it
+        rc = proc.wait()
+    t.join(timeout=2)
+
+    if tty and last_render:
+        sys.stdout.write("\r\x1b[2K")
+        sys.stdout.flush()
+    elapsed = time.monotonic() - started
+    if rc == 0:
+        speed = state.speed
+        summary = f"Done in {_fmt_hms(elapsed)}"
+        if speed:
+            summary += f" (speed {speed:.2f}x)"
+        print(summary)
+    else:
+        for line in list(ring)[-STDERR_SHOWN_ON_ERROR:]:
+            print(line, file=sys.stderr)
+    return rc
@@ -0,0 +1,331 @@
+"""Local recall of past (prompt, command) pairs.
+
+Whenever a generated command runs successfully, the prompt that produced it and
+the command that actually ran are stored in ~/.wtffmpeg/recall.sqlite3. New
+prompts are matched against them offline: BM25 over words picks candidates,
+character-trigram cosine similarity scores how close the wording is.
+
+A near-exact match is returned as-is without calling the model: similarity >=
+threshold, and the same content words -- file names, numbers and sizes, but also
+"with"/"without", "no", "keep"/"remove" -- so "gif from a.mp4" never answers
+"gif from b.mp4", nor "mp4 without audio" "mp4 with audio". Only filler words
+("please", "the", "can you") may differ. Weaker matches are offered as few-shot
+examples instead.
+"""
+from __future__ import annotations
+
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .defaults import DEFAULT_RECALL_EXAMPLES, DEFAULT_RECALL_THRESHOLD
+
+DEFAULT_RECALL_PATH = Path.home() / ".wtffmpeg" / "recall.sqlite3"
+MIN_EXAMPLE_SIMILARITY = 0.35
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[._:/\-][a-z0-9]+)*")
+_STOPWORDS = {
+    "a", "an", "the", "to", "of", "in", "into", "and", "or", "for", "with", "from", "on", "at", "by",
+    "it", "its", "this", "that", "my", "me", "please", "can", "you", "i", "is", "be", "as", "so",
+}
+# the only words an instant answer may disregard; everything else can change the command
+_FILLER = {
+    "a", "an", "the", "please", "can", "could", "would", "you", "i", "me", "my", "this", "that", "it", "its",
+    "is", "be", "so", "just",
+}
+
+
+def _words(text: str) -> list[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def _trigrams(text: str) -> Counter:
+    s = " " + " ".join(_WORD_RE.findall(text.lower())) + " "
+    return Counter(s[i:i + 3] for i in range(len(s) - 2))
+
+
+def specifics(text: str) -> frozenset[str]:
+    """Tokens that pin a prompt to particular inputs: anything with a digit, dot or slash."""
+    return frozenset(w for w in _WORD_RE.findall(text.lower()) if re.search(r"[0-9./]", w))
+
+
+def content_words(text: str) -> frozenset[str]:
+    """Every word but filler: specifics plus the words that say what to do (with, without, no, keep...)."""
+    return frozenset(w for w in _WORD_RE.findall(text.lower()) if w not in _FILLER)
+
+
+def _cosine(a: Counter, b: Counter, norm_a: float, norm_b: float) -> float:
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(n * b[g] for g, n in a.items() if g in b) / (norm_a * norm_b)
+
+
+@dataclass
+class Match:
+    id: int
+    prompt: str
+    command: str
+    similarity: float  # trigram cosine, 0..1
+    score: float  # BM25
+    same_terms: bool  # identical content words, specifics included
+
+    def instant(self, threshold: float) -> bool:
+        return self.same_terms and self.similarity >= threshold
+
+
+@dataclass
+class _Doc:
+    id: int
+    prompt: str
+    command: str
+    words: list[str]
+    grams: Counter
+    norm: float
+    terms: frozenset[str]
+
+
+class RecallIndex:
+    """SQLite-backed store of successful pairs with an in-memory search index.
+
+    A broken or locked database is never fatal: lookups find nothing and writes
+    are dropped, as if there were no history.
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = Path(path or DEFAULT_RECALL_PATH).expanduser()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._docs: Optional[dict[int, _Doc]] = None
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self._gram_postings: dict[str, set[int]] = defaultdict(set)
+        self._total_len = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS pairs ("
+                    " id INTEGER PRIMARY KEY,"
+                    " prompt TEXT NOT NULL,"
+                    " command TEXT NOT NULL,"
+                    " uses INTEGER NOT NULL DEFAULT 1,"
+                    " created REAL NOT NULL,"
+                    " last_used REAL NOT NULL,"
+                    " UNIQUE(prompt, command))"
+                )
+                conn.commit()
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    # --- in-memory index ---
+
+    def _index(self) -> dict[int, _Doc]:
+        # caller holds _lock
+        if self._docs is None:
+            rows = self._db().execute("SELECT id, prompt, command FROM pairs").fetchall()
+            self._docs = {}
+            for row_id, prompt, command in rows:
+                self._add_doc(row_id, prompt, command)
+        return self._docs
+
+    def _add_doc(self, row_id: int, prompt: str, command: str) -> None:
+        grams = _trigrams(prompt)
+        doc = _Doc(
+            id=row_id, prompt=prompt, command=command, words=_words(prompt), grams=grams,
+            norm=math.sqrt(sum(n * n for n in grams.values())), terms=content_words(prompt),
+        )
+        assert self._docs is not None
+        self._docs[row_id] = doc
+        self._total_len += len(doc.words)
+        for w, tf in Counter(doc.words).items():
+            self._postings[w][row_id] = tf
+        for g in grams:
+            self._gram_postings[g].add(row_id)
+
+    def _drop_doc(self, row_id: int) -> None:
+        doc = self._docs.pop(row_id, None) if self._docs is not None else None
+        if doc is None:
+            return
+        self._total_len -= len(doc.words)
+        for w in set(doc.words):
+            self._postings[w].pop(row_id, None)
+        for g in doc.grams:
+            self._gram_postings[g].discard(row_id)
+
+    # --- public API ---
+
+    def add(self, prompt: str, command: str) -> None:
+        """Record a pair that ran successfully (bumps its use count if already known)."""
+        prompt, command = prompt.strip(), command.strip()
+        if not prompt or not command:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT INTO pairs(prompt, command, created, last_used) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(prompt, command) DO UPDATE SET uses = uses + 1, last_used = excluded.last_used",
+                    (prompt, command, now, now),
+                )
+                db.commit()
+                if self._docs is not None:
+                    row = db.execute(
+                        "SELECT id FROM pairs WHERE prompt = ? AND command = ?", (prompt, command)
+                    ).fetchone()
+                    if row and row[0] not in self._docs:
+                        self._add_doc(row[0], prompt, command)
+            except sqlite3.Error:
+                pass
+
+    def touch(self, row_id: int) -> None:
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute("UPDATE pairs SET uses = uses + 1, last_used = ? WHERE id = ?", (time.time(), row_id))
+                db.commit()
+            except sqlite3.Error:
+                pass
+
+    def forget(self, row_id: int) -> bool:
+        with self._lock:
+            try:
+                db = self._db()
+                cur = db.execute("DELETE FROM pairs WHERE id = ?", (row_id,))
+                db.commit()
+            except sqlite3.Error:
+                return False
+            self._drop_doc(row_id)
+            return cur.rowcount > 0
+
+    def clear(self) -> Optional[int]:
+        """Forget every pair; the number removed, or None if the database couldn't be written."""
+        with self._lock:
+            try:
+                db = self._db()
+                cur = db.execute("DELETE FROM pairs")
+                db.commit()
+            except sqlite3.Error:
+                return None
+            self._docs = None
+            self._postings.clear()
+            self._gram_postings.clear()
+            self._total_len = 0
+            return cur.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            try:
+                return len(self._index())
+            except sqlite3.Error:
+                return 0
+
+    def search(self, prompt: str, k: int = 5) -> list[Match]:
+        """Best matches for prompt, most similar first ([] if the database can't be read)."""
+        with self._lock:
+            try:
+                docs = self._index()
+            except sqlite3.Error:
+                return []
+            if not docs:
+                return []
+            n = len(docs)
+            avg_len = self._total_len / n if n else 0.0
+
+            bm25: dict[int, float] = defaultdict(float)
+            for w in set(_words(prompt)):
+                postings = self._postings.get(w)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for row_id, tf in postings.items():
+                    dl = len(docs[row_id].words)
+                    bm25[row_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avg_len))
+
+            grams = _trigrams(prompt)
+            norm = math.sqrt(sum(c * c for c in grams.values()))
+            shared: Counter = Counter()
+            for g in grams:
+                for row_id in self._gram_postings.get(g, ()):
+                    shared[row_id] += 1
+            # candidates: BM25 hits plus anything sharing a good fraction of trigrams (typos)
+            candidates = set(bm25) | {i for i, c in shared.items() if c >= len(grams) * 0.3}
+
+            want = content_words(prompt)
+            matches = []
+            for row_id in candidates:
+                doc = docs[row_id]
+                matches.append(Match(
+                    id=row_id, prompt=doc.prompt, command=doc.command,
+                    similarity=_cosine(grams, doc.grams, norm, doc.norm),
+                    score=bm25.get(row_id, 0.0),
+                    same_terms=doc.terms == want,
+                ))
+        # ties (same prompt, several commands that worked) go to the newest
+        matches.sort(key=lambda m: (m.similarity, m.score, m.id), reverse=True)
+        return matches[:k]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def with_examples(messages: list[dict], matches: list[Match]) -> list[dict]:
+    """Insert matches as user/assistant example turns right after the system prompt."""
+    if not matches:
+        return messages
+    shots: list[dict] = []
+    for m in reversed(matches):  # most similar closest to the real question
+        shots.append({"role": "user", "content": m.prompt})
+        shots.append({"role": "assistant", "content": m.command})
+    head = 1 if messages and messages[0].get("role") == "system" else 0
+    return messages[:head] + shots + messages[head:]
+
+
+def consult(
+    index: Optional[RecallIndex],
+    prompt: str,
+    *,
+    threshold: int = DEFAULT_RECALL_THRESHOLD,
+    examples: int = DEFAULT_RECALL_EXAMPLES,
+    instant: bool = True,
+) -> tuple[Optional[Match], list[Match]]:
+    """(instant answer or None, few-shot examples) for prompt; threshold is a percentage.
+
+    Pass instant=False when prompt depends on earlier turns ("same but 720p"):
+    a past prompt with the same words meant something else, so matches are only
+    offered as examples.
+    """
+    if index is None:
+        return None, []
+    matches = index.search(prompt, k=max(examples, 1))
+    if instant and matches and matches[0].instant(threshold / 100):
+        return matches[0], []
+    return None, [m for m in matches if m.similarity >= MIN_EXAMPLE_SIMILARITY][:examples]
+
+
+def open_recall(cfg) -> Optional[RecallIndex]:
+    """Return a RecallIndex, or None when recall is disabled."""
+    if not getattr(cfg, "recall", True):
+        return None
+    return RecallIndex()
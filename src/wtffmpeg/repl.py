@@ -1,14 +1,15 @@
 from __future__ import annotations
 
 import sys
+import time
+import shutil
 import subprocess
 import shlex
 from pathlib import Path
 
 import pyperclip
 from prompt_toolkit import PromptSession
-from prompt_toolkit.history import FileHistory
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+from prompt_toolkit.history import ThreadedHistory
 from prompt_toolkit.enums import EditingMode
 from prompt_toolkit.lexers import PygmentsLexer
 from prompt_toolkit.styles import Style
@@ -19,19 +20,35 @@ from prompt_toolkit.formatted_text import HTML
 from pygments.lexers.python import PythonLexer
 from pypager.pager import Pager
 from pypager.source import StringSource
-from .runtime import RuntimeState, reconcile_runtime
-
-from .llm import generate_ffmpeg_command, verify_connection, build_client
+from .runtime import RuntimeState, close_runtime, reconcile_runtime, client_fingerprint
+from .router import EndpointRouter
+from .conversation import Conversation, get_token_counter
+from .warmup import Warmup
+from .media import augment_prompt
+from .ffcmd import ffmpeg_argv, one_line
+from .progress import run_with_progress, wants_progress
+from .hedge import HedgedClient
+from .transport import POOL
+from .jobs import JobQueue, auto_slots, resolve_slots
+from .segment import segment_encode
+from .estimate import AUTO_MIN_DURATION_S, estimate
+from .tune import parse_size, parse_speed, tune
+from .recall import consult, with_examples
+from .sessions import SessionStore, replay
+from .history import IndexedAutoSuggest, SQLiteHistory
+
+from .llm import generate_ffmpeg_command, verify_connection, client_base_url
 from .config import (
     AppConfig,
     CONFIG_KEYS,
     PERSIST_KEYS,
+    INT_KEYS,
+    BOOL_KEYS,
     DEFAULT_PROFILE_NAME,
     DEFAULT_CONFIG_PATH,
     apply_overrides,
     load_config,
     save_config,
-    normalize_base_url,
 )
 from .profiles import load_profile, list_profiles
 from .config import resolve_profile
@@ -48,9 +65,6 @@ matrix_style = Style.from_dict(
     }
 )
 
-CMD_HISTFILE = Path.home() / ".wtff_history"
-
-
 def _parse_kv(tokens: list[str]) -> dict[str, str]:
     out: dict[str, str] = {}
     for t in tokens:
@@ -65,9 +79,9 @@ def _coerce_value(key: str, raw: str):
     v = raw.strip()
     if v.lower() in ("none", "null"):
         return None
-    if key in ("context_turns",):
+    if key in INT_KEYS:
         return int(v)
-    if key in ("copy", "no_nag"):
+    if key in BOOL_KEYS:
         if v.lower() in ("1", "true", "yes", "on"):
             return True
         if v.lower() in ("0", "false", "no", "off"):
@@ -81,22 +95,59 @@ def _sanitize_cfg(cfg: AppConfig) -> dict:
         "model": cfg.model,
         "provider": cfg.provider,
         "base_url": cfg.base_url,
+        "endpoints": ",".join(cfg.endpoints) or None,
         "openai_api_key": ("(set)" if cfg.openai_api_key else "(unset)"),
         "bearer_token": ("(set)" if cfg.bearer_token else "(unset)"),
         "context_turns": cfg.context_turns,
+        "context_tokens": cfg.context_tokens,
+        "tokenizer": cfg.tokenizer,
         "profile": resolve_profile(cfg).name,
         "copy": cfg.copy,
         "no_nag": cfg.no_nag,
+        "cache": cfg.cache,
+        "cache_max_mb": cfg.cache_max_mb,
+        "cache_max_age_days": cfg.cache_max_age_days,
+        "stream": cfg.stream,
+        "warmup": cfg.warmup,
+        "probe": cfg.probe,
+        "validate": cfg.validate,
+        "job_slots": cfg.job_slots,
+        "job_threads": cfg.job_threads,
+        "metrics": cfg.metrics,
+        "metrics_max_mb": cfg.metrics_max_mb,
+        "metrics_toolbar": cfg.metrics_toolbar,
+        "max_tokens": cfg.max_tokens,
+        "stop": list(cfg.stop),
+        "reasoning_effort": cfg.reasoning_effort,
+        "num_predict": cfg.num_predict,
+        "num_ctx": cfg.num_ctx,
+        "recall": cfg.recall,
+        "recall_threshold": cfg.recall_threshold,
+        "recall_examples": cfg.recall_examples,
+        "sessions": cfg.sessions,
+        "timeout_s": cfg.timeout_s,
+        "connect_timeout_s": cfg.connect_timeout_s,
+        "max_retries": cfg.max_retries,
+        "hedge": cfg.hedge,
+        "hedge_after_ms": cfg.hedge_after_ms,
+        "http2": cfg.http2,
+        "pool_connections": cfg.pool_connections,
+        "pool_keepalive": cfg.pool_keepalive,
+        "estimate_samples": cfg.estimate_samples,
+        "estimate_seconds": cfg.estimate_seconds,
+        "auto_estimate": cfg.auto_estimate,
+        "history_max": cfg.history_max,
+        "model_path": cfg.model_path,
+        "local_threads": cfg.local_threads,
     }
 
 
-def _transport_changed(a: AppConfig, b: AppConfig) -> bool:
-    keys = ("provider", "base_url", "openai_api_key", "bearer_token")
-    return any(getattr(a, k) != getattr(b, k) for k in keys)
-
-
 def handle_config_command(cmdline: str, *, session: PromptSession, cfg: AppConfig, client):
-    """Handle '/config ...' commands. Returns (new_cfg, new_client)."""
+    """Handle '/config ...' commands. Returns (new_cfg, client).
+
+    The client is passed through unchanged; reconcile_runtime() rebuilds it
+    when a transport-affecting key changed.
+    """
     parts = shlex.split(cmdline)
     sub = parts[1] if len(parts) > 1 else "show"
 
@@ -173,21 +224,14 @@ USAGE
                 continue
             updates[k] = _coerce_value(k, raw)
 
-        if "base_url" in updates and updates["base_url"]:
-            updates["base_url"] = normalize_base_url(str(updates["base_url"]))
-
         if "profile" in updates:
             profile_spec = str(updates.pop("profile"))
             load_profile(profile_spec, cfg.profile_dir)  # validate
             updates["profile_name"] = profile_spec
 
         new_cfg = apply_overrides(cfg, updates)
-        new_client = client
-        if _transport_changed(cfg, new_cfg):
-            new_client = build_client(new_cfg)
-
         print("OK")
-        return new_cfg, new_client
+        return new_cfg, client
 
     elif sub == "unset":
         keys = parts[2:]
@@ -200,17 +244,21 @@ USAGE
                 # keep profile always valid; interpret unset as default
                 load_profile(DEFAULT_PROFILE_NAME, cfg.profile_dir)  # validate
                 updates["profile_name"] = DEFAULT_PROFILE_NAME
-            elif k in ("model", "provider", "context_turns", "copy", "no_nag"):
+            elif k in ("model", "provider", "context_turns", "context_tokens", "tokenizer", "copy", "no_nag",
+                       "cache", "cache_max_mb", "cache_max_age_days", "stream", "warmup", "probe", "validate",
+                       "job_slots", "job_threads", "metrics", "metrics_max_mb", "metrics_toolbar",
+                       "recall", "recall_threshold", "recall_examples", "sessions",
+                       "timeout_s", "connect_timeout_s", "max_retries", "hedge", "hedge_after_ms",
+                       "http2", "pool_connections", "pool_keepalive",
+                       "estimate_samples", "estimate_seconds", "auto_estimate", "history_max",
+                       "local_threads"):
                 print(f"Cannot unset required key: {k}", file=sys.stderr)
             else:
                 updates[k] = None
 
         new_cfg = apply_overrides(cfg, updates)
-        new_client = client
-        if _transport_changed(cfg, new_cfg):
-            new_client = build_client(new_cfg)
         print("OK")
-        return new_cfg, new_client
+        return new_cfg, client
 
     elif sub == "save":
         path = Path(parts[2]) if len(parts) > 2 else DEFAULT_CONFIG_PATH
@@ -232,20 +280,27 @@ USAGE
             data["profile_name"] = profile_spec
 
         new_cfg = apply_overrides(cfg, data)
-        new_client = client
-        if _transport_changed(cfg, new_cfg):
-            new_client = build_client(new_cfg)
-
         print(f"Configuration loaded from {path}")
-        return new_cfg, new_client
+        return new_cfg, client
     else:
         print(f"Unknown /config subcommand: {sub}", file=sys.stderr)
 
     return cfg, client
 
 
-def execute_command(command: str) -> int:
-    """Execute a shell command, streaming output. Returns exit code."""
+def execute_command(command: str, *, probe_index=None) -> int:
+    """
+    Execute a shell command, streaming output. Returns exit code.
+
+    Plain ffmpeg commands get a structured progress line instead (see progress.py).
+    """
+    argv = ffmpeg_argv(command)
+    if argv is not None and wants_progress(argv):
+        try:
+            return run_with_progress(command, argv, probe_index=probe_index)
+        except Exception as e:
+            print(f"Error executing command: {e}", file=sys.stderr)
+            return 1
     try:
         with subprocess.Popen(
             command,
@@ -265,6 +320,32 @@ def execute_command(command: str) -> int:
         return 1
 
 
+def handle_tune_command(cmdline: str, *, command: str, cfg: AppConfig, probe_index=None) -> str | None:
+    """Handle '/tune key=value ...'; the rewritten command, or None."""
+    usage = "Usage: /tune target_speed=2x|max_size=700M [quality=psnr|ssim] [tune=film,grain] [seconds=N]"
+    try:
+        kv = _parse_kv(shlex.split(cmdline)[1:])
+        unknown = set(kv) - {"target_speed", "max_size", "quality", "tune", "seconds"}
+        if unknown:
+            raise ValueError(f"Unknown option(s): {', '.join(sorted(unknown))}")
+        target_speed = parse_speed(kv["target_speed"]) if "target_speed" in kv else None
+        max_size = parse_size(kv["max_size"]) if "max_size" in kv else None
+        quality = kv.get("quality", "").lower() or None
+        if quality not in (None, "psnr", "ssim"):
+            raise ValueError("quality must be psnr or ssim")
+        seconds = int(kv.get("seconds", cfg.estimate_seconds))
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        print(usage, file=sys.stderr)
+        return None
+    if target_speed is None and max_size is None:
+        print(usage, file=sys.stderr)
+        return None
+    tunes = [t for t in kv.get("tune", "").split(",") if t]
+    return tune(command, target_speed=target_speed, max_size=max_size, quality=quality, tunes=tunes,
+                length=seconds, probe_index=probe_index)
+
+
 def nag():
     print(
         "Press enter to execute the command at your prompt immediately"
@@ -274,46 +355,266 @@ def nag():
     )
 
 
-def single_shot(*, client, cfg: AppConfig) -> int:
-    """Run exactly one prompt (cfg.prompt_once) and exit."""
-    if not cfg.prompt_once:
-        print("single_shot called without cfg.prompt_once", file=sys.stderr)
-        return 2
-
-    messages = [
-        {"role": "system", "content": resolve_profile(cfg).text},
-        {"role": "user", "content": cfg.prompt_once},
-    ]
-
-    raw, cmd = generate_ffmpeg_command(messages, client, cfg.model)
-    if not cmd:
-        print("Failed to generate a command.", file=sys.stderr)
-        print(raw)
-        return 1
+class StreamPreview:
+    """One-line, redraw-in-place preview of tokens as they stream in."""
 
-    print(cmd)
+    def __init__(self, *, min_interval: float = 1 / 30):
+        self._buf = ""
+        self._last = 0.0
+        self._shown = False
+        self._enabled = sys.stdout.isatty()
+        self._min_interval = min_interval
 
-    if cfg.copy:
-        pyperclip.copy(cmd)
-        print("Command copied to clipboard.")
+    def __call__(self, delta: str) -> None:
+        self._buf += delta
+        now = time.monotonic()
+        if not self._enabled or now - self._last < self._min_interval:
+            return
+        self._last = now
+        width = shutil.get_terminal_size((80, 20)).columns - 1
+        tail = " ".join(self._buf.split())[-width:]
+        sys.stdout.write("\r\x1b[2K\x1b[2m" + tail + "\x1b[0m")
+        sys.stdout.flush()
+        self._shown = True
+
+    def close(self) -> None:
+        if self._shown:
+            sys.stdout.write("\r\x1b[2K")
+            sys.stdout.flush()
+            self._shown = False
+
+
+def print_endpoint_status(rows: list[dict]) -> None:
+    """Render EndpointRouter.ping() results, one endpoint per line."""
+    width = max(len(r["url"]) for r in rows)
+    for r in rows:
+        ewma = f"{r['ewma_ms']:.0f} ms" if r["ewma_ms"] is not None else "-"
+        if r["ok"]:
+            print(f"  {r['url']:<{width}}  OK    {r['ms']:7.1f} ms  (ewma {ewma})")
+        else:
+            print(f"  {r['url']:<{width}}  DOWN  {r['error']}", file=sys.stderr)
+
+
+def print_pool_stats(st: dict) -> None:
+    """Shared connection pools (transport.POOL), for /ping."""
+    print(f"Connection pools: {st['hits']} reused, {st['misses']} created")
+    for p in st["pools"]:
+        conns = f", {p['connections']} connections" if p["connections"] is not None else ""
+        proto = "HTTP/2" if p["http2"] else "HTTP/1.1"
+        print(f"  {p['origin']}  {proto}, {p['leases']} clients{conns}")
+
+
+def handle_cache_command(cmdline: str, *, cache) -> None:
+    """Handle '/cache [stats|clear]'."""
+    parts = shlex.split(cmdline)
+    sub = parts[1] if len(parts) > 1 else "stats"
+
+    if cache is None:
+        print("Response cache is disabled (--no-cache or cache=false).")
+        return
+
+    if sub == "stats":
+        st = cache.stats()
+        total = st.hits + st.misses
+        rate = f"{100.0 * st.hits / total:.0f}%" if total else "n/a"
+        print(f"Cache: {st.path}")
+        print(f"  entries: {st.entries}  size: {st.bytes / 1024:.1f} KiB"
+              f" (limit {cache.max_bytes // (1024 * 1024)} MiB)")
+        print(f"  this session: {st.hits} hits, {st.misses} misses, hit rate {rate}")
+    elif sub == "clear":
+        n = cache.clear()
+        if n is None:
+            print(f"Could not clear the cache (is {cache.path} locked by another wtff?)", file=sys.stderr)
+        else:
+            print(f"Cache cleared ({n} entries removed).")
+    else:
+        print("Usage: /cache [stats|clear]", file=sys.stderr)
+
+
+def _fmt_s(v) -> str:
+    return f"{v:.2f}s" if v is not None else "-"
+
+
+def print_stats(metrics, client=None) -> None:
+    """Print '/stats': rolling request telemetry for this session."""
+    if isinstance(client, HedgedClient):
+        delay = client.delay()
+        after = f"after {_fmt_s(delay)}" if delay is not None else "not yet (too few samples)"
+        print(f"Hedging: {after}; {client.hedged} duplicated, {client.hedge_wins} won by the duplicate")
+    if metrics is None:
+        print("Metrics are disabled (metrics=false).")
+        return
+    s = metrics.summary()
+    if not s["requests"]:
+        print("No requests yet.")
+        return
+    wall, ttft = s["wall_s"], s["ttft_s"]
+    tps, prompt = s["tokens_per_s"]["p50"], s["prompt_tokens"]
+    print(f"Requests: {s['requests']} ({s['cached']} from cache, {s['errors']} failed)")
+    print(f"  wall:   p50 {_fmt_s(wall['p50'])}  p95 {_fmt_s(wall['p95'])}  p99 {_fmt_s(wall['p99'])}")
+    print(f"  ttft:   p50 {_fmt_s(ttft['p50'])}  p95 {_fmt_s(ttft['p95'])}")
+    print(f"  tok/s:  p50 {tps:.1f}" if tps else "  tok/s:  -")
+    if prompt["p50"] is not None:
+        print(f"  prompt: p50 ~{prompt['p50']:.0f} tok  max ~{prompt['max']} tok")
+    for url, n in sorted(s["endpoints"].items(), key=lambda kv: -kv[1]):
+        print(f"  {n:>5}  {url}")
+    last = metrics.last
+    if last is not None:
+        tps_txt = f", {last.tokens_per_s:.1f} tok/s" if last.tokens_per_s else ""
+        print(f"Last: {last.model} @ {last.endpoint}: {_fmt_s(last.wall_s)} wall, "
+              f"ttft {_fmt_s(last.ttft_s)}{tps_txt}")
+    print(f"Log: {metrics.path}")
+
+
+def handle_session_command(cmdline: str, *, store: SessionStore, journal, conv: Conversation):
+    """Handle '/session [list|save <name>|load <name>]'. Returns the journal to keep writing to."""
+    parts = cmdline.strip().split()
+    sub = parts[1] if len(parts) > 1 else ""
+    name = parts[2] if len(parts) > 2 else ""
+    if not sub:
+        where = journal.path if journal is not None else "not journaled (sessions=false)"
+        print(f"Session: {journal.name if journal is not None else '-'}  ({len(conv)} messages in context)")
+        print(f"  {where}")
+        print("  /session list | /session save <name> | /session load <name>")
+    elif sub == "list":
+        rows = store.list()
+        if not rows:
+            print(f"No saved sessions in {store.root}")
+        for sname, mtime, size in rows[:30]:
+            mark = "*" if journal is not None and sname == journal.name else " "
+            print(f" {mark} {sname:<32} {time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime))}  {size / 1024:7.1f} KiB")
+    elif sub == "save" and name:
+        try:
+            journal = store.save_as(journal, name, conv.messages())
+            print(f"Session saved as {name!r}; further turns are added to it.")
+        except (ValueError, OSError) as e:
+            print(str(e), file=sys.stderr)
+    elif sub == "load" and name:
+        try:
+            loaded = store.open(name)
+            n = replay(conv, loaded.path)
+        except OSError as e:
+            print(str(e), file=sys.stderr)
+            return journal
+        if journal is not None:
+            journal.close()
+        journal = loaded
+        print(f"Loaded session {name!r} ({n} messages in context).")
+    else:
+        print("Usage: /session [list|save <name>|load <name>]")
+    return journal
+
+
+def handle_recall_command(cmdline: str, *, recall, last_hit: int | None) -> None:
+    """Handle '/recall [clear|forget|<query>]'."""
+    if recall is None:
+        print("Recall is disabled (recall=false).")
+        return
+    arg = cmdline.strip()[len("/recall"):].strip()
+    if not arg:
+        print(f"Recall: {len(recall)} remembered prompt/command pairs in {recall.path}")
+        print("  /recall <query> to search, /recall forget to drop the last history answer, /recall clear")
+    elif arg == "clear":
+        n = recall.clear()
+        if n is None:
+            print(f"Could not clear recall (is {recall.path} locked or damaged?)", file=sys.stderr)
+        else:
+            print(f"Recall cleared ({n} pairs removed).")
+    elif arg == "forget":
+        if last_hit is not None and recall.forget(last_hit):
+            print("Forgot the last answer from history; ask again to get a fresh one.")
+        else:
+            print("No answer from history to forget.")
+    else:
+        matches = recall.search(arg, k=5)
+        if not matches:
+            print("No matches.")
+        for m in matches:
+            print(f"  {m.similarity:4.0%}  {m.prompt}")
+            print(f"        {m.command}")
+
+
+def handle_jobs_command(cmdline: str, *, jobs: JobQueue) -> None:
+    """Handle '/jobs', '/wait [id]' and '/kill <id>|all'."""
+    parts = shlex.split(cmdline[1:])
+    name, args = parts[0].lower(), parts[1:]
+
+    if name == "jobs":
+        rows = jobs.snapshot()
+        if not rows:
+            print("No background jobs. Run one with !&<command>.")
+            return
+        running, queued = jobs.counts()
+        print(f"Jobs: {running} running, {queued} queued, {jobs.slots} slots")
+        for j in rows:
+            cmd = " ".join(j.command.split())
+            if len(cmd) > 60:
+                cmd = cmd[:57] + "..."
+            print(f"  [{j.id}] {j.describe():<28} {cmd}")
+            print(f"       log: {j.log_path}")
+        return
+
+    job_id = None
+    if args and args[0] != "all":
+        try:
+            job_id = int(args[0].lstrip("%"))
+        except ValueError:
+            print(f"Usage: /{name} [job id|all]", file=sys.stderr)
+            return
+        if job_id not in jobs.jobs:
+            print(f"No such job: {job_id}", file=sys.stderr)
+            return
 
-    return 0
+    if name == "wait":
+        try:
+            jobs.wait(job_id)
+        except KeyboardInterrupt:
+            print("Stopped waiting; jobs keep running.")
+    elif name == "kill":
+        if job_id is None and not args:
+            print("Usage: /kill <job id>|all", file=sys.stderr)
+        elif job_id is None:
+            print(f"Killed {jobs.kill_all()} job(s).")
+        elif jobs.kill(job_id):
+            print(f"Killed job {job_id}.")
+        else:
+            print(f"Job {job_id} is not running.")
+
+
+def finish_jobs(jobs: JobQueue) -> None:
+    """On REPL exit, wait for background jobs (Ctrl-C kills them instead)."""
+    running, queued = jobs.counts()
+    if not running and not queued:
+        return
+    print(f"Waiting for {running + queued} background job(s); Ctrl-C to kill them.")
+    try:
+        jobs.wait()
+    except KeyboardInterrupt:
+        jobs.kill_all()
+        jobs.wait(timeout=10)
 
 
 def repl(*, client, cfg: AppConfig):
-    def _client_base_url(client) -> str | None:
-        for attr in ("base_url", "_base_url"):
-            v = getattr(client, attr, None)
-            if v:
-                return str(v)
-        return None
-
-    rt = RuntimeState()
-    reconcile_runtime(cfg, rt, force=True)
-
+    # adopt the caller's client instead of building a second one
+    rt = RuntimeState(client=client, _client_fp=client_fingerprint(cfg))
+    reconcile_runtime(cfg, rt)
+
+    warm = Warmup()
+    if cfg.warmup and not cfg.preload_prompt:
+        warm.start(rt.client, cfg.model, provider=cfg.provider)
+
+    jobs = JobQueue(resolve_slots(cfg), probe_index=rt.probe_index)
+    bg_mode = False
+    last_cmd = ""  # last generated or executed ffmpeg command, for /segment and /estimate
+    last_prompt = ""  # prompt behind the pending generated command, recorded once it runs OK
+    last_hit: int | None = None  # recall pair served most recently, for /recall forget
+    job_prompts: dict[int, str] = {}
+
+    history = SQLiteHistory(max_entries=cfg.history_max)
     session = PromptSession(
-        history=FileHistory(str(CMD_HISTFILE)),
-        auto_suggest=AutoSuggestFromHistory(),
+        history=ThreadedHistory(history),
+        auto_suggest=IndexedAutoSuggest(history),
+        refresh_interval=1.0,
     )
 
     def get_toolbar():
@@ -323,32 +624,101 @@ def repl(*, client, cfg: AppConfig):
             width = 80
 
         bind_txt = "Vi" if session.editing_mode == EditingMode.VI else "Emacs"
+        budget = f"/{cfg.context_tokens}" if cfg.context_tokens else ""
+        ctx_txt = f"Ctx: ~{conv.tokens}{budget} tok"
         copy_txt = f"Copy: {'ON' if cfg.copy else 'OFF'}"
-        padding = width - len(bind_txt) - len(copy_txt) - 12
+        warm_txt = f"Warm: {warm.describe()}  " if warm.status != "off" else ""
+        running, queued = jobs.counts()
+        jobs_txt = f"Jobs: {running} run/{queued} queued  " if running or queued or bg_mode else ""
+        if bg_mode:
+            jobs_txt = "BG " + jobs_txt
+        stats_txt = ""
+        last = rt.metrics.last if cfg.metrics_toolbar and rt.metrics is not None else None
+        if last is not None:
+            stats_txt = f"Last: {last.wall_s:.1f}s"
+            if last.ttft_s is not None:
+                stats_txt += f" ttft {last.ttft_s:.2f}s"
+            if last.tokens_per_s:
+                stats_txt += f" {last.tokens_per_s:.0f} tok/s"
+            stats_txt += "  "
+        padding = (width - len(bind_txt) - len(warm_txt) - len(jobs_txt) - len(stats_txt)
+                   - len(ctx_txt) - len(copy_txt) - 14)
         if padding < 1:
             padding = 1
-        return HTML(f"<b>[Mode: {bind_txt}]</b> {' ' * padding} <b>{copy_txt}</b>")
+        return HTML(f"<b>[Mode: {bind_txt}]</b> {' ' * padding} "
+                    f"{warm_txt}{jobs_txt}{stats_txt}{ctx_txt}  <b>{copy_txt}</b>")
+
+    conv = Conversation(
+        resolve_profile(cfg).text,
+        context_turns=cfg.context_turns,
+        context_tokens=cfg.context_tokens,
+        count_tokens=get_token_counter(cfg.tokenizer),
+    )
 
-    messages = [{"role": "system", "content": resolve_profile(cfg).text}]
+    store = SessionStore()
+    journal = store.new() if cfg.sessions else None
+    if cfg.resume is not None:
+        name = cfg.resume or store.latest()
+        try:
+            if not name:
+                raise FileNotFoundError(f"No sessions to resume in {store.root}")
+            resumed = store.open(name)
+            n = replay(conv, resumed.path)
+            journal = resumed
+            print(f"Resumed session {name!r} ({n} messages in context).")
+        except OSError as e:
+            print(str(e), file=sys.stderr)
+
+    def remember(user_msg: str, reply: str) -> None:
+        if journal is not None:
+            journal.append("user", user_msg)
+            journal.append("assistant", reply)
+
+    def ask(messages: list[dict]) -> tuple[str, str] | None:
+        """Generate with a live preview; None if the user hit Ctrl-C."""
+        preview = StreamPreview() if cfg.stream else None
+        try:
+            return generate_ffmpeg_command(
+                messages,
+                rt.client,
+                cfg.model,
+                cache=rt.cache,
+                stream=cfg.stream,
+                on_token=preview,
+                validator=rt.validator,
+                metrics=rt.metrics,
+                params=rt.gen_params,
+            )
+        except KeyboardInterrupt:
+            return None
+        finally:
+            if preview is not None:
+                preview.close()
 
     # preload: run once, then drop into repl with prefilled !cmd
     prefill = ""
     if cfg.preload_prompt:
-        messages.append({"role": "user", "content": cfg.preload_prompt})
-        messages = trim_messages(messages, keep_last_turns=cfg.context_turns)
-        raw, cmd = generate_ffmpeg_command(messages, client, model=cfg.model)
+        user_msg = augment_prompt(cfg.preload_prompt, rt.probe_index)
+        conv.append("user", user_msg)
+        raw, cmd = ask(conv.messages()) or ("", "")
         if cmd:
-            messages.append({"role": "assistant", "content": raw})
-            messages = trim_messages(messages, keep_last_turns=cfg.context_turns)
+            conv.append("assistant", raw)
+            remember(user_msg, raw)
             if cfg.copy:
                 pyperclip.copy(cmd)
-            prefill = "!" + " ".join(cmd.splitlines()).strip()
+            prefill = "!" + one_line(cmd)
+            last_cmd = prefill[1:]
 
     print("Entering interactive mode. Type 'exit'/'quit' to leave. Use !<cmd> to run shell commands.")
     if not cfg.no_nag:
         nag()
 
     while True:
+        for job in jobs.drain_finished():
+            print(f"[job {job.id}] {job.describe()}  log: {job.log_path}")
+            prompt_for_job = job_prompts.pop(job.id, "")
+            if job.state == "done" and prompt_for_job and rt.recall is not None:
+                rt.recall.add(prompt_for_job, job.command)
         try:
             line = session.prompt(
                 "wtff> ",
@@ -360,7 +730,7 @@ def repl(*, client, cfg: AppConfig):
             )
         except (EOFError, KeyboardInterrupt):
             print("\nExiting interactive mode.")
-            return
+            break
 
         prefill = ""
         if not line:
@@ -369,7 +739,7 @@ def repl(*, client, cfg: AppConfig):
         # explicit exits
         if line.strip().lower() in ("exit", "quit", "logout", ":q", ":q!"):
             print("\nExiting interactive mode.")
-            return
+            break
 
         # /slash commands
         elif line.startswith("/"):
@@ -377,7 +747,7 @@ def repl(*, client, cfg: AppConfig):
 
             if cmd in ("exit", "quit", "logout", ":q", ":q!"):
                 print("\nExiting interactive mode.")
-                return
+                break
 
             if cmd in ("help", "h", "?"):
                 print("Available /commands:")
@@ -387,21 +757,38 @@ def repl(*, client, cfg: AppConfig):
                 print("  /profile - Show current profile")
                 print("  /profiles - List available profiles")
                 print("  /config - View and modify configuration (/config help)")
+                print("  /cache [stats|clear] - Show or clear the response cache")
+                print("  /recall [query|forget|clear] - Search or manage answers remembered from past runs")
+                print("  /session [list|save <name>|load <name>] - Save, list or switch persistent sessions")
+                print("  /history [text] - Show recent input, or input containing text")
+                print("  /stats - Request latency, time to first token and tokens/sec for this session")
+                print("  /jobs - List background jobs; /wait [id] waits, /kill <id>|all stops them")
+                print("  /bg - Toggle running !ffmpeg commands in the background")
+                print("  /segment [N] - Run the last ffmpeg command as N parallel keyframe-aligned segments")
+                print("  /estimate - Time a few short samples of the last ffmpeg command and extrapolate its runtime")
+                print("  /tune target_speed=2x|max_size=700M [quality=psnr|ssim] [tune=a,b] - Benchmark presets/threads"
+                      " for the last ffmpeg command and rewrite it")
                 print("  /bindings [vi|emacs] - Switch keybindings")
                 print("  /q|/quit|/exit|/logout - Exit the REPL")
-                print("- Use !<command> to execute shell commands")
+                print("- Use !<command> to execute shell commands, !&<command> to queue one in the background")
                 continue
 
             if cmd == "ping":
-                try:
-                    verify_connection(client, base_url=_client_base_url(client))
-                    print("LLM connectivity: OK")
-                except RuntimeError as e:
-                    print(str(e), file=sys.stderr)
+                if isinstance(getattr(rt.client, "inner", rt.client), EndpointRouter):
+                    print_endpoint_status(rt.client.ping())
+                else:
+                    try:
+                        verify_connection(rt.client, base_url=client_base_url(rt.client))
+                        print("LLM connectivity: OK")
+                    except RuntimeError as e:
+                        print(str(e), file=sys.stderr)
+                print_pool_stats(POOL.stats())
                 continue
 
             elif cmd == "reset":
-                messages = [{"role": "system", "content": resolve_profile(cfg).text}]
+                conv.reset(resolve_profile(cfg).text)
+                if journal is not None:
+                    journal.reset()
                 print("Conversation history cleared.")
                 continue
 
@@ -420,15 +807,103 @@ def repl(*, client, cfg: AppConfig):
                     print(f"  {n}")
                 continue
 
+            elif cmd == "session" or cmd.startswith("session "):
+                journal = handle_session_command(line, store=store, journal=journal, conv=conv)
+                continue
+
+            elif cmd.startswith("recall"):
+                handle_recall_command(line, recall=rt.recall, last_hit=last_hit)
+                continue
+
+            elif cmd == "history" or cmd.startswith("history "):
+                query = line.strip()[len("/history"):].strip()
+                entries = history.search(query) if query else history.load_history_strings()[:20]
+                for entry in reversed(entries):
+                    print("  " + " ".join(entry.splitlines()))
+                if not entries:
+                    print("No matching history." if query else "History is empty.")
+                continue
+
+            elif cmd == "stats":
+                print_stats(rt.metrics, rt.client)
+                continue
+
+            elif cmd.startswith("cache"):
+                handle_cache_command(line, cache=rt.cache)
+                continue
+
+            elif cmd.partition(" ")[0] in ("jobs", "wait", "kill"):
+                handle_jobs_command(line, jobs=jobs)
+                continue
+
+            elif cmd.startswith("segment"):
+                arg = cmd[len("segment"):].strip()
+                if not last_cmd:
+                    print("No ffmpeg command yet; generate or run one first.", file=sys.stderr)
+                    continue
+                try:
+                    n = int(arg) if arg else max(2, auto_slots(cfg.job_threads))
+                except ValueError:
+                    print("Usage: /segment [N]", file=sys.stderr)
+                    continue
+                print(f"Segmenting: {last_cmd}")
+                rc = segment_encode(last_cmd, n=n, probe_index=rt.probe_index)
+                if rc != 0:
+                    print(f"Segmented encode exited {rc}", file=sys.stderr)
+                continue
+
+            elif cmd == "estimate":
+                if not last_cmd:
+                    print("No ffmpeg command yet; generate or run one first.", file=sys.stderr)
+                    continue
+                estimate(last_cmd, samples=cfg.estimate_samples, length=cfg.estimate_seconds,
+                         probe_index=rt.probe_index)
+                continue
+
+            elif cmd == "tune" or cmd.startswith("tune "):
+                if not last_cmd:
+                    print("No ffmpeg command yet; generate or run one first.", file=sys.stderr)
+                    continue
+                tuned = handle_tune_command(line, command=last_cmd, cfg=cfg, probe_index=rt.probe_index)
+                if tuned:
+                    print(f"Tuned: {tuned}")
+                    prefill = "!" + tuned
+                    last_cmd = tuned
+                continue
+
+            elif cmd == "bg":
+                bg_mode = not bg_mode
+                print(f"Background mode {'ON' if bg_mode else 'OFF'}: "
+                      f"!ffmpeg commands {'are queued as jobs' if bg_mode else 'run in the foreground'}.")
+                continue
+
             elif cmd.startswith("config"):
                 old_profile = cfg.profile_name
-                cfg, client = handle_config_command(line, session=session, cfg=cfg, client=client)
+                old_target = (cfg.model, rt.client)
+                cfg, _ = handle_config_command(line, session=session, cfg=cfg, client=rt.client)
                 reconcile_runtime(cfg, rt)
+                jobs.probe_index = rt.probe_index
+                jobs.resize(resolve_slots(cfg))
+                if history.max_entries != cfg.history_max:
+                    history.max_entries = cfg.history_max
+                    history.prune()
+                if not cfg.sessions and journal is not None:
+                    journal.close()
+                    journal = None
+                elif cfg.sessions and journal is None:
+                    journal = store.new()
+                if cfg.warmup and (cfg.model, rt.client) != old_target:
+                    warm.start(rt.client, cfg.model, provider=cfg.provider)
+                conv.context_turns = cfg.context_turns
+                conv.context_tokens = cfg.context_tokens
+                conv.count_tokens = get_token_counter(cfg.tokenizer)
                 if cfg.profile_name != old_profile:
-                    messages = [{"role": "system", "content": resolve_profile(cfg).text}]
+                    conv.reset(resolve_profile(cfg).text)
+                    if journal is not None:
+                        journal.reset()
                     print("Profile changed; conversation history cleared.")
                 else:
-                    messages[0] = {"role": "system", "content": resolve_profile(cfg).text}
+                    conv.set_system(resolve_profile(cfg).text)
                 continue
 
             elif cmd.startswith("bindings"):
@@ -450,38 +925,72 @@ def repl(*, client, cfg: AppConfig):
         # !shell commands
         elif line.startswith("!"):
             shell_cmd = line[1:].strip()
-            if shell_cmd:
-                rc = execute_command(shell_cmd)
+            background = shell_cmd.startswith("&")
+            if background:
+                shell_cmd = shell_cmd[1:].strip()
+            elif bg_mode and ffmpeg_argv(shell_cmd) is not None:
+                background = True
+            if ffmpeg_argv(shell_cmd) is not None:
+                last_cmd = shell_cmd
+            is_ffmpeg = ffmpeg_argv(shell_cmd) is not None
+            if shell_cmd and background:
+                job = jobs.submit(shell_cmd)
+                if is_ffmpeg and last_prompt:
+                    job_prompts[job.id], last_prompt = last_prompt, ""
+                running, queued = jobs.counts()
+                print(f"[job {job.id}] {job.state} ({running} running, {queued} queued)  log: {job.log_path}")
+            elif shell_cmd:
+                rc = execute_command(shell_cmd, probe_index=rt.probe_index)
                 if rc != 0:
                     print(f"Shell command exited {rc}", file=sys.stderr)
+                elif is_ffmpeg and last_prompt and rt.recall is not None:
+                    rt.recall.add(last_prompt, shell_cmd)
+                if is_ffmpeg:
+                    last_prompt = ""
             continue
 
-        # LLM request
-        messages.append({"role": "user", "content": line})
-        messages = trim_messages(messages, keep_last_turns=cfg.context_turns)
-
-        raw, cmd = generate_ffmpeg_command(messages, client, cfg.model)
-        if not cmd:
-            print("Failed to generate a command.", file=sys.stderr)
-            print(raw)
-            messages.pop()
-            continue
+        # answered before? (instant from history, or few-shot examples for the model);
+        # follow-ups mid-conversation only get examples, since they lean on earlier turns
+        hit, shots = consult(rt.recall, line, threshold=cfg.recall_threshold, examples=cfg.recall_examples,
+                             instant=len(conv) == 0)
+        if hit is not None:
+            rt.recall.touch(hit.id)
+            last_hit = hit.id
+            print(f"(from history, {hit.similarity:.0%} match for \"{hit.prompt}\"; /recall forget if it's wrong)")
+            user_msg = line
+            conv.append("user", user_msg)
+            raw = cmd = hit.command
+        else:
+            # LLM request
+            user_msg = augment_prompt(line, rt.probe_index)
+            conv.append("user", user_msg)
+
+            result = ask(with_examples(conv.messages(), shots))
+            if result is None:
+                print("Generation cancelled.", file=sys.stderr)
+                conv.pop()
+                continue
+            raw, cmd = result
+            if not cmd:
+                print("Failed to generate a command.", file=sys.stderr)
+                print(raw)
+                conv.pop()
+                continue
 
-        messages.append({"role": "assistant", "content": raw})
-        messages = trim_messages(messages, keep_last_turns=cfg.context_turns)
+        conv.append("assistant", raw)
+        remember(user_msg, raw)
+        last_prompt = line
 
         if cfg.copy:
             pyperclip.copy(cmd)
-        prefill = "!" + " ".join(cmd.splitlines()).strip()
-
-
-def trim_messages(messages: list[dict], keep_last_turns: int = 12) -> list[dict]:
-    if keep_last_turns <= 0:
-        return messages[:1]  # keep only system
-
-    system = messages[0:1]
-    rest = messages[1:]
-    max_msgs = keep_last_turns * 2
-    if len(rest) <= max_msgs:
-        return messages
-    return system + rest[-max_msgs:]
+        prefill = "!" + one_line(cmd)
+        last_cmd = prefill[1:]
+        if cfg.auto_estimate:
+            estimate(last_cmd, samples=cfg.estimate_samples, length=cfg.estimate_seconds,
+                     probe_index=rt.probe_index, min_duration=AUTO_MIN_DURATION_S)
+
+    finish_jobs(jobs)
+    history.close()
+    if journal is not None:
+        journal.close()
+    close_runtime(rt)  # pool lease, router prober, cache/probe/recall databases
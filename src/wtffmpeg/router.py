@@ -0,0 +1,196 @@
+"""Latency-aware routing across several OpenAI-compatible endpoints.
+
+EndpointRouter quacks like the subset of the OpenAI client that wtff uses
+(`chat.completions.create` and `models.list`), so the rest of the code does not
+need to know whether it is talking to one box or several.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Optional
+
+DEFAULT_EWMA_ALPHA = 0.3
+DEFAULT_PROBE_INTERVAL_S = 15.0
+
+# Errors that would fail identically on every endpoint; don't fail over on them.
+_NON_RETRYABLE_STATUS = {400, 401, 403, 422}
+
+
+@dataclass
+class Endpoint:
+    url: str
+    client: Any
+    ewma_ms: Optional[float] = None
+    healthy: bool = True
+    requests: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+    ejected_at: float = 0.0
+
+
+def _is_retryable(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None)
+    return status not in _NON_RETRYABLE_STATUS
+
+
+class EndpointRouter:
+    """
+    Send each request to the healthy endpoint with the lowest recent latency
+    (EWMA), failing over to the next one on error. Failed endpoints are ejected
+    and re-probed with `models.list()` from a background thread until they answer.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[Endpoint],
+        *,
+        alpha: float = DEFAULT_EWMA_ALPHA,
+        probe_interval_s: float = DEFAULT_PROBE_INTERVAL_S,
+        max_retries: Optional[int] = None,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointRouter needs at least one endpoint")
+        self.endpoints = endpoints
+        self.alpha = alpha
+        self.probe_interval_s = probe_interval_s
+        # failovers per request; None tries every endpoint once
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._prober: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        self._local = threading.local()  # endpoint that served this thread's last request
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.models = SimpleNamespace(list=self._list_models)
+
+    @property
+    def base_url(self) -> str:
+        # The primary endpoint stands for the pool (e.g. in cache keys).
+        return self.endpoints[0].url
+
+    @property
+    def last_url(self) -> Optional[str]:
+        return getattr(self._local, "url", None)
+
+    def ranked(self) -> list[Endpoint]:
+        """Healthy endpoints by EWMA (untried first), then ejected ones as a last resort."""
+        with self._lock:
+            healthy = [ep for ep in self.endpoints if ep.healthy]
+            ejected = [ep for ep in self.endpoints if not ep.healthy]
+        healthy.sort(key=lambda ep: -1.0 if ep.ewma_ms is None else ep.ewma_ms)
+        ejected.sort(key=lambda ep: ep.ejected_at)
+        return healthy + ejected
+
+    def observe(self, ep: Endpoint, elapsed_ms: float) -> None:
+        with self._lock:
+            ep.requests += 1
+            if ep.ewma_ms is None:
+                ep.ewma_ms = elapsed_ms
+            else:
+                ep.ewma_ms = self.alpha * elapsed_ms + (1 - self.alpha) * ep.ewma_ms
+            if not ep.healthy:
+                ep.healthy = True
+                ep.last_error = None
+
+    def readmit(self, ep: Endpoint) -> None:
+        # Probe latency (models.list) says nothing about generation latency,
+        # so it only restores health and leaves the EWMA alone.
+        with self._lock:
+            ep.healthy = True
+            ep.last_error = None
+
+    def eject(self, ep: Endpoint, exc: Exception) -> None:
+        with self._lock:
+            ep.failures += 1
+            ep.last_error = f"{type(exc).__name__}: {exc}"
+            if ep.healthy:
+                ep.healthy = False
+                ep.ejected_at = time.monotonic()
+        self._ensure_prober()
+
+    def _call(self, fn_name: str, *, offset: int = 0, **kwargs) -> Any:
+        last_exc: Optional[Exception] = None
+        eps = self.ranked()
+        if offset and len(eps) > 1:
+            eps = eps[offset:] + eps[:offset]
+        if self.max_retries is not None:
+            eps = eps[: self.max_retries + 1]
+        for ep in eps:
+            t0 = time.perf_counter()
+            try:
+                if fn_name == "create":
+                    result = ep.client.chat.completions.create(**kwargs)
+                else:
+                    result = ep.client.models.list()
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                self.eject(ep, e)
+                last_exc = e
+                continue
+            # For streams this is time-to-headers, which is what routing cares about.
+            self.observe(ep, (time.perf_counter() - t0) * 1000)
+            self._local.url = ep.url
+            return result
+        assert last_exc is not None
+        raise last_exc
+
+    def _create(self, **kwargs) -> Any:
+        return self._call("create", **kwargs)
+
+    def create_hedge(self, **kwargs) -> Any:
+        """create() for a hedged duplicate: starts at the second-best endpoint."""
+        return self._call("create", offset=1, **kwargs)
+
+    def _list_models(self) -> Any:
+        return self._call("list")
+
+    def ping(self) -> list[dict]:
+        """Probe every endpoint once; returns one status dict per endpoint."""
+        rows = []
+        for ep in self.endpoints:
+            t0 = time.perf_counter()
+            try:
+                ep.client.models.list()
+            except Exception as e:
+                self.eject(ep, e)
+                rows.append({"url": ep.url, "ok": False, "ms": None, "ewma_ms": ep.ewma_ms, "error": ep.last_error})
+                continue
+            ms = (time.perf_counter() - t0) * 1000
+            self.readmit(ep)
+            rows.append({"url": ep.url, "ok": True, "ms": ms, "ewma_ms": ep.ewma_ms, "error": None})
+        return rows
+
+    def _ensure_prober(self) -> None:
+        with self._lock:
+            if self._prober is not None and self._prober.is_alive():
+                return
+            self._prober = threading.Thread(target=self._probe_loop, name="wtff-endpoint-probe", daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self) -> None:
+        while not self._closed.wait(self.probe_interval_s):
+            with self._lock:
+                ejected = [ep for ep in self.endpoints if not ep.healthy]
+                if not ejected:
+                    # under the lock, so an eject() from now on starts a new prober
+                    self._prober = None
+                    return
+            for ep in ejected:
+                try:
+                    ep.client.models.list()
+                except Exception as e:
+                    with self._lock:
+                        ep.last_error = f"{type(e).__name__}: {e}"
+                    continue
+                self.readmit(ep)
+
+    def close(self) -> None:
+        self._closed.set()
+        for ep in self.endpoints:
+            close = getattr(ep.client, "close", None)
+            if close is not None:
+                close()
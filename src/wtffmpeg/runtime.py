@@ -1,43 +1,95 @@
 from dataclasses import dataclass
 from typing import Optional, Any, Tuple
 from .profiles import load_profile
-from .llm import build_client
+from .llm import build_client, generation_params
+from .cache import open_cache
+from .media import open_probe_index
+from .validate import open_validator
+from .metrics import open_metrics
+from .recall import open_recall
 
 @dataclass
 class RuntimeState:
     client: Optional[Any] = None
     profile: Optional[Any] = None
+    cache: Optional[Any] = None
+    probe_index: Optional[Any] = None
+    validator: Optional[Any] = None
+    metrics: Optional[Any] = None
+    gen_params: Optional[dict] = None
+    recall: Optional[Any] = None
 
     # fingerprints for deterministic rebuilds
     _client_fp: Optional[Tuple] = None
     _profile_fp: Optional[Tuple] = None
+    _cache_fp: Optional[Tuple] = None
+    _probe_fp: Optional[Tuple] = None
+    _validator_fp: Optional[Tuple] = None
+    _metrics_fp: Optional[Tuple] = None
+    _gen_fp: Optional[Tuple] = None
+    _recall_fp: Optional[Tuple] = None
 
     # tools_registry: Optional[Tools] = None
     # _tools_fp: Optional[Tuple] = None
 
 
 def client_fingerprint(cfg) -> tuple:
+    # model is sent per request and does not affect the client itself
     return (
         cfg.provider,
         cfg.base_url,
-        cfg.model,
-        bool(cfg.openai_api_key),  
+        cfg.endpoints,
+        cfg.openai_api_key,
+        cfg.bearer_token,
         # cfg.api_key_source
         # include anything else that affects client construction:
-        getattr(cfg, "timeout_s", None),
-        getattr(cfg, "max_retries", None),
+        cfg.timeout_s,
+        cfg.connect_timeout_s,
+        cfg.max_retries,
+        cfg.hedge,
+        cfg.hedge_after_ms,
+        cfg.http2,
+        cfg.pool_connections,
+        cfg.pool_keepalive,
+        cfg.model_path,
+        cfg.local_threads,
+        cfg.num_ctx,
     )
 
 def profile_fingerprint(cfg) -> tuple:
     # add anything else that changes load semantics
     return (cfg.profile_name, cfg.profile_dir)
 
+def cache_fingerprint(cfg) -> tuple:
+    return (cfg.cache, cfg.cache_max_mb, cfg.cache_max_age_days)
+
+def probe_fingerprint(cfg) -> tuple:
+    return (cfg.probe,)
+
+def validator_fingerprint(cfg) -> tuple:
+    return (cfg.validate,)
+
+def generation_fingerprint(cfg) -> tuple:
+    # the profile's front matter supplies defaults, so it is part of the key
+    return (profile_fingerprint(cfg), cfg.provider, cfg.max_tokens, cfg.stop, cfg.reasoning_effort,
+            cfg.num_predict, cfg.num_ctx)
+
+def recall_fingerprint(cfg) -> tuple:
+    return (cfg.recall,)
+
+def metrics_fingerprint(cfg) -> tuple:
+    return (cfg.metrics, cfg.metrics_max_mb)
+
 def reconcile_runtime(cfg, rt: RuntimeState, *, force: bool = False) -> RuntimeState:
     # client
     cfp = client_fingerprint(cfg)
     if force or rt.client is None or rt._client_fp != cfp:
-        rt.client = build_client(cfg)
+        # build first: the new client leases the old one's pool while it's still warm
+        old, rt.client = rt.client, build_client(cfg)
         rt._client_fp = cfp
+        close = getattr(old, "close", None)
+        if close is not None:
+            close()  # returns its pool lease; routers also stop their prober
 
     # profile
     pfp = profile_fingerprint(cfg)
@@ -45,4 +97,57 @@ def reconcile_runtime(cfg, rt: RuntimeState, *, force: bool = False) -> RuntimeS
         rt.profile = load_profile(cfg.profile_name, cfg.profile_dir)  
         rt._profile_fp = pfp
 
+    # generation limits (max_tokens, stop, reasoning effort, Ollama options)
+    gfp = generation_fingerprint(cfg)
+    if force or rt.gen_params is None or rt._gen_fp != gfp:
+        rt.gen_params = generation_params(cfg, rt.profile)
+        rt._gen_fp = gfp
+
+    # response cache
+    kfp = cache_fingerprint(cfg)
+    if force or rt._cache_fp != kfp:
+        if rt.cache is not None:
+            rt.cache.close()
+        rt.cache = open_cache(cfg)
+        rt._cache_fp = kfp
+
+    # ffprobe metadata index
+    mfp = probe_fingerprint(cfg)
+    if force or rt._probe_fp != mfp:
+        if rt.probe_index is not None:
+            rt.probe_index.close()
+        rt.probe_index = open_probe_index(cfg)
+        rt._probe_fp = mfp
+
+    # ffmpeg option/filter validator (index is loaded on first use)
+    vfp = validator_fingerprint(cfg)
+    if force or rt._validator_fp != vfp:
+        rt.validator = open_validator(cfg)
+        rt._validator_fp = vfp
+
+    # request telemetry
+    tfp = metrics_fingerprint(cfg)
+    if force or rt._metrics_fp != tfp:
+        rt.metrics = open_metrics(cfg)
+        rt._metrics_fp = tfp
+
+    # past (prompt, command) pairs
+    rfp = recall_fingerprint(cfg)
+    if force or rt._recall_fp != rfp:
+        if rt.recall is not None:
+            rt.recall.close()
+        rt.recall = open_recall(cfg)
+        rt._recall_fp = rfp
+
     return rt
+
+def close_runtime(rt: RuntimeState) -> None:
+    """Release what rt holds open: the client's pool lease (and router prober), sqlite handles."""
+    close = getattr(rt.client, "close", None)
+    if close is not None:
+        close()
+    for store in (rt.cache, rt.probe_index, rt.recall):
+        if store is not None:
+            store.close()
+    rt.client = rt.cache = rt.probe_index = rt.recall = None
+    rt._client_fp = rt._cache_fp = rt._probe_fp = rt._recall_fp = None
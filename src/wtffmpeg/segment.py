@@ -0,0 +1,253 @@
+"""Segment-parallel execution of single-input ffmpeg encodes (`/segment [N]`).
+
+The input is cut at video keyframes (found with ffprobe, demux only) into N
+roughly equal pieces. The video part of the generated command then runs on every
+piece in parallel, audio is encoded in one separate pass so there are no gaps at
+the joins (skipped when the command drops audio with -an), and the results are
+joined with the concat demuxer using `-c copy`. Commands with -map, filtergraphs
+spanning inputs, seeking or trimming are refused: they don't split this way.
+Neither do audio-only (-vn) commands, nor inputs with subtitle streams unless
+the command drops them with -sn: the pieces carry no subtitles. (Data and
+attachment streams are only kept with -map, which is refused anyway.) Filters
+that depend on absolute time (fades, setpts) see each segment starting at zero.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .ffcmd import ffmpeg_argv
+
+MIN_SEGMENT_S = 10.0
+KEYFRAME_TIMEOUT_S = 600.0
+
+# options that make the command not splittable along the timeline
+_REFUSED = {"-map", "-filter_complex", "-lavfi", "-ss", "-sseof", "-to", "-t", "-itsoffset", "-frames",
+            "-vframes", "-stream_loop", "-shortest"}
+# options of the final container that must survive the concat/copy step
+_CONTAINER_OPTS = {"-f", "-movflags", "-brand", "-metadata"}
+_ACODEC_OPTS = {"-c:a", "-codec:a", "-acodec"}
+
+
+@dataclass
+class SegmentPlan:
+    ffmpeg: str
+    input: str
+    output: str
+    pre_input: list[str]
+    out_opts: list[str]
+    overwrite: bool
+    container_opts: list[str] = field(default_factory=list)
+    audio: bool = True  # False when the command drops audio (-an), so there is no audio pass
+
+
+def _opt_name(tok: str) -> str:
+    return tok.split(":", 1)[0]
+
+
+def plan_command(command: str) -> SegmentPlan:
+    """Take a generated command apart; ValueError if it can't be split safely."""
+    argv = ffmpeg_argv(command)
+    if argv is None:
+        raise ValueError("not a plain ffmpeg command (pipes/redirections aren't supported)")
+    inputs = [i for i, tok in enumerate(argv) if tok == "-i"]
+    if len(inputs) != 1 or inputs[0] + 1 >= len(argv):
+        raise ValueError("segmenting needs exactly one -i input")
+    refused = sorted({tok for tok in argv if _opt_name(tok) in _REFUSED})
+    if refused:
+        raise ValueError(f"cannot segment commands using {', '.join(refused)}")
+    output = argv[-1]
+    i = inputs[0]
+    if output.startswith("-") or i + 2 >= len(argv):
+        raise ValueError("could not find the output file (it must be the last argument)")
+    if "%" in output or output.startswith(("pipe:", "-")):
+        raise ValueError("output must be a single regular file")
+
+    out_opts = argv[i + 2:-1]
+    if "-vn" in out_opts:
+        raise ValueError("audio-only commands have no video to split")
+    audio = "-an" not in out_opts
+    for j, tok in enumerate(out_opts[:-1]):
+        if tok in _ACODEC_OPTS and out_opts[j + 1] == "none":
+            audio = False
+        name = _opt_name(tok)
+        if name in ("-c", "-codec", "-c:v", "-codec:v", "-vcodec") and out_opts[j + 1] == "copy":
+            raise ValueError("stream copy is already as fast as it gets")
+
+    container_opts: list[str] = []
+    for j, tok in enumerate(out_opts[:-1]):
+        if _opt_name(tok) in _CONTAINER_OPTS:
+            container_opts += [tok, out_opts[j + 1]]
+
+    pre = argv[1:i]
+    return SegmentPlan(
+        ffmpeg=argv[0],
+        input=argv[i + 1],
+        output=output,
+        pre_input=[t for t in pre if t not in ("-y", "-n")],
+        out_opts=out_opts,
+        overwrite="-y" in pre or "-y" in out_opts,
+        container_opts=container_opts,
+        audio=audio,
+    )
+
+
+def keyframe_times(path: str, ffprobe: str = "ffprobe") -> list[float]:
+    """Presentation times of video keyframes (from packet flags; no decoding)."""
+    proc = subprocess.run(
+        [ffprobe, "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags",
+         "-of", "csv=p=0", path],
+        capture_output=True,
+        text=True,
+        timeout=KEYFRAME_TIMEOUT_S,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip() or f"ffprobe exited {proc.returncode}")
+    times: list[float] = []
+    for line in proc.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            try:
+                times.append(float(pts))
+            except ValueError:
+                pass
+    return sorted(set(times))
+
+
+def choose_cuts(keyframes: list[float], start: float, duration: float, n: int) -> list[float]:
+    """Up to n-1 keyframe times (relative to start) that split the input evenly."""
+    rel = [t - start for t in keyframes if t - start > 0]
+    n = max(1, min(n, int(duration // MIN_SEGMENT_S) or 1))
+    cuts: list[float] = []
+    for k in range(1, n):
+        idx = bisect_left(rel, duration * k / n)
+        if idx >= len(rel):
+            break
+        t = rel[idx]
+        if t < duration - 1.0 and (not cuts or t > cuts[-1]):
+            cuts.append(t)
+    return cuts
+
+
+def _concat_line(path: Path) -> str:
+    return "file '" + str(path).replace("'", "'\\''") + "'\n"
+
+
+def _run(argv: list[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(argv, stdin=subprocess.DEVNULL, capture_output=True, text=True, errors="replace")
+
+
+def _tail(text: str, n: int = 15) -> str:
+    return "\n".join(text.strip().splitlines()[-n:])
+
+
+def segment_encode(command: str, *, n: int, probe_index=None, ffprobe: str | None = None) -> int:
+    """Run `command` split into up to n parallel segments. Returns an exit code."""
+    try:
+        plan = plan_command(command)
+    except ValueError as e:
+        print(f"Cannot segment: {e}", file=sys.stderr)
+        return 2
+
+    ffprobe = ffprobe or shutil.which("ffprobe")
+    if ffprobe is None:
+        print("Cannot segment: ffprobe not found on PATH", file=sys.stderr)
+        return 2
+    out = Path(plan.output)
+    if out.exists() and not plan.overwrite:
+        print(f"Cannot segment: {out} exists (add -y to overwrite)", file=sys.stderr)
+        return 2
+
+    from .media import run_ffprobe
+
+    src = Path(plan.input)
+    info = (probe_index.probe(src) if probe_index is not None else None) or run_ffprobe(src, ffprobe)
+    fmt = (info or {}).get("format") or {}
+    try:
+        duration = float(fmt["duration"])
+    except (KeyError, TypeError, ValueError):
+        print("Cannot segment: input duration unknown", file=sys.stderr)
+        return 2
+    start = float(fmt.get("start_time") or 0.0)
+    streams = (info or {}).get("streams", [])
+    has_audio = plan.audio and any(s.get("codec_type") == "audio" for s in streams)
+    if "-sn" not in plan.out_opts and any(s.get("codec_type") == "subtitle" for s in streams):
+        print("Cannot segment: the input has subtitles, which would be lost; add -sn to drop them"
+              " or run the command normally.", file=sys.stderr)
+        return 2
+
+    t0 = time.monotonic()
+    try:
+        cuts = choose_cuts(keyframe_times(plan.input, ffprobe), start, duration, n)
+    except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+        print(f"Cannot segment: keyframe scan failed: {e}", file=sys.stderr)
+        return 1
+    if not cuts:
+        print("Input too short or too few keyframes to split; run the command normally.", file=sys.stderr)
+        return 2
+
+    bounds = [0.0, *cuts, duration]
+    nseg = len(bounds) - 1
+    print(f"Splitting at {nseg - 1} keyframes into {nseg} segments ({time.monotonic() - t0:.1f}s scan).")
+
+    threads_set = any(_opt_name(t) == "-threads" for t in plan.out_opts)
+    threads = ["-threads", str(max(1, (os.cpu_count() or 1) // nseg))] if not threads_set else []
+    ext = out.suffix or ".mkv"
+    base = [plan.ffmpeg, "-nostdin", "-hide_banner", "-y", *plan.pre_input]
+
+    tmp = Path(tempfile.mkdtemp(prefix=".wtff-seg-", dir=out.parent if str(out.parent) else "."))
+    try:
+        jobs: dict[str, list[str]] = {}
+        seg_paths = []
+        for k in range(nseg):
+            seg = tmp / f"seg{k:04d}{ext}"
+            seg_paths.append(seg)
+            seek = ["-ss", f"{bounds[k]:.6f}"] if bounds[k] > 0 else []
+            limit = ["-t", f"{bounds[k + 1] - bounds[k]:.6f}"] if k < nseg - 1 else []
+            jobs[f"segment {k + 1}/{nseg}"] = [
+                *base, *seek, *limit, "-i", plan.input, *plan.out_opts, *threads, "-an", "-sn", "-dn", str(seg)
+            ]
+        audio = tmp / f"audio{ext}"
+        if has_audio:
+            jobs["audio"] = [*base, "-i", plan.input, *plan.out_opts, "-vn", "-sn", "-dn", str(audio)]
+
+        with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="wtff-seg") as pool:
+            futures = {pool.submit(_run, argv): name for name, argv in jobs.items()}
+            failed = None
+            for fut in as_completed(futures):
+                name, proc = futures[fut], fut.result()
+                if proc.returncode != 0 and failed is None:
+                    failed = (name, proc)
+                print(f"  {name}: {'done' if proc.returncode == 0 else f'failed (rc {proc.returncode})'}"
+                      f" at {time.monotonic() - t0:.1f}s")
+        if failed is not None:
+            print(f"{failed[0]} failed:\n{_tail(failed[1].stderr)}", file=sys.stderr)
+            return failed[1].returncode or 1
+
+        listing = tmp / "segments.txt"
+        listing.write_text("".join(_concat_line(p.resolve()) for p in seg_paths), encoding="utf-8")
+        join = [plan.ffmpeg, "-nostdin", "-hide_banner", "-y" if plan.overwrite else "-n",
+                "-f", "concat", "-safe", "0", "-i", str(listing)]
+        if has_audio:
+            join += ["-i", str(audio), "-map", "0:v", "-map", "1:a"]
+        join += ["-c", "copy", *plan.container_opts, plan.output]
+        proc = _run(join)
+        if proc.returncode != 0:
+            print(f"concat failed:\n{_tail(proc.stderr)}", file=sys.stderr)
+            return proc.returncode
+        print(f"Done in {time.monotonic() - t0:.1f}s: {plan.output}")
+        return 0
+    except KeyboardInterrupt:
+        # children share our process group and got the SIGINT as well
+        print("Segmented encode interrupted.", file=sys.stderr)
+        return 130
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,352 @@
+"""Team-shared translation service (`wtff serve`).
+
+A small HTTP JSON API in front of the single-shot pipeline (profile, recall,
+cache, generation, extraction, validation), so a team shares one wtff and one
+set of warm connections and caches instead of every laptop calling the model.
+
+    POST /v1/translate   {"prompt": "...", "profile": "minimal", "model": "..."}
+                      -> {"command": "...", "raw": "...", "coalesced": false, "latency": 0.41}
+    GET  /healthz
+    GET  /metrics        Prometheus text: queue depth, in-flight, latency quantiles
+
+Identical requests that arrive while one is already in flight wait for that
+one's answer instead of making their own upstream call (singleflight), so a
+burst of identical CI jobs costs one inference. Each client (X-Client-Id
+header, else its address) may have at most `per_client` requests in flight;
+beyond that it gets 429. At most `upstream` calls run against the model at
+once; the rest queue.
+
+Prompts mentioning local files are not ffprobe'd: paths would refer to the
+caller's machine, not the server's.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+from .metrics import percentile
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_PER_CLIENT = 4
+DEFAULT_UPSTREAM = 8
+MAX_BODY_BYTES = 64 * 1024
+MAX_PROMPT_CHARS = 4000
+LATENCY_WINDOW = 1000
+
+_PROFILE_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+
+
+class SingleFlight:
+    """Run fn once per key among concurrent callers; everyone gets the leader's result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, tuple[threading.Event, dict]] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """(result, shared); shared is True for callers that waited on someone else's call."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = (threading.Event(), {})
+        done, slot = call
+        if not leader:
+            done.wait()
+            if "error" in slot:
+                raise slot["error"]
+            return slot["result"], True
+        try:
+            slot["result"] = fn()
+            return slot["result"], False
+        except BaseException as e:
+            slot["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            done.set()
+
+
+class ClientLimiter:
+    """At most `limit` concurrent requests per client id (non-blocking)."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._active: dict[str, int] = {}
+
+    def try_acquire(self, client: str) -> bool:
+        with self._lock:
+            n = self._active.get(client, 0)
+            if self.limit > 0 and n >= self.limit:
+                return False
+            self._active[client] = n + 1
+            return True
+
+    def release(self, client: str) -> None:
+        with self._lock:
+            n = self._active.get(client, 1) - 1
+            if n <= 0:
+                self._active.pop(client, None)
+            else:
+                self._active[client] = n
+
+
+class ServerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.in_flight = 0
+        self.queued = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.upstream_latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, **deltas: int) -> None:
+        with self._lock:
+            for k, v in deltas.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def observe(self, latency: float, *, upstream: float | None = None) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            if upstream is not None:
+                self.upstream_latencies.append(upstream)
+
+    def prometheus(self) -> str:
+        with self._lock:
+            lat, up = list(self.latencies), list(self.upstream_latencies)
+            lines = [
+                "# TYPE wtff_requests_total counter", f"wtff_requests_total {self.requests}",
+                "# TYPE wtff_errors_total counter", f"wtff_errors_total {self.errors}",
+                "# TYPE wtff_rejected_total counter", f"wtff_rejected_total {self.rejected}",
+                "# TYPE wtff_coalesced_total counter", f"wtff_coalesced_total {self.coalesced}",
+                "# TYPE wtff_upstream_calls_total counter", f"wtff_upstream_calls_total {self.upstream_calls}",
+                "# TYPE wtff_in_flight gauge", f"wtff_in_flight {self.in_flight}",
+                "# TYPE wtff_queue_depth gauge", f"wtff_queue_depth {self.queued}",
+            ]
+        for name, xs in (("wtff_request_latency_seconds", lat), ("wtff_upstream_latency_seconds", up)):
+            lines.append(f"# TYPE {name} summary")
+            for q in (0.5, 0.95, 0.99):
+                v = percentile(xs, q)
+                lines.append(f'{name}{{quantile="{q}"}} {v if v is not None else "NaN"}')
+            lines.append(f"{name}_sum {sum(xs)}")
+            lines.append(f"{name}_count {len(xs)}")
+        return "\n".join(lines) + "\n"
+
+
+class TranslationService:
+    """The single-shot pipeline with warm state, singleflight and upstream concurrency control."""
+
+    def __init__(self, cfg, *, per_client: int = DEFAULT_PER_CLIENT, upstream: int = DEFAULT_UPSTREAM):
+        from .runtime import RuntimeState, reconcile_runtime
+
+        # paths in prompts belong to the callers' machines
+        self.cfg = replace(cfg, probe=False)
+        self.rt = RuntimeState()
+        reconcile_runtime(self.cfg, self.rt)
+        self.flight = SingleFlight()
+        self.limiter = ClientLimiter(per_client)
+        self.upstream = threading.BoundedSemaphore(max(1, upstream))
+        self.stats = ServerStats()
+        self._profiles: dict[str, Any] = {self.cfg.profile_name: self.rt.profile}
+        self._profiles_lock = threading.Lock()
+
+    def profile(self, name: str):
+        """Loaded Profile by name (cached); ValueError/OSError if there is no such profile."""
+        from .config import resolve_profile
+
+        with self._profiles_lock:
+            if name not in self._profiles:
+                self._profiles[name] = resolve_profile(replace(self.cfg, profile_name=name))
+            return self._profiles[name]
+
+    def translate(self, prompt: str, *, profile: str | None = None, model: str | None = None) -> dict:
+        from .llm import generation_params
+        from .oneshot import translate_once
+
+        cfg = replace(self.cfg, prompt_once=prompt, model=model or self.cfg.model,
+                      profile_name=profile or self.cfg.profile_name)
+        prof = self.profile(cfg.profile_name)
+        key = hashlib.sha256(json.dumps(
+            [cfg.model, prof.text, " ".join(prompt.split()), generation_params(cfg, prof)],
+            sort_keys=True, default=str,
+        ).encode()).hexdigest()
+
+        def call() -> dict:
+            self.stats.add(queued=1)
+            try:
+                self.upstream.acquire()
+            finally:
+                self.stats.add(queued=-1)
+            try:
+                self.stats.add(upstream_calls=1)
+                t0 = time.perf_counter()
+                raw, cmd, note = translate_once(
+                    cfg, client=self.rt.client, profile=prof, cache=self.rt.cache, validator=self.rt.validator,
+                    metrics=self.rt.metrics, recall=self.rt.recall,
+                )
+                return {"raw": raw, "command": cmd, "from_history": note is not None,
+                        "upstream_latency": time.perf_counter() - t0}
+            finally:
+                self.upstream.release()
+
+        result, shared = self.flight.do(key, call)
+        return {**result, "coalesced": shared}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "TranslationServer"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, obj: dict) -> None:
+        self._send(status, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def do_GET(self):
+        svc = self.server.service
+        if self.path == "/healthz":
+            self._json(200, {"ok": True, "model": svc.cfg.model, "profile": svc.cfg.profile_name})
+        elif self.path == "/metrics":
+            self._send(200, svc.stats.prometheus().encode(), "text/plain; version=0.0.4")
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        svc = self.server.service
+        if self.path != "/v1/translate":
+            self._json(404, {"error": "not found"})
+            return
+        # without a usable length the body can't be read (or skipped), so the connection goes too
+        header = self.headers.get("Content-Length")
+        if header is None:
+            self.close_connection = True
+            self._json(411, {"error": "Content-Length required"})
+            return
+        if not re.fullmatch(r"[0-9]+", header.strip()):
+            self.close_connection = True
+            self._json(400, {"error": "bad Content-Length"})
+            return
+        length = int(header)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._json(413, {"error": "request body too large"})
+            return
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+            prompt = str(req.get("prompt") or "").strip()
+            profile = req.get("profile")
+            model = req.get("model")
+        except (ValueError, AttributeError):
+            self._json(400, {"error": "expected a JSON object"})
+            return
+        if not prompt or len(prompt) > MAX_PROMPT_CHARS:
+            self._json(400, {"error": f"prompt must be 1..{MAX_PROMPT_CHARS} characters"})
+            return
+        if profile is not None and not _PROFILE_NAME_RE.match(str(profile)):
+            self._json(400, {"error": "profile must be a profile name"})
+            return
+
+        try:
+            svc.profile(profile or svc.cfg.profile_name)
+        except (OSError, ValueError) as e:
+            self._json(400, {"error": f"unknown profile: {e}"})
+            return
+
+        client = self.headers.get("X-Client-Id") or self.client_address[0]
+        if not svc.limiter.try_acquire(client):
+            svc.stats.add(rejected=1)
+            self._json(429, {"error": f"too many concurrent requests for {client}"})
+            return
+        svc.stats.add(requests=1, in_flight=1)
+        t0 = time.perf_counter()
+        try:
+            result = svc.translate(prompt, profile=profile, model=model)
+        except Exception as e:
+            svc.stats.add(errors=1)
+            self._json(502, {"error": f"{type(e).__name__}: {e}"})
+            return
+        finally:
+            svc.stats.add(in_flight=-1)
+            svc.limiter.release(client)
+        latency = time.perf_counter() - t0
+        if result["coalesced"]:
+            svc.stats.add(coalesced=1)
+        svc.stats.observe(latency, upstream=None if result["coalesced"] else result["upstream_latency"])
+        status = 200 if result["command"] else 422
+        self._json(status, {
+            "command": result["command"],
+            "raw": result["raw"],
+            "from_history": result["from_history"],
+            "coalesced": result["coalesced"],
+            "latency": round(latency, 4),
+        })
+
+
+class TranslationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service: TranslationService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 *, verbose: bool = False):
+        super().__init__((host, port), _Handler)
+        self.service = service
+        self.verbose = verbose
+
+
+def serve_main(argv: list[str]) -> int:
+    """`wtff serve [--host H] [--port P] [--per-client N] [--upstream N] [wtff options...]`."""
+    p = argparse.ArgumentParser(prog="wtff serve", description="Serve translations over HTTP.")
+    p.add_argument("--host", default=DEFAULT_HOST, help=f"Bind address (default {DEFAULT_HOST}).")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default {DEFAULT_PORT}).")
+    p.add_argument("--per-client", type=int, default=DEFAULT_PER_CLIENT,
+                   help=f"Concurrent requests allowed per client (default {DEFAULT_PER_CLIENT}; 0 = no limit).")
+    p.add_argument("--upstream", type=int, default=DEFAULT_UPSTREAM,
+                   help=f"Concurrent model calls (default {DEFAULT_UPSTREAM}); the rest queue.")
+    p.add_argument("--verbose", action="store_true", help="Log every HTTP request to stderr.")
+    opts, rest = p.parse_known_args(argv)
+
+    from .cli import build_parser
+    from .config import resolve_config
+
+    # --model, --url, --profile, --config, --no-cache ... as for wtff itself
+    args = build_parser().parse_args(rest)
+    cfg = resolve_config(args, config_path=args.config)
+    service = TranslationService(cfg, per_client=opts.per_client, upstream=opts.upstream)
+    try:
+        server = TranslationServer(service, opts.host, opts.port, verbose=opts.verbose)
+    except OSError as e:
+        print(f"Cannot listen on {opts.host}:{opts.port}: {e}", file=sys.stderr)
+        return 1
+    host, port = server.server_address[:2]
+    print(f"wtff serving {cfg.model} on http://{host}:{port}/v1/translate (Ctrl-C to stop)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
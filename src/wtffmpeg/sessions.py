@@ -0,0 +1,246 @@
+"""Persistent REPL sessions (`/session`, `wtff --resume`).
+
+Every REPL session is journaled to ~/.wtffmpeg/sessions/<name>.jsonl, one JSON
+record per message, appended as the conversation grows. Records are flushed
+immediately (a crash of wtff loses nothing) and fsync'd in batches (at most
+every FSYNC_INTERVAL_S) so a long session doesn't pay a disk sync per turn.
+/reset writes a reset marker instead of rewriting the file.
+
+Resuming reads the journal backwards from the end and stops as soon as the
+context budget is full or a reset marker is reached, so load time depends on
+the budget, not on how long the session has been running.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+DEFAULT_SESSION_DIR = Path.home() / ".wtffmpeg" / "sessions"
+FSYNC_INTERVAL_S = 2.0
+READ_BLOCK = 64 * 1024
+KEEP_UNNAMED = 50  # auto-named journals kept around; older ones are pruned
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,99}$")
+_AUTO_RE = re.compile(r"^\d{8}-\d{6}-\d+$")
+
+
+def valid_name(name: str) -> bool:
+    return bool(_NAME_RE.match(name)) and not name.endswith(".jsonl")
+
+
+class SessionJournal:
+    """Append-only message journal for one session. Opened lazily on first write."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._f = None
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_sync = 0.0
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def name(self) -> str:
+        return self.path.stem
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps({"ts": round(time.time(), 3), **record}, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._f is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._f = open(self.path, "a", encoding="utf-8")
+                if self._f.tell() and not _ends_with_newline(self.path):
+                    self._f.write("\n")  # don't glue onto a line torn by a crash
+            self._f.write(line + "\n")
+            self._f.flush()
+            self._dirty = True
+            if time.monotonic() - self._last_sync >= FSYNC_INTERVAL_S:
+                self._sync()
+            elif self._timer is None:
+                # make sure a burst of records is on disk shortly after it ends
+                self._timer = threading.Timer(FSYNC_INTERVAL_S, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _sync(self) -> None:
+        # caller holds _lock
+        if self._f is not None and self._dirty:
+            try:
+                os.fsync(self._f.fileno())
+            except OSError:
+                pass
+            self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def sync(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._sync()
+
+    def append(self, role: str, content: str) -> None:
+        self._write({"role": role, "content": content})
+
+    def reset(self) -> None:
+        # nothing to reset in a journal that was never written
+        if self._f is not None or self.path.exists():
+            self._write({"reset": True})
+
+    def close(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._sync()
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _reverse_lines(path: Path) -> Iterator[bytes]:
+    """Lines of a file, last first, reading fixed-size blocks from the end."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        rest = b""
+        while pos > 0:
+            step = min(READ_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + rest).split(b"\n")
+            rest = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield line
+        if rest.strip():
+            yield rest
+
+
+def read_tail(
+    path: Path,
+    *,
+    max_messages: int,
+    max_tokens: Optional[int],
+    count_tokens: Callable[[str], int],
+) -> list[dict]:
+    """The newest messages since the last reset that fit the budget, oldest first."""
+    out: list[dict] = []
+    used = 0
+    if max_messages <= 0:
+        return out
+    for line in _reverse_lines(path):
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue  # torn last line after a crash
+        if rec.get("reset"):
+            break
+        role, content = rec.get("role"), rec.get("content")
+        if role not in ("user", "assistant") or not isinstance(content, str):
+            continue
+        used += count_tokens(content)
+        if out and max_tokens and used > max_tokens:
+            break
+        out.append({"role": role, "content": content})
+        if len(out) >= max_messages:
+            break
+    out.reverse()
+    # start on a prompt, not on a reply whose prompt didn't fit
+    while out and out[0]["role"] != "user":
+        out.pop(0)
+    return out
+
+
+class SessionStore:
+    def __init__(self, root: Path | None = None):
+        self.root = Path(root or DEFAULT_SESSION_DIR).expanduser()
+
+    def path(self, name: str) -> Path:
+        return self.root / f"{name}.jsonl"
+
+    def new(self) -> SessionJournal:
+        self.prune()
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        return SessionJournal(self.path(name))
+
+    def list(self) -> list[tuple[str, float, int]]:
+        """(name, mtime, size) of stored sessions, newest first."""
+        try:
+            entries = [(p.stem, p.stat()) for p in self.root.glob("*.jsonl")]
+        except OSError:
+            return []
+        entries.sort(key=lambda e: e[1].st_mtime, reverse=True)
+        return [(name, st.st_mtime, st.st_size) for name, st in entries]
+
+    def latest(self, exclude: Optional[str] = None) -> Optional[str]:
+        for name, _, _ in self.list():
+            if name != exclude:
+                return name
+        return None
+
+    def open(self, name: str) -> SessionJournal:
+        """Journal for an existing session (appends continue in the same file)."""
+        path = self.path(name)
+        if not valid_name(name) or not path.exists():
+            raise FileNotFoundError(f"No session named {name!r} in {self.root}")
+        return SessionJournal(path)
+
+    def save_as(self, journal: Optional[SessionJournal], name: str, messages: list[dict]) -> SessionJournal:
+        """Copy the journal under a new name and continue writing there.
+
+        Without a journal on disk (sessions=false, or nothing said yet) the
+        in-memory messages are written instead.
+        """
+        if not valid_name(name):
+            raise ValueError(f"Invalid session name {name!r} (letters, digits, '.', '_', '-')")
+        target = self.path(name)
+        if journal is not None and target == journal.path:
+            return journal
+        if target.exists():
+            raise FileExistsError(f"Session {name!r} already exists")
+        if journal is not None:
+            journal.close()
+        if journal is not None and journal.path.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(journal.path, target)
+            return SessionJournal(target)
+        new = SessionJournal(target)
+        for m in messages:
+            if m["role"] in ("user", "assistant"):
+                new.append(m["role"], m["content"])
+        new.sync()
+        return new
+
+    def prune(self, keep: int = KEEP_UNNAMED) -> None:
+        auto = [name for name, _, _ in self.list() if _AUTO_RE.match(name)]
+        for name in auto[keep:]:
+            try:
+                self.path(name).unlink()
+            except OSError:
+                pass
+
+
+def replay(conv, path: Path) -> int:
+    """Load the tail of a journal into a Conversation (after resetting it). Returns messages loaded."""
+    conv.reset()
+    budget = conv.context_tokens - conv.tokens if conv.context_tokens else None
+    msgs = read_tail(
+        path,
+        max_messages=max(conv.context_turns, 0) * 2,
+        max_tokens=budget,
+        count_tokens=conv.count_tokens,
+    )
+    for m in msgs:
+        conv.append(m["role"], m["content"])
+    return len(msgs)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class StartupTrace:
+    """Wall-clock timings of named startup phases, for `wtff --startup-trace`."""
+
+    def __init__(self):
+        self.enabled = False
+        self.t0 = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        # Always recorded (two perf_counter calls); `enabled` only gates report().
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self, file=None) -> None:
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        total = time.perf_counter() - self.t0
+        width = max([len(n) for n, _ in self.phases] + [len("total since cli import")])
+        print("startup trace:", file=file)
+        for name, dt in self.phases:
+            print(f"  {name:<{width}}  {dt * 1000:8.1f} ms", file=file)
+        print(f"  {'total since cli import':<{width}}  {total * 1000:8.1f} ms", file=file)
+        print("  (interpreter startup not included; see `python -X importtime -m wtffmpeg.cli`)", file=file)
+
+
+TRACE = StartupTrace()
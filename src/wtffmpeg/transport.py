@@ -0,0 +1,139 @@
+"""Process-wide HTTP connection pools shared by every LLM client.
+
+build_client runs at startup and again whenever /config changes a transport
+field, and each OpenAI() object used to bring its own httpx pool, so every
+rebuild dropped warm keep-alive connections (and leaked the old pool). Here one
+httpx client per (scheme, host, port, http2, limits) is shared by all OpenAI
+clients talking to that origin. Clients lease it and return it on close(), and
+the pool is closed when its last lease is returned.
+"""
+from __future__ import annotations
+
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+from .defaults import DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_KEEPALIVE
+
+KEEPALIVE_EXPIRY_S = 30.0
+OPENAI_ORIGIN = "https://api.openai.com"
+
+
+@dataclass
+class _Pool:
+    http_client: Any
+    leases: int = 0
+
+
+class TransportPool:
+    """Refcounted httpx clients keyed by origin and pool settings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: dict[tuple, _Pool] = {}
+        self.hits = 0
+        self.misses = 0
+        self._warned_http2 = False
+
+    def acquire(self, url: str, *, http2: bool = False, max_connections: int = DEFAULT_POOL_CONNECTIONS,
+                max_keepalive: int = DEFAULT_POOL_KEEPALIVE) -> tuple[tuple, Any]:
+        """(key, http_client) for url; pair every acquire with a release(key)."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port, http2, max_connections, max_keepalive)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                self.misses += 1
+                pool = self._pools[key] = _Pool(self._new_client(http2, max_connections, max_keepalive))
+            else:
+                self.hits += 1
+            pool.leases += 1
+            return key, pool.http_client
+
+    def _new_client(self, http2: bool, max_connections: int, max_keepalive: int) -> Any:
+        from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient
+
+        # httpx.Limits, taken from openai so we don't import httpx ourselves
+        limits = type(DEFAULT_CONNECTION_LIMITS)(
+            max_connections=max_connections or None,
+            max_keepalive_connections=max_keepalive or None,
+            keepalive_expiry=KEEPALIVE_EXPIRY_S,
+        )
+        if http2:
+            try:
+                return DefaultHttpxClient(limits=limits, http2=True)
+            except ImportError:  # the h2 package (httpx[http2]) isn't installed
+                if not self._warned_http2:
+                    self._warned_http2 = True
+                    print("http2=true needs `pip install httpx[http2]`; using HTTP/1.1.", file=sys.stderr)
+        return DefaultHttpxClient(limits=limits)
+
+    def release(self, key: tuple) -> None:
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                return
+            pool.leases -= 1
+            if pool.leases > 0:
+                return
+            del self._pools[key]
+        pool.http_client.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pools = list(self._pools.items())
+            out = {"hits": self.hits, "misses": self.misses, "pools": []}
+        for key, pool in pools:
+            scheme, host, port, http2, _, _ = key
+            # best effort: httpcore's pool isn't public API
+            conns = getattr(getattr(getattr(pool.http_client, "_transport", None), "_pool", None), "connections", None)
+            out["pools"].append({
+                "origin": f"{scheme}://{host}" + (f":{port}" if port else ""),
+                "http2": http2,
+                "leases": pool.leases,
+                "connections": len(conns) if conns is not None else None,
+            })
+        return out
+
+
+POOL = TransportPool()
+
+_pooled_class: Optional[type] = None
+
+
+def _pooled_openai_class() -> type:
+    global _pooled_class
+    if _pooled_class is None:
+        from openai import OpenAI
+
+        class PooledOpenAI(OpenAI):
+            """OpenAI client on a shared pool; close() returns the lease instead of closing the pool."""
+
+            _pool_key: Optional[tuple] = None
+
+            def close(self) -> None:
+                key, self._pool_key = self._pool_key, None
+                if key is not None:
+                    POOL.release(key)
+
+        _pooled_class = PooledOpenAI
+    return _pooled_class
+
+
+def pooled_openai(cfg, *, base_url: Optional[str] = None, **kwargs) -> Any:
+    """OpenAI(base_url=..., **kwargs) using the shared pool for its origin."""
+    key, http_client = POOL.acquire(
+        base_url or OPENAI_ORIGIN,
+        http2=getattr(cfg, "http2", False),
+        max_connections=getattr(cfg, "pool_connections", DEFAULT_POOL_CONNECTIONS),
+        max_keepalive=getattr(cfg, "pool_keepalive", DEFAULT_POOL_KEEPALIVE),
+    )
+    try:
+        client = _pooled_openai_class()(base_url=base_url, http_client=http_client, **kwargs)
+    except BaseException:
+        POOL.release(key)
+        raise
+    client._pool_key = key
+    return client
@@ -0,0 +1,266 @@
+"""Encoder auto-tuning (`/tune target_speed=2x|max_size=700M`).
+
+The generated command's -preset/-threads (and optionally -tune) are varied
+over a small grid. Every variant encodes the same short window from the middle
+of the input, several at once as long as their thread counts fit on the
+machine. Variants that miss the speed or size target are dropped. Of the rest,
+the best quality wins: PSNR/SSIM against the source when asked for (ffmpeg's
+own filters), otherwise the slowest preset. On a tie the variant with fewer
+threads wins, which leaves cores for other jobs. The winner is written back into
+the command. Variants run side by side, so only commands whose one output can be
+redirected into a per-variant temp dir are tuned (see estimate.check_command).
+"""
+from __future__ import annotations
+
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .estimate import DEFAULT_SAMPLE_S, _fmt_bytes, _input_duration, check_command, run_sample, sample_argv
+from .progress import input_paths
+
+# presets per encoder, fastest first (so a higher index means better compression)
+PRESETS: dict[str, tuple[str, ...]] = {
+    "libx264": ("veryfast", "faster", "fast", "medium", "slow", "slower"),
+    "libx265": ("veryfast", "faster", "fast", "medium", "slow", "slower"),
+    "libsvtav1": ("12", "10", "8", "6", "4"),
+    "h264_nvenc": ("p1", "p3", "p5", "p7"),
+    "hevc_nvenc": ("p1", "p3", "p5", "p7"),
+    "av1_nvenc": ("p1", "p3", "p5", "p7"),
+    "h264_qsv": ("veryfast", "fast", "medium", "slow"),
+    "hevc_qsv": ("veryfast", "fast", "medium", "slow"),
+}
+# encoders where -threads means nothing
+HARDWARE_SUFFIXES = ("_nvenc", "_qsv", "_vaapi", "_videotoolbox", "_amf")
+
+_VCODEC_OPTS = {"-c:v", "-codec:v", "-vcodec", "-c", "-codec"}
+# options that change the picture, which makes PSNR/SSIM against the source meaningless
+_REFRAMING = {"-vf", "-filter:v", "-filter_complex", "-lavfi", "-s", "-r", "-aspect"}
+_SIZE_UNITS = {"": 1, "b": 1, "k": 1e3, "kb": 1e3, "m": 1e6, "mb": 1e6, "g": 1e9, "gb": 1e9,
+               "kib": 1024, "mib": 1024**2, "gib": 1024**3}
+
+
+@dataclass
+class Variant:
+    preset: str
+    rank: int  # index in the encoder's preset list
+    threads: Optional[int]  # None: leave it to the encoder
+    tune: Optional[str] = None
+    speed: Optional[float] = None
+    size_bytes: Optional[float] = None
+    quality: Optional[float] = None
+    error: Optional[str] = None
+
+    def label(self) -> str:
+        parts = [f"preset {self.preset}", f"threads {self.threads or 'auto'}"]
+        if self.tune:
+            parts.append(f"tune {self.tune}")
+        return ", ".join(parts)
+
+
+def parse_speed(value: str) -> float:
+    """2, 2x, 1.5X -> speed factor."""
+    try:
+        speed = float(value.strip().rstrip("xX"))
+    except ValueError:
+        raise ValueError(f"Bad speed: {value} (e.g. target_speed=2x)") from None
+    if speed <= 0:
+        raise ValueError("target_speed must be positive")
+    return speed
+
+
+def parse_size(value: str) -> float:
+    """700M, 1.5G, 800MiB, 123456 -> bytes (K/M/G are decimal, KiB/MiB/GiB binary)."""
+    m = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*", value)
+    unit = _SIZE_UNITS.get(m.group(2).lower()) if m else None
+    try:
+        if unit is None:
+            raise ValueError
+        return float(m.group(1)) * unit  # type: ignore[union-attr]
+    except ValueError:
+        raise ValueError(f"Bad size: {value} (e.g. max_size=700M)") from None
+
+
+def video_encoder(argv: list[str]) -> Optional[str]:
+    """The output's video encoder (last -c:v/-vcodec/-c after the last input wins)."""
+    last_input = max(i for i, tok in enumerate(argv) if tok == "-i")
+    encoder = None
+    for i in range(last_input + 2, len(argv) - 1):
+        if argv[i] in _VCODEC_OPTS:
+            encoder = argv[i + 1]
+    return encoder
+
+
+def set_output_option(argv: list[str], opt: str, value: Optional[str]) -> list[str]:
+    """argv with output option opt set to value (replaced in place, or added before the output)."""
+    argv = list(argv)
+    last_input = max(i for i, tok in enumerate(argv) if tok == "-i")
+    names = {opt, opt + ":v"}
+    for i in range(last_input + 2, len(argv) - 1):
+        if argv[i] in names:
+            if value is None:
+                del argv[i:i + 2]
+            else:
+                argv[i + 1] = value
+            return argv
+    if value is not None:
+        argv[-1:-1] = [opt, value]
+    return argv
+
+
+def variant_argv(argv: list[str], v: Variant) -> list[str]:
+    argv = set_output_option(argv, "-preset", v.preset)
+    argv = set_output_option(argv, "-threads", str(v.threads) if v.threads else None)
+    if v.tune:
+        argv = set_output_option(argv, "-tune", v.tune)
+    return argv
+
+
+def grid(encoder: str, tunes: list[str]) -> list[Variant]:
+    presets = PRESETS[encoder]
+    ncpu = os.cpu_count() or 1
+    if encoder.endswith(HARDWARE_SUFFIXES):
+        threads: list[Optional[int]] = [None]
+    else:
+        threads = sorted({ncpu, max(1, ncpu // 2), max(1, ncpu // 4)}, reverse=True)
+    return [Variant(p, rank, t, tune) for rank, p in enumerate(presets) for t in threads
+            for tune in (tunes or [None])]
+
+
+def batches(variants: list[Variant], ncpu: int) -> list[list[Variant]]:
+    """Groups whose thread counts fit on ncpu cores together (auto-threaded variants run alone)."""
+    out: list[list[Variant]] = []
+    free: list[int] = []
+    for v in sorted(variants, key=lambda v: -(v.threads or ncpu)):
+        need = v.threads or ncpu
+        for k, room in enumerate(free):
+            if need <= room:
+                out[k].append(v)
+                free[k] -= need
+                break
+        else:
+            out.append([v])
+            free.append(ncpu - need)
+    return out
+
+
+def measure_quality(output: Path, source_argv: list[str], metric: str) -> Optional[float]:
+    """PSNR (dB) or SSIM of output against the same window of the source."""
+    cmd = [source_argv[0], "-nostdin", "-hide_banner", "-nostats", "-i", str(output), *source_argv[1:],
+           "-lavfi", f"[0:v][1:v]scale2ref=flags=bicubic[d][r];[d][r]{metric}", "-f", "null", "-"]
+    proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True, errors="replace")
+    pattern = r"PSNR .*?average:([\d.]+|inf)" if metric == "psnr" else r"SSIM .*?All:([\d.]+)"
+    m = re.search(pattern, proc.stderr)
+    if proc.returncode != 0 or m is None:
+        return None
+    return 100.0 if m.group(1) == "inf" else float(m.group(1))
+
+
+def tune(
+    command: str,
+    *,
+    target_speed: Optional[float] = None,
+    max_size: Optional[float] = None,
+    quality: Optional[str] = None,
+    tunes: list[str] | None = None,
+    length: float = DEFAULT_SAMPLE_S,
+    probe_index=None,
+) -> Optional[str]:
+    """Benchmark preset/thread variants of command and return it rewritten with the best one.
+
+    Prints a table of the variants; returns None (after saying why) when nothing
+    could be measured or no variant met the targets.
+    """
+    try:
+        argv = check_command(command)
+    except ValueError as e:
+        print(f"Cannot tune: {e}", file=sys.stderr)
+        return None
+    encoder = video_encoder(argv)
+    if encoder is None or encoder == "copy":
+        print("Cannot tune: the command needs a video encoder (-c:v ...)", file=sys.stderr)
+        return None
+    if encoder not in PRESETS:
+        print(f"Cannot tune: no preset grid for {encoder} (known: {', '.join(PRESETS)})", file=sys.stderr)
+        return None
+    if quality and any(tok in _REFRAMING for tok in argv):
+        print(f"Skipping {quality.upper()}: the command filters or rescales the video.", file=sys.stderr)
+        quality = None
+
+    duration = _input_duration(argv, probe_index)
+    length = float(max(1, length))
+    start = max(0.0, (duration or 0.0) / 2 - length / 2)
+    source = [argv[0]]
+    for p in input_paths(argv)[:1]:
+        source += ["-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", p]
+
+    variants = grid(encoder, tunes or [])
+    ncpu = os.cpu_count() or 1
+    print(f"Tuning {encoder}: {len(variants)} variants on a {length:.0f}s sample...")
+
+    tmp = Path(tempfile.mkdtemp(prefix="wtff-tune-"))
+
+    def run(k: int, v: Variant) -> None:
+        outdir = tmp / f"v{k}"
+        outdir.mkdir()
+        rc, wall, _, state, stderr = run_sample(sample_argv(variant_argv(argv, v), start, length, outdir))
+        if rc != 0:
+            v.error = stderr[-1] if stderr else f"rc {rc}"
+            return
+        media_s = state.out_time or length
+        size = sum(p.stat().st_size for p in outdir.rglob("*") if p.is_file())
+        v.speed = media_s / wall if wall > 0 else None
+        if duration:
+            v.size_bytes = size / media_s * duration
+        if quality:
+            out = next((p for p in outdir.rglob("*") if p.is_file()), None)
+            v.quality = measure_quality(out, source, quality) if out else None
+
+    try:
+        for batch in batches(variants, ncpu):
+            with ThreadPoolExecutor(max_workers=len(batch), thread_name_prefix="wtff-tune") as pool:
+                for fut in [pool.submit(run, variants.index(v), v) for v in batch]:
+                    fut.result()
+    except KeyboardInterrupt:
+        print("Tuning cancelled.", file=sys.stderr)
+        return None
+    except OSError as e:
+        print(f"Cannot tune: {e}", file=sys.stderr)
+        return None
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def meets(v: Variant) -> bool:
+        if v.error or v.speed is None:
+            return False
+        if target_speed is not None and v.speed < target_speed:
+            return False
+        return max_size is None or (v.size_bytes is not None and v.size_bytes <= max_size)
+
+    ok = [v for v in variants if meets(v)]
+    best = max(ok, key=lambda v: (v.quality or 0.0, v.rank, -(v.threads or ncpu), v.speed or 0.0), default=None)
+    print("(* chosen, - misses the target)")
+    for v in variants:
+        if v.error:
+            cols = f"failed: {v.error}"
+        else:
+            cols = f"speed {v.speed:.2f}x" if v.speed else "speed ?"
+            if v.size_bytes is not None:
+                cols += f", ~{_fmt_bytes(v.size_bytes)}"
+            if v.quality is not None:
+                cols += f", {quality.upper()} {v.quality:.4g}"  # type: ignore[union-attr]
+        mark = "*" if v is best else ("-" if v not in ok else " ")
+        print(f" {mark} {v.label():<40} {cols}")
+    if best is None:
+        print("No variant met the target; try a faster encoder, a lower resolution or a looser target.",
+              file=sys.stderr)
+        return None
+    return shlex.join(variant_argv(argv, best))
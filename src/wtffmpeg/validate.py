@@ -0,0 +1,287 @@
+"""Offline validation of generated ffmpeg commands.
+
+Options, encoders, muxers and filters are checked against an index scraped
+from the local ffmpeg's own help output (`-h full`, `-encoders`, `-decoders`,
+`-muxers`, `-demuxers`, `-filters`). The index is built once per ffmpeg binary
+and cached on disk, keyed by the binary's path and mtime; after that a check is
+a handful of set lookups.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .ffcmd import shell_split
+
+DEFAULT_INDEX_PATH = Path.home() / ".wtffmpeg" / "ffmpeg-index.json"
+INDEX_VERSION = 1
+
+CODEC_OPTIONS = {"c", "codec", "vcodec", "acodec", "scodec", "dcodec"}
+FORMAT_OPTIONS = {"f"}
+FILTER_OPTIONS = {"vf", "af", "filter", "filter_complex", "lavfi"}
+
+# Always-present core options, in case a build's help output omits some of them.
+CORE_OPTIONS = {
+    "i": True, "y": False, "n": False, "f": True, "c": True, "codec": True, "map": True,
+    "t": True, "ss": True, "sseof": True, "to": True, "vf": True, "af": True,
+    "filter_complex": True, "b": True, "r": True, "s": True, "an": False, "vn": False,
+    "sn": False, "dn": False, "hide_banner": False, "nostdin": False, "loglevel": True, "v": True,
+}
+
+_MAIN_OPT_RE = re.compile(r"^-(\S+?)(?:\[\S*\])?(?: (\S+))?\s{2,}\S")
+_AV_OPT_RE = re.compile(r"^\s+-(\S+)\s+<\w+>")
+_FILTER_RE = re.compile(r"^\s[T.][S.][C.]?\s+(\S+)\s+\S*->\S*")
+
+
+@dataclass
+class FFmpegIndex:
+    key: str
+    # option name -> takes an argument
+    options: dict[str, bool] = field(default_factory=dict)
+    encoders: set[str] = field(default_factory=set)
+    decoders: set[str] = field(default_factory=set)
+    muxers: set[str] = field(default_factory=set)
+    demuxers: set[str] = field(default_factory=set)
+    filters: set[str] = field(default_factory=set)
+
+    def to_json(self) -> dict:
+        return {
+            "version": INDEX_VERSION,
+            "key": self.key,
+            "options": self.options,
+            "encoders": sorted(self.encoders),
+            "decoders": sorted(self.decoders),
+            "muxers": sorted(self.muxers),
+            "demuxers": sorted(self.demuxers),
+            "filters": sorted(self.filters),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "FFmpegIndex":
+        return cls(
+            key=data["key"],
+            options=dict(data["options"]),
+            encoders=set(data["encoders"]),
+            decoders=set(data["decoders"]),
+            muxers=set(data["muxers"]),
+            demuxers=set(data["demuxers"]),
+            filters=set(data["filters"]),
+        )
+
+
+def _run(ffmpeg: str, *args: str) -> str:
+    proc = subprocess.run(
+        [ffmpeg, "-hide_banner", *args], capture_output=True, text=True, errors="replace", timeout=30
+    )
+    return proc.stdout
+
+
+def parse_help_options(text: str) -> dict[str, bool]:
+    """Map option name -> takes-argument from `ffmpeg -h full`."""
+    opts: dict[str, bool] = dict(CORE_OPTIONS)
+    for line in text.splitlines():
+        m = _MAIN_OPT_RE.match(line)
+        if m:
+            opts[m.group(1)] = m.group(2) is not None
+            continue
+        m = _AV_OPT_RE.match(line)
+        if m:
+            # private/AVOptions (codec, format, filter options) always take a value
+            opts.setdefault(m.group(1), True)
+    return opts
+
+
+def parse_listing(text: str) -> set[str]:
+    """Names from `-encoders` / `-decoders` / `-muxers` / `-demuxers` (rows after the ' --' rule)."""
+    names: set[str] = set()
+    started = False
+    for line in text.splitlines():
+        if not started:
+            started = line.strip().startswith("--")
+            continue
+        parts = line.split(None, 2)
+        if len(parts) >= 2:
+            names.update(n for n in parts[1].split(",") if n)
+    return names
+
+
+def parse_filters(text: str) -> set[str]:
+    names: set[str] = set()
+    for line in text.splitlines():
+        m = _FILTER_RE.match(line)
+        if m:
+            names.add(m.group(1))
+    return names
+
+
+def index_key(ffmpeg: str) -> str:
+    st = os.stat(ffmpeg)
+    return f"{os.path.realpath(ffmpeg)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def build_index(ffmpeg: str) -> FFmpegIndex:
+    return FFmpegIndex(
+        key=index_key(ffmpeg),
+        options=parse_help_options(_run(ffmpeg, "-h", "full")),
+        encoders=parse_listing(_run(ffmpeg, "-encoders")),
+        decoders=parse_listing(_run(ffmpeg, "-decoders")),
+        muxers=parse_listing(_run(ffmpeg, "-muxers")),
+        demuxers=parse_listing(_run(ffmpeg, "-demuxers")),
+        filters=parse_filters(_run(ffmpeg, "-filters")),
+    )
+
+
+def load_index(ffmpeg: str, path: Path | None = None) -> FFmpegIndex:
+    """Load the cached index for this ffmpeg binary, (re)building it if stale."""
+    path = Path(path or DEFAULT_INDEX_PATH).expanduser()
+    key = index_key(ffmpeg)
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") == INDEX_VERSION and data.get("key") == key:
+            return FFmpegIndex.from_json(data)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = build_index(ffmpeg)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(index.to_json(), separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, path)
+    return index
+
+
+def filter_names(graph: str) -> list[str]:
+    """Filter names used in a filtergraph string (labels, args and quoting skipped)."""
+    names: list[str] = []
+    buf: list[str] = []
+    quote = None
+    depth = 0
+    i = 0
+
+    def flush():
+        chain = "".join(buf).strip()
+        buf.clear()
+        chain = re.sub(r"^(\s*\[[^\]]*\])+", "", chain).strip()
+        name = re.split(r"[=@\[\s]", chain, maxsplit=1)[0] if chain else ""
+        if name:
+            names.append(name)
+
+    while i < len(graph):
+        ch = graph[i]
+        if ch == "\\":
+            buf.append(graph[i:i + 2])
+            i += 2
+            continue
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "[":
+            depth += 1
+        elif ch == "]":
+            depth -= 1
+        elif ch in ",;" and depth <= 0:
+            flush()
+            i += 1
+            continue
+        buf.append(ch)
+        i += 1
+    flush()
+    return names
+
+
+def _is_number(tok: str) -> bool:
+    try:
+        float(tok)
+        return True
+    except ValueError:
+        return False
+
+
+def validate_command(command: str, index: FFmpegIndex) -> list[str]:
+    """Return human-readable problems with command; empty if it looks valid."""
+    argv, _ = shell_split(command)
+    if not argv or os.path.basename(argv[0]) != "ffmpeg":
+        return []
+
+    errors: list[str] = []
+    i = 1
+    while i < len(argv):
+        tok = argv[i]
+        i += 1
+        if not tok.startswith("-") or tok == "-" or _is_number(tok):
+            continue  # output file / stray value
+
+        name = tok[1:].split(":", 1)[0]
+        if name in index.options:
+            takes_arg = index.options[name]
+        elif name.startswith("no") and index.options.get(name[2:]) is False:
+            takes_arg = False
+        else:
+            errors.append(f"Unrecognized option '{tok}'.")
+            takes_arg = i < len(argv) and not argv[i].startswith("-")
+
+        if not takes_arg:
+            continue
+        if i >= len(argv):
+            errors.append(f"Missing argument for option '{tok}'.")
+            break
+        value = argv[i]
+        i += 1
+
+        if name in CODEC_OPTIONS:
+            if value != "copy" and value not in index.encoders and value not in index.decoders:
+                errors.append(f"Unknown encoder '{value}' (for {tok}).")
+        elif name in FORMAT_OPTIONS:
+            if value not in index.muxers and value not in index.demuxers:
+                errors.append(f"Unknown format '{value}' (for {tok}).")
+        elif name in FILTER_OPTIONS:
+            for f in filter_names(value):
+                if f not in index.filters:
+                    errors.append(f"No such filter: '{f}' (in {tok}).")
+    return errors
+
+
+class CommandValidator:
+    """Callable command -> list of problems, backed by a lazily loaded FFmpegIndex."""
+
+    def __init__(self, ffmpeg: str, index_path: Path | None = None):
+        self.ffmpeg = ffmpeg
+        self.index_path = index_path
+        self._index: Optional[FFmpegIndex] = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self) -> Optional[FFmpegIndex]:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    try:
+                        self._index = load_index(self.ffmpeg, self.index_path)
+                    except (OSError, subprocess.SubprocessError):
+                        return None
+        return self._index
+
+    def __call__(self, command: str) -> list[str]:
+        index = self.index
+        if index is None:
+            return []
+        return validate_command(command, index)
+
+
+def open_validator(cfg) -> Optional[CommandValidator]:
+    """Return a CommandValidator, or None when disabled or ffmpeg isn't installed."""
+    if not getattr(cfg, "validate", True):
+        return None
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    return CommandValidator(ffmpeg)
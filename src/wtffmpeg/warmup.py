@@ -0,0 +1,66 @@
+"""Background model warm-up for the REPL.
+
+While the user is typing their first prompt, open the connection and send a
+one-token request so a local server (e.g. Ollama) loads the model. The first
+real answer then arrives at steady-state latency.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Optional
+
+
+class Warmup:
+    """Runs at most one warm-up at a time; a newer start() supersedes an older one."""
+
+    def __init__(self):
+        self.status = "off"
+        self.elapsed_s: Optional[float] = None
+        self.error: Optional[str] = None
+        self._gen = 0
+        self._lock = threading.Lock()
+
+    def start(self, client: Any, model: str, *, provider: str = "compat") -> None:
+        with self._lock:
+            self._gen += 1
+            gen = self._gen
+            self.status = "warming"
+            self.elapsed_s = None
+            self.error = None
+        t = threading.Thread(
+            target=self._run, args=(gen, client, model, provider), name="wtff-warmup", daemon=True
+        )
+        t.start()
+
+    def _run(self, gen: int, client: Any, model: str, provider: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            # TCP/TLS connect + auth check, no tokens
+            client.models.list()
+            # On hosted OpenAI a completion costs money and the model is always resident.
+            if provider != "openai":
+                from .hedge import unhedged
+
+                # past hedging: the model load would otherwise become a first-chunk sample and inflate the p95
+                unhedged(client).chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": "ok"}],
+                    temperature=0.0,
+                    max_tokens=1,
+                )
+        except Exception as e:
+            with self._lock:
+                if gen == self._gen:
+                    self.status = "failed"
+                    self.error = f"{type(e).__name__}: {e}"
+            return
+        with self._lock:
+            if gen == self._gen:
+                self.status = "ready"
+                self.elapsed_s = time.perf_counter() - t0
+
+    def describe(self) -> str:
+        if self.status == "ready" and self.elapsed_s is not None:
+            return f"ready ({self.elapsed_s:.1f}s)"
+        return self.status
@@ -0,0 +1,27 @@
+from wtffmpeg.llm import CommandExtractor, extract_ffmpeg_command
+
+
+def stream(reply: str, step: int = 3) -> str:
+    """Feed reply in small deltas, as a streamed response arrives, until the extractor is done."""
+    extractor = CommandExtractor()
+    for i in range(0, len(reply), step):
+        if extractor.feed(reply[i:i + step]):
+            break
+    return extract_ffmpeg_command(extractor.text)
+
+
+def test_prose_starting_with_ffmpeg_does_not_end_the_stream():
+    reply = "ffmpeg can do this easily:\n```bash\nffmpeg -i a.mp4 -vn b.mp3\n```"
+    assert extract_ffmpeg_command(reply) == "ffmpeg -i a.mp4 -vn b.mp3"
+    assert stream(reply) == "ffmpeg -i a.mp4 -vn b.mp3"
+
+
+def test_bare_command_line_after_prose():
+    reply = "ffmpeg can do it:\nffmpeg -y -i in.mkv out.mp4\nThat's it."
+    assert extract_ffmpeg_command(reply) == "ffmpeg -y -i in.mkv out.mp4"
+    assert stream(reply) == "ffmpeg -y -i in.mkv out.mp4"
+
+
+def test_backslash_continuation_is_kept():
+    reply = "ffmpeg \\\n  -i in.mkv \\\n  out.mp4\n"
+    assert stream(reply) == "ffmpeg \\\n  -i in.mkv \\\n  out.mp4"